@@ -6,22 +6,43 @@ Author: Christian & Team DataLaw
 
 import streamlit as st
 import os
-import tempfile
 import json
-from datetime import datetime
-import vertexai
+import time
 from pathlib import Path
 
 # Importaciones del sistema de análisis
-from contract_processor import ContractProcessor
+from cache import directorio_cache_predeterminado
+from jobs import GestorTrabajos
+from metricas import metricas_a_prometheus
 from utils import (
     configurar_entorno_vertexai,
-    generar_reporte_markdown,
-    crear_zip_resultados
+    generar_zip_resultados,
+    iterar_json
 )
-import json
-from google.oauth2 import service_account
         
+# Directorio de caches persistentes (hallazgos LLM, etc.)
+CACHE_DIR = os.getenv(
+    "CONTRACTIA_CACHE_DIR",
+    directorio_cache_predeterminado()
+)
+
+# Segundos entre consultas de avance de un trabajo en segundo plano
+INTERVALO_CONSULTA_SEGUNDOS = 2
+
+# Cuota de Vertex AI para el LLM (0 = sin límite); se reparte entre los
+# procesos trabajadores, cada uno con su planificador
+CONTRACTIA_WORKERS = int(os.getenv("CONTRACTIA_WORKERS", "2"))
+LIMITES_LLM = {
+    'rpm': float(os.getenv("CONTRACTIA_LLM_RPM", "0")) / CONTRACTIA_WORKERS,
+    'tpm': float(os.getenv("CONTRACTIA_LLM_TPM", "0")) / CONTRACTIA_WORKERS
+}
+
+# Tokens máximos por prompt al agrupar secciones cortas
+PRESUPUESTO_TOKENS_LOTE = 6000
+
+# Ventana (en tokens) para analizar por partes capítulos y anexos largos
+TOKENS_VENTANA = 1000
+
 # Configuración de la página
 st.set_page_config(
     page_title="CONTRACTIA AI - Auditoría de Contratos APP",
@@ -56,6 +77,17 @@ if 'procesamiento_completo' not in st.session_state:
     st.session_state.procesamiento_completo = False
 if 'resultados' not in st.session_state:
     st.session_state.resultados = None
+if 'trabajo_id' not in st.session_state:
+    st.session_state.trabajo_id = None
+
+
+@st.cache_resource
+def obtener_gestor_trabajos() -> GestorTrabajos:
+    """Ejecutor de trabajos compartido por todas las sesiones del servidor"""
+    return GestorTrabajos(
+        str(Path(CACHE_DIR) / "trabajos"),
+        max_workers=CONTRACTIA_WORKERS
+    )
 
 def main():
     # Header
@@ -86,6 +118,23 @@ def main():
         # Toggle para características avanzadas
         enable_rag = st.checkbox("Habilitar RAG avanzado", value=False)
         enable_chat = st.checkbox("Habilitar Q&A interactivo", value=False)
+        reauditoria_incremental = st.checkbox(
+            "Reauditoría incremental",
+            value=True,
+            help="Reutiliza los hallazgos de secciones sin cambios respecto a la versión anterior del mismo contrato"
+        )
+        max_concurrencia = st.slider(
+            "Secciones analizadas en paralelo",
+            min_value=1,
+            max_value=16,
+            value=4,
+            help="Número de llamadas simultáneas al LLM durante la auditoría"
+        )
+        agrupar_secciones = st.checkbox(
+            "Agrupar secciones cortas por llamada",
+            value=True,
+            help="Envía varias cláusulas breves en un mismo prompt para reducir llamadas a Vertex AI"
+        )
         
         st.markdown("---")
         st.markdown("**Desarrollado por:** Team DataLaw - UTEC")
@@ -123,10 +172,22 @@ def main():
             
             st.markdown('</div>', unsafe_allow_html=True)
             
+            # Avance del análisis en segundo plano
+            if st.session_state.trabajo_id:
+                mostrar_progreso_trabajo()
+            
             # Botón de procesamiento
-            if contrato_file is not None:
+            elif contrato_file is not None:
                 if st.button("🚀 Iniciar Análisis", type="primary", use_container_width=True):
-                    procesar_contrato(contrato_file, knowledge_files, enable_rag, enable_chat)
+                    procesar_contrato(
+                        contrato_file,
+                        knowledge_files,
+                        enable_rag,
+                        enable_chat,
+                        max_concurrencia,
+                        agrupar_secciones,
+                        reauditoria_incremental
+                    )
         
         with col2:
             st.markdown("### 📋 Información del Análisis")
@@ -153,12 +214,20 @@ def main():
     with tab3:
         mostrar_documentacion()
 
-def procesar_contrato(contrato_file, knowledge_files, enable_rag, enable_chat):
+def procesar_contrato(
+    contrato_file,
+    knowledge_files,
+    enable_rag,
+    enable_chat,
+    max_concurrencia=1,
+    agrupar_secciones=False,
+    reauditoria_incremental=False
+):
     """
-    Procesa el contrato subido usando el sistema de análisis
+    Encola el análisis del contrato subido en el ejecutor de trabajos
     """
     try:
-        # Configurar Vertex AI y obtener las credenciales
+        # Validar credenciales antes de encolar
         with st.spinner("🔧 Configurando Vertex AI..."):
             
             # --- INICIO DE LÓGICA DE CREDENCIALES CORREGIDA ---
@@ -173,123 +242,120 @@ def procesar_contrato(contrato_file, knowledge_files, enable_rag, enable_chat):
             except json.JSONDecodeError as e:
                 st.error(f"❌ Error al decodificar el secreto JSON. Revise el formato en Streamlit Secrets. Error: {e}")
                 return
-
-            # 1. Crea el objeto de credenciales directamente del diccionario
-            credentials = service_account.Credentials.from_service_account_info(
-                credentials_info,
-                scopes=['https://www.googleapis.com/auth/cloud-platform']
-            )
-            
-            # 2. Inicializa vertexai globalmente
-            vertexai.init(
-                project=credentials_info.get("project_id", "utec-478003"),
-                location="us-central1", # **VERIFICA** que tu región sea 'us-central1'
-                credentials=credentials
-            )
             # --- FIN DE LÓGICA DE CREDENCIALES CORREGIDA ---
         
-        # Crear directorio temporal
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            
-            # Guardar archivo del contrato
-            contrato_path = temp_path / contrato_file.name
-            with open(contrato_path, 'wb') as f:
-                f.write(contrato_file.read())
-            
-            # Guardar archivos de conocimiento si existen
-            knowledge_dir = temp_path / "knowledge_base"
-            knowledge_dir.mkdir(exist_ok=True)
-            
-            if knowledge_files:
-                for kf in knowledge_files:
-                    kf_path = knowledge_dir / kf.name
-                    with open(kf_path, 'wb') as f:
-                        f.write(kf.read())
-            
-            # Inicializar procesador
-            # MODIFICACIÓN CRUCIAL: Pasar el objeto 'credentials'
-            processor = ContractProcessor(
-                credentials=credentials, 
-                enable_llm=True,
-                enable_rag=enable_rag,
-                enable_chat=enable_chat
-            )
-            
-            # Crear barra de progreso
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            # Paso 1: Cargar documentos de conocimiento
-            status_text.text("📚 Cargando base de conocimiento...")
-            progress_bar.progress(10)
-            vectorstore_conocimiento = processor.cargar_conocimiento(str(knowledge_dir))
-            
-            # Paso 2: Procesar contrato
-            status_text.text("📄 Procesando contrato...")
-            progress_bar.progress(25)
-            docs_contrato, texto_contrato = processor.procesar_contrato(str(contrato_path))
-            
-            if not docs_contrato:
-                st.error("❌ No se pudo procesar el contrato.")
-                return
-            
-            # Paso 3: Segmentar y extraer índices
-            status_text.text("🔍 Extrayendo estructura del contrato...")
-            progress_bar.progress(40)
-            secciones = processor.segmentar_contrato(texto_contrato)
-            
-            status_text.text("📑 Construyendo índices...")
-            progress_bar.progress(55)
-            indices = processor.construir_indices(secciones)
-            
-            # Paso 4: Auditoría
-            status_text.text("🔎 Auditando referencias y coherencia...")
-            progress_bar.progress(70)
-            resultados_auditoria = processor.auditar_contrato(
-                secciones=secciones,
-                indices=indices,
-                vectorstore_conocimiento=vectorstore_conocimiento
-            )
-            
-            # Paso 5: Generar reportes
-            status_text.text("📊 Generando reportes...")
-            progress_bar.progress(85)
-            reporte_md = generar_reporte_markdown(resultados_auditoria)
-            
-            # Paso 6: Guardar resultados
-            status_text.text("💾 Guardando resultados...")
-            progress_bar.progress(95)
-            
-            # Guardar en session state
-            st.session_state.resultados = {
-                'reporte': reporte_md,
-                'auditoria': resultados_auditoria,
-                'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S"),
-                'nombre_contrato': contrato_file.name
-            }
-            st.session_state.procesamiento_completo = True
-            
-            # Completar
-            progress_bar.progress(100)
-            status_text.text("✅ ¡Análisis completado!")
-            
-            st.success(f"""
-            ✅ **Análisis Completado Exitosamente**
-            
-            - Secciones analizadas: {len(secciones)}
-            - Referencias validadas: {resultados_auditoria.get('total_referencias', 0)}
-            - Errores detectados: {len(resultados_auditoria.get('hallazgos_consistencia', []))}
-            
-            Ve a la pestaña **Resultados** para ver el informe completo.
-            """)
-            
-            # Auto-navegar a resultados
-            st.rerun()
+        # El análisis corre en un proceso trabajador: sobrevive a reruns y
+        # desconexiones del navegador
+        trabajo_id = obtener_gestor_trabajos().enviar(
+            nombre_contrato=contrato_file.name,
+            contrato_bytes=contrato_file.getvalue(),
+            archivos_conocimiento=[(kf.name, kf.getvalue()) for kf in (knowledge_files or [])],
+            opciones={
+                'enable_llm': True,
+                'enable_rag': enable_rag,
+                'enable_chat': enable_chat,
+                'max_concurrencia': max_concurrencia,
+                'cache_dir': CACHE_DIR,
+                'presupuesto_tokens_lote': PRESUPUESTO_TOKENS_LOTE if agrupar_secciones else 0,
+                'tokens_ventana': TOKENS_VENTANA,
+                'limites_llm': LIMITES_LLM
+            },
+            credentials_info=credentials_info,
+            cache_dir=CACHE_DIR,
+            reauditoria=reauditoria_incremental
+        )
+        
+        st.session_state.trabajo_id = trabajo_id
+        st.rerun()
     
     except Exception as e:
         st.error(f"❌ Error durante el procesamiento: {str(e)}")
         st.exception(e)
+
+
+def mostrar_progreso_trabajo():
+    """
+    Muestra el avance del trabajo en curso y recoge sus resultados al terminar
+    """
+    trabajo_id = st.session_state.trabajo_id
+    estado = obtener_gestor_trabajos().estado(trabajo_id)
+    
+    if estado is None:
+        st.session_state.trabajo_id = None
+        st.error("❌ No se encontró el trabajo de análisis.")
+        return
+    
+    st.caption(f"Trabajo `{trabajo_id}` - {estado['nombre_contrato']}")
+    st.progress(estado['progreso'] or 0)
+    st.text(estado['mensaje'] or "")
+    
+    if estado['estado'] == 'error':
+        st.session_state.trabajo_id = None
+        st.error(f"❌ Error durante el procesamiento: {estado['error']}")
+        return
+    
+    if estado['estado'] == 'completado':
+        resultado = obtener_gestor_trabajos().resultado(trabajo_id)
+        st.session_state.trabajo_id = None
+        
+        # Guardar en session state
+        st.session_state.resultados = {
+            'trabajo_id': trabajo_id,
+            'reporte': resultado['reporte'],
+            'auditoria': resultado['auditoria'],
+            'timestamp': resultado['timestamp'],
+            'nombre_contrato': resultado['nombre_contrato']
+        }
+        st.session_state.procesamiento_completo = True
+        
+        resultados_auditoria = resultado['auditoria']
+        st.success(f"""
+        ✅ **Análisis Completado Exitosamente**
+        
+        - Secciones analizadas: {resultado['total_secciones']}
+        - Referencias validadas: {resultados_auditoria.get('total_referencias', 0)}
+        - Errores detectados: {len(resultados_auditoria.get('hallazgos_consistencia', []))}
+        
+        Ve a la pestaña **Resultados** para ver el informe completo.
+        """)
+        return
+    
+    # Seguir consultando mientras el trabajo avanza
+    time.sleep(INTERVALO_CONSULTA_SEGUNDOS)
+    st.rerun()
+
+@st.cache_resource(max_entries=16)
+def preparar_descargas(auditoria_id: str, _resultados: dict) -> dict:
+    """
+    Archivos de descarga de una auditoría, generados una sola vez por ID
+    
+    Streamlit vuelve a ejecutar la página en cada interacción; sin esta caché
+    la auditoría se serializaría de nuevo en cada rerun. El argumento
+    _resultados no se usa como clave (no se hashea).
+    
+    Args:
+        auditoria_id: ID del trabajo que produjo la auditoría
+        _resultados: Resultados guardados en session_state
+        
+    Returns:
+        Diccionario con el contenido en bytes de cada descarga
+    """
+    auditoria = _resultados['auditoria']
+    descargas = {
+        'json': "".join(iterar_json(auditoria)).encode('utf-8'),
+        'zip': generar_zip_resultados(
+            auditoria,
+            _resultados['timestamp'],
+            reporte_md=_resultados['reporte'],
+            por_seccion=True
+        )
+    }
+    if 'metricas' in auditoria:
+        descargas['metricas'] = metricas_a_prometheus(
+            auditoria['metricas'], {'contrato': _resultados['nombre_contrato']}
+        ).encode('utf-8')
+    return descargas
+
 def mostrar_resultados():
     """
     Muestra los resultados del análisis
@@ -366,7 +432,10 @@ def mostrar_resultados():
     with result_tab3:
         st.markdown("### Descargar Resultados")
         
-        col1, col2 = st.columns(2)
+        auditoria_id = resultados.get('trabajo_id') or f"{resultados['nombre_contrato']}_{resultados['timestamp']}"
+        descargas = preparar_descargas(auditoria_id, resultados)
+        
+        col1, col2, col3 = st.columns(3)
         
         with col1:
             # Descargar reporte Markdown
@@ -379,13 +448,30 @@ def mostrar_resultados():
         
         with col2:
             # Descargar resultados JSON
-            json_data = json.dumps(auditoria, indent=2, ensure_ascii=False)
             st.download_button(
                 label="📊 Descargar Datos (JSON)",
-                data=json_data,
+                data=descargas['json'],
                 file_name=f"auditoria_{resultados['timestamp']}.json",
                 mime="application/json"
             )
+        
+        with col3:
+            # Descargar todo (reporte, JSON y hallazgos por sección)
+            st.download_button(
+                label="🗜️ Descargar Todo (ZIP)",
+                data=descargas['zip'],
+                file_name=f"resultados_auditoria_{resultados['timestamp']}.zip",
+                mime="application/zip"
+            )
+        
+        # Métricas de rendimiento del análisis (tiempos por etapa, latencias y tokens del LLM)
+        if 'metricas' in descargas:
+            st.download_button(
+                label="📈 Descargar Métricas (Prometheus)",
+                data=descargas['metricas'],
+                file_name=f"metricas_{resultados['timestamp']}.prom",
+                mime="text/plain"
+            )
 
 def mostrar_documentacion():
     """
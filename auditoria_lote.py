@@ -0,0 +1,430 @@
+"""
+Auditoría por Lotes
+Auditoría de carteras de contratos desde la línea de comandos para CONTRACTIA AI
+
+Audita en paralelo todos los PDFs de un directorio (o de un manifiesto) contra
+una base de conocimiento compartida, con un límite global de llamadas
+simultáneas al LLM entre todos los procesos trabajadores.
+
+Uso:
+    python auditoria_lote.py contratos/ --conocimiento knowledge_base/ --salida resultados/
+    python auditoria_lote.py cartera.txt --conocimiento knowledge_base/ --workers 4 --max-llm 8
+    python auditoria_lote.py contratos/ --conocimiento knowledge_base/ --proveedor local \
+        --opciones-proveedor '{"latencia_llm": {"tipo": "lognormal", "media": 2.0, "desviacion": 1.0}}'
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from cache import directorio_cache_predeterminado
+from cache import hash_texto
+from contract_processor import ContractProcessor
+from jobs import ejecutar_analisis
+from metricas import metricas_a_prometheus
+from utils import cargar_revision, guardar_revision
+
+# Estado de cada proceso trabajador (asignado por _inicializar_trabajador)
+_credentials_info: Optional[Dict] = None
+_limitador_llm = None
+_procesador: Optional[ContractProcessor] = None
+
+
+def listar_contratos(origen: str) -> List[Path]:
+    """
+    Lista los contratos a auditar
+
+    Args:
+        origen: Directorio con PDFs, o manifiesto (.txt con una ruta por línea,
+            o .json con una lista de rutas); las rutas relativas se resuelven
+            respecto al manifiesto
+
+    Returns:
+        Rutas de los contratos, sin duplicados y en orden
+    """
+    origen_path = Path(origen)
+
+    if origen_path.is_dir():
+        return sorted(p for p in origen_path.iterdir() if p.is_file() and p.suffix.lower() == '.pdf')
+
+    texto = origen_path.read_text(encoding='utf-8')
+    if origen_path.suffix.lower() == '.json':
+        rutas = json.loads(texto)
+    else:
+        rutas = [linea.strip() for linea in texto.splitlines()]
+        rutas = [ruta for ruta in rutas if ruta and not ruta.startswith('#')]
+
+    contratos = []
+    for ruta in rutas:
+        contrato_path = Path(ruta)
+        if not contrato_path.is_absolute():
+            contrato_path = origen_path.parent / contrato_path
+        if contrato_path not in contratos:
+            contratos.append(contrato_path)
+    return contratos
+
+
+def nombres_salida(contratos: List[Path]) -> Dict[Path, str]:
+    """
+    Nombre base de los archivos de resultados de cada contrato
+
+    Es el nombre del PDF sin extensión; si varios contratos de directorios
+    distintos comparten ese nombre, se agrega un hash corto de su directorio
+    para que sus resultados no se sobrescriban.
+
+    Args:
+        contratos: Rutas de los contratos
+
+    Returns:
+        Nombre base por ruta
+    """
+    repeticiones = {}
+    for contrato in contratos:
+        repeticiones[contrato.stem.lower()] = repeticiones.get(contrato.stem.lower(), 0) + 1
+
+    nombres = {}
+    for contrato in contratos:
+        nombre = contrato.stem
+        if repeticiones[nombre.lower()] > 1:
+            nombre = f"{nombre}_{hash_texto(str(contrato.resolve().parent))[:8]}"
+        nombres[contrato] = nombre
+    return nombres
+
+
+def _inicializar_trabajador(credentials_info: Optional[Dict], limitador_llm):
+    """Guarda credenciales y semáforo global en el proceso trabajador"""
+    global _credentials_info, _limitador_llm
+    _credentials_info = credentials_info
+    _limitador_llm = limitador_llm
+
+
+def _requiere_vertexai(opciones: Dict) -> bool:
+    """Si la configuración usa los clientes reales de Vertex AI"""
+    return opciones.get('enable_llm', True) and opciones.get('proveedor', 'vertexai') == 'vertexai'
+
+
+def _obtener_procesador(opciones: Dict) -> ContractProcessor:
+    """Procesador del proceso trabajador, reutilizado entre contratos"""
+    global _procesador
+    if _procesador is None:
+        if _requiere_vertexai(opciones):
+            from clientes import obtener_procesador
+            _procesador = obtener_procesador(_credentials_info, **opciones)
+        else:
+            _procesador = ContractProcessor(**opciones)
+        if _limitador_llm is not None:
+            _procesador.limitador_llm = _limitador_llm
+    return _procesador
+
+
+def auditar_contrato_lote(
+    contrato_path: str,
+    knowledge_dir: str,
+    salida_dir: str,
+    opciones: Dict,
+    reauditoria: bool = False,
+    nombre_salida: Optional[str] = None
+) -> Dict:
+    """
+    Audita un contrato en el proceso trabajador y escribe sus resultados
+
+    Args:
+        contrato_path: Ruta al PDF del contrato
+        knowledge_dir: Directorio con documentos normativos
+        salida_dir: Directorio de resultados
+        opciones: Argumentos para ContractProcessor (sin credenciales)
+        reauditoria: Reutilizar hallazgos de la versión anterior
+        nombre_salida: Nombre base de los archivos de resultados (por
+            defecto el nombre del PDF sin extensión; ver nombres_salida)
+
+    Returns:
+        Fila del resumen JSONL del contrato
+    """
+    nombre_contrato = Path(contrato_path).name
+    inicio = time.perf_counter()
+    resumen = {'contrato': str(contrato_path), 'estado': 'completado', 'error': None}
+
+    try:
+        processor = _obtener_procesador(opciones)
+        cache_dir = opciones.get('cache_dir')
+
+        revision_previa = None
+        if reauditoria and cache_dir:
+            revision_previa = cargar_revision(nombre_contrato, cache_dir)
+
+        resultado = ejecutar_analisis(
+            processor,
+            contrato_path,
+            knowledge_dir,
+            revision_previa=revision_previa
+        )
+        auditoria = resultado['auditoria']
+
+        if cache_dir:
+            guardar_revision(auditoria['revision'], nombre_contrato, cache_dir)
+
+        # Resultados por contrato: auditoría en JSON, reporte en Markdown y métricas Prometheus
+        base = Path(salida_dir) / (nombre_salida or Path(contrato_path).stem)
+        json_path = base.with_suffix('.json')
+        md_path = base.with_suffix('.md')
+        json_path.write_text(json.dumps(auditoria, indent=2, ensure_ascii=False), encoding='utf-8')
+        md_path.write_text(resultado['reporte'], encoding='utf-8')
+        metricas_path = base.with_suffix('.prom')
+        metricas_path.write_text(
+            metricas_a_prometheus(auditoria['metricas'], {'contrato': nombre_contrato}),
+            encoding='utf-8'
+        )
+
+        resumen.update({
+            'total_secciones': resultado['total_secciones'],
+            'total_referencias': auditoria.get('total_referencias', 0),
+            'referencias_rotas': auditoria.get('referencias_rotas', 0),
+            'hallazgos': len(auditoria.get('hallazgos_consistencia', [])),
+            'secciones_con_error': auditoria.get('secciones_con_error', []),
+            'json': str(json_path),
+            'markdown': str(md_path),
+            'metricas': str(metricas_path),
+            'llm_llamadas': auditoria['metricas']['llm']['llamadas'],
+            'llm_reintentos': auditoria['metricas']['llm']['reintentos'],
+            'llm_tokens': auditoria['metricas']['llm']['tokens_prompt'] + auditoria['metricas']['llm']['tokens_respuesta']
+        })
+
+    except Exception as e:
+        print(f"❌ Error auditando {nombre_contrato}: {e}")
+        resumen.update({'estado': 'error', 'error': str(e)})
+
+    resumen['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resumen
+
+
+def preparar_conocimiento(knowledge_dir: str, opciones: Dict, credentials_info: Optional[Dict]):
+    """
+    Construye una sola vez el índice de conocimiento persistido en cache
+
+    Así los procesos trabajadores solo cargan el índice desde disco en lugar
+    de embeber la misma base normativa en paralelo.
+    """
+    if not opciones.get('cache_dir') or not opciones.get('enable_llm', True):
+        return
+
+    if _requiere_vertexai(opciones):
+        from clientes import obtener_procesador
+        processor = obtener_procesador(credentials_info, **opciones)
+    else:
+        processor = ContractProcessor(**opciones)
+    processor.cargar_conocimiento(knowledge_dir)
+
+
+def cargar_credenciales(ruta: Optional[str]) -> Optional[Dict]:
+    """Lee el JSON de la cuenta de servicio (argumento o GOOGLE_APPLICATION_CREDENTIALS)"""
+    ruta = ruta or os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if not ruta:
+        return None
+    return json.loads(Path(ruta).read_text(encoding='utf-8'))
+
+
+def auditar_cartera(
+    contratos: List[Path],
+    knowledge_dir: str,
+    salida_dir: str,
+    opciones: Dict,
+    credentials_info: Optional[Dict] = None,
+    workers: int = 2,
+    max_llm: int = 8,
+    reauditoria: bool = False
+) -> Dict:
+    """
+    Audita una cartera de contratos en un pool de procesos
+
+    Args:
+        contratos: Rutas de los PDFs
+        knowledge_dir: Directorio con documentos normativos compartidos
+        salida_dir: Directorio de resultados
+        opciones: Argumentos para ContractProcessor (sin credenciales)
+        credentials_info: Cuenta de servicio de Google Cloud
+        workers: Contratos auditados en paralelo (procesos)
+        max_llm: Llamadas simultáneas al LLM entre todos los procesos
+        reauditoria: Reutilizar hallazgos de versiones anteriores
+
+    Returns:
+        Resumen con totales, tiempo y contratos por hora
+    """
+    salida_path = Path(salida_dir)
+    salida_path.mkdir(parents=True, exist_ok=True)
+    resumen_path = salida_path / "resumen.jsonl"
+
+    inicio = time.perf_counter()
+    preparar_conocimiento(knowledge_dir, opciones, credentials_info)
+
+    # 'spawn' evita heredar canales gRPC abiertos por el proceso padre
+    contexto = multiprocessing.get_context('spawn')
+    limitador_llm = contexto.BoundedSemaphore(max(1, max_llm))
+
+    nombres = nombres_salida(contratos)
+    completados = 0
+    errores = 0
+
+    def crear_pool(max_workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=contexto,
+            initializer=_inicializar_trabajador,
+            initargs=(credentials_info, limitador_llm)
+        )
+
+    def enviar(executor: ProcessPoolExecutor, contrato: Path):
+        return executor.submit(
+            auditar_contrato_lote, str(contrato), knowledge_dir, salida_dir, opciones, reauditoria, nombres[contrato]
+        )
+
+    with open(resumen_path, 'w', encoding='utf-8') as resumen_file:
+        def registrar(fila: Dict):
+            nonlocal completados, errores
+            resumen_file.write(json.dumps(fila, ensure_ascii=False) + "\n")
+            resumen_file.flush()
+
+            i = completados + errores + 1
+            if fila['estado'] == 'completado':
+                completados += 1
+                print(f"✅ [{i}/{len(contratos)}] {Path(fila['contrato']).name}: "
+                      f"{fila['hallazgos']} hallazgos en {fila['segundos']:.1f}s")
+            else:
+                errores += 1
+                print(f"❌ [{i}/{len(contratos)}] {fila['contrato']}: {fila['error']}")
+
+        def fila_error(contrato: Path, error: str) -> Dict:
+            return {'contrato': str(contrato), 'estado': 'error', 'error': error, 'segundos': None}
+
+        # Contratos sin terminar cuando un proceso trabajador murió (p. ej. por
+        # falta de memoria): el pool entero queda inutilizable
+        interrumpidos = []
+        with crear_pool(max(1, workers)) as executor:
+            futuros = {enviar(executor, contrato): contrato for contrato in contratos}
+            for futuro in as_completed(futuros):
+                contrato = futuros[futuro]
+                try:
+                    registrar(futuro.result())
+                except BrokenProcessPool:
+                    interrumpidos.append(contrato)
+                except Exception as e:
+                    registrar(fila_error(contrato, str(e)))
+
+        # Se reintentan de a uno en un pool propio: si el proceso vuelve a
+        # morir, el fallo corresponde a ese contrato
+        if interrumpidos:
+            print(f"❌ Pool de trabajadores interrumpido; se reintentan {len(interrumpidos)} contratos uno a uno")
+        for contrato in sorted(interrumpidos, key=contratos.index):
+            with crear_pool(1) as executor:
+                try:
+                    registrar(enviar(executor, contrato).result())
+                except BrokenProcessPool:
+                    registrar(fila_error(contrato, "El proceso trabajador terminó inesperadamente"))
+                except Exception as e:
+                    registrar(fila_error(contrato, str(e)))
+
+    segundos = time.perf_counter() - inicio
+    return {
+        'contratos': len(contratos),
+        'completados': completados,
+        'errores': errores,
+        'segundos': round(segundos, 3),
+        'contratos_por_hora': round(completados / segundos * 3600, 2) if segundos > 0 else 0.0,
+        'resumen': str(resumen_path)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auditoría por lotes de contratos APP")
+    parser.add_argument("contratos", help="Directorio con PDFs o manifiesto (.txt/.json) de rutas")
+    parser.add_argument("--conocimiento", required=True, help="Directorio de la base de conocimiento compartida")
+    parser.add_argument("--salida", default="resultados_lote", help="Directorio de resultados")
+    parser.add_argument("--workers", type=int, default=2, help="Contratos auditados en paralelo (procesos)")
+    parser.add_argument("--max-llm", type=int, default=8, help="Llamadas simultáneas al LLM entre todos los procesos")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Secciones auditadas en paralelo por contrato")
+    parser.add_argument("--credenciales", help="JSON de la cuenta de servicio (por defecto GOOGLE_APPLICATION_CREDENTIALS)")
+    parser.add_argument(
+        "--cache-dir",
+        default=os.getenv("CONTRACTIA_CACHE_DIR", directorio_cache_predeterminado()),
+        help="Directorio de caches persistentes"
+    )
+    parser.add_argument("--sin-llm", action="store_true", help="Solo validación determinística de referencias")
+    parser.add_argument("--rag", action="store_true", help="Habilitar RAG avanzado")
+    parser.add_argument("--presupuesto-tokens-lote", type=int, default=6000, help="Tokens por prompt al agrupar secciones (0 = sin agrupar)")
+    parser.add_argument("--tokens-ventana", type=int, default=1000, help="Ventana para secciones largas (0 = truncar)")
+    parser.add_argument("--rpm", type=float, default=0, help="Cuota de solicitudes/minuto al LLM de todo el lote (0 = sin límite)")
+    parser.add_argument("--tpm", type=float, default=0, help="Cuota de tokens/minuto al LLM de todo el lote (0 = sin límite)")
+    parser.add_argument("--proveedor", default="vertexai", help="Proveedor de LLM y embeddings ('vertexai' o 'local')")
+    parser.add_argument("--opciones-proveedor", help="JSON (o ruta a un JSON) con opciones del proveedor")
+    parser.add_argument("--reauditoria", action="store_true", help="Reutilizar hallazgos de versiones anteriores")
+    args = parser.parse_args()
+
+    contratos = listar_contratos(args.contratos)
+    if not contratos:
+        print("❌ No se encontraron contratos para auditar")
+        sys.exit(1)
+
+    opciones_proveedor = None
+    if args.opciones_proveedor:
+        opciones_path = Path(args.opciones_proveedor)
+        opciones_proveedor = json.loads(
+            opciones_path.read_text(encoding='utf-8') if opciones_path.is_file() else args.opciones_proveedor
+        )
+
+    credentials_info = None
+    if not args.sin_llm and args.proveedor == 'vertexai':
+        credentials_info = cargar_credenciales(args.credenciales)
+        if credentials_info is None:
+            print("❌ Credenciales no encontradas: use --credenciales o GOOGLE_APPLICATION_CREDENTIALS")
+            sys.exit(1)
+
+    opciones = {
+        'enable_llm': not args.sin_llm,
+        'enable_rag': args.rag,
+        'max_concurrencia': args.concurrencia,
+        'cache_dir': args.cache_dir,
+        'presupuesto_tokens_lote': args.presupuesto_tokens_lote,
+        'tokens_ventana': args.tokens_ventana,
+        # La cuota se reparte entre los procesos (cada uno tiene su planificador)
+        'limites_llm': {
+            'rpm': args.rpm / max(1, args.workers),
+            'tpm': args.tpm / max(1, args.workers),
+            'concurrencia_max': args.max_llm
+        },
+        'proveedor': args.proveedor,
+        'opciones_proveedor': opciones_proveedor
+    }
+
+    print(f"📋 Auditando {len(contratos)} contratos con {args.workers} procesos "
+          f"(máx. {args.max_llm} llamadas LLM simultáneas) - {datetime.now():%Y-%m-%d %H:%M}")
+
+    totales = auditar_cartera(
+        contratos,
+        args.conocimiento,
+        args.salida,
+        opciones,
+        credentials_info=credentials_info,
+        workers=args.workers,
+        max_llm=args.max_llm,
+        reauditoria=args.reauditoria
+    )
+
+    print(f"\n{'Contratos':<22}{totales['contratos']:>10}")
+    print(f"{'Completados':<22}{totales['completados']:>10}")
+    print(f"{'Con error':<22}{totales['errores']:>10}")
+    print(f"{'Tiempo total (s)':<22}{totales['segundos']:>10.1f}")
+    print(f"{'Contratos por hora':<22}{totales['contratos_por_hora']:>10.1f}")
+    print(f"\nResumen: {totales['resumen']}")
+
+    sys.exit(1 if totales['errores'] else 0)
+
+
+if __name__ == "__main__":
+    main()
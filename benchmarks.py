@@ -0,0 +1,822 @@
+"""
+Benchmarks Module
+Mediciones de rendimiento de las etapas determinísticas de CONTRACTIA AI
+
+Uso:
+    python benchmarks.py                                  # curva de 10 a 100k secciones
+    python benchmarks.py --tamanos 100 10000 --salida base.json
+    python benchmarks.py --base base.json --tolerancia 0.25
+    python benchmarks.py --segmentacion --tamanos 10000
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import math
+import platform
+import random
+import re
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+
+from contract_processor import ContractProcessor, normalizar_paginas, normalizar_texto
+from utils import generar_reporte_markdown, iterar_reporte_markdown
+
+
+def generar_contrato_sintetico(
+    n_secciones: int,
+    semilla: int = 42,
+    clausulas_por_capitulo: int = 10,
+    proporcion_anexos: float = 0.02,
+    profundidad: int = 2,
+    densidad_referencias: float = 4.0,
+    tasa_rotas: float = 0.0
+) -> str:
+    """
+    Genera el texto de un contrato de concesión sintético
+
+    Las referencias válidas apuntan a capítulos, anexos y a la última cláusula
+    de cada capítulo (el segmentador reemplaza una cláusula por la siguiente,
+    así que solo esa sobrevive); las rotas apuntan a cláusulas inexistentes.
+
+    Args:
+        n_secciones: Número aproximado de encabezados (capítulos + cláusulas + anexos)
+        semilla: Semilla del generador aleatorio
+        clausulas_por_capitulo: Cláusulas (incluidas subcláusulas) por capítulo
+        proporcion_anexos: Anexos por encabezado generado
+        profundidad: Niveles máximos de numeración de cláusulas (2 = "3.1",
+            3 = "3.1.2", ...)
+        densidad_referencias: Referencias promedio por párrafo de cláusula
+        tasa_rotas: Fracción de referencias que no resuelven
+
+    Returns:
+        Texto del contrato
+    """
+    rng = random.Random(semilla)
+    profundidad = max(2, profundidad)
+    n_capitulos = max(1, n_secciones // (clausulas_por_capitulo + 1))
+    n_anexos = max(1, round(n_secciones * proporcion_anexos))
+
+    # Primera pasada: numeración de cláusulas por capítulo
+    capitulos = []
+    for c in range(1, n_capitulos + 1):
+        contadores = [c]
+        numeros = []
+        for _ in range(clausulas_por_capitulo):
+            nivel = rng.randint(2, min(profundidad, len(contadores) + 1))
+            contadores = contadores[:nivel]
+            if len(contadores) < nivel:
+                contadores.append(1)
+            else:
+                contadores[-1] += 1
+            numeros.append(".".join(str(n) for n in contadores))
+        capitulos.append(numeros)
+
+    destinos_validos = (
+        [f"Capítulo {_romano(c)}" for c in range(1, n_capitulos + 1)]
+        + [f"Cláusula {numeros[-1]}" for numeros in capitulos if numeros]
+        + [f"Anexo {a}" for a in range(1, n_anexos + 1)]
+    )
+
+    # Referencias por párrafo ~ Binomial(intentos, prob) con media densidad_referencias
+    intentos_referencia = max(1, math.ceil(2 * densidad_referencias))
+    prob_referencia = densidad_referencias / intentos_referencia
+
+    def referencia() -> str:
+        if rng.random() < tasa_rotas:
+            return f"Cláusula {n_capitulos + rng.randint(1, 1000)}.{rng.randint(1, clausulas_por_capitulo)}"
+        return rng.choice(destinos_validos)
+
+    # Segunda pasada: texto
+    lineas = ["CONTRATO DE CONCESIÓN", "Proyecto sintético de Asociación Público-Privada", ""]
+    for c, numeros in enumerate(capitulos, 1):
+        lineas.append(f"Capítulo {_romano(c)} Disposiciones del capítulo {c}")
+        for numero in numeros:
+            lineas.append(f"Cláusula {numero}. Obligaciones del Concesionario")
+            for _ in range(rng.randint(2, 6)):
+                n_referencias = sum(rng.random() < prob_referencia for _ in range(intentos_referencia))
+                citas = ", ".join(referencia() for _ in range(n_referencias))
+                lineas.append(
+                    f"El Concesionario cumplirá lo dispuesto en {citas or 'el presente Contrato'} "
+                    f"dentro del plazo de {rng.randint(5, 90)} días calendario."
+                )
+
+    for a in range(1, n_anexos + 1):
+        lineas.append(f"Anexo {a} Especificaciones técnicas {a}")
+        lineas.extend("Tabla de tarifas y niveles de servicio." for _ in range(rng.randint(3, 8)))
+
+    return "\n".join(lineas)
+
+
+def _romano(numero: int) -> str:
+    """Convierte un entero positivo a número romano"""
+    valores = [
+        (1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+        (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")
+    ]
+    resultado = ""
+    for valor, simbolo in valores:
+        while numero >= valor:
+            resultado += simbolo
+            numero -= valor
+    return resultado
+
+
+# Patrones del segmentador por líneas previo, usado como referencia
+_PATRONES_REFERENCIA = [
+    ('capitulo', re.compile(r"^[ \t]*Capítulo[ \t]+([IVXLCDM]+)[ \t]+(.+?)$", re.IGNORECASE | re.MULTILINE)),
+    ('anexo', re.compile(r"^[ \t]*Anexo(?:s)?[ \t]+([IVXLCDM]+|\d+|[A-Z])[ \t]+(.+?)$", re.IGNORECASE | re.MULTILINE)),
+    ('clausula', re.compile(r"^[ \t]*Cláusula[ \t]+(\d+(?:\.\d+)*)[\.\s]+(.+?)$", re.IGNORECASE | re.MULTILINE)),
+]
+
+
+def segmentar_referencia(texto: str) -> List[Dict]:
+    """
+    Segmentador previo: tres patrones por línea y listas de líneas
+
+    Args:
+        texto: Texto normalizado
+
+    Returns:
+        Lista de secciones
+    """
+    secciones = []
+    seccion_actual = None
+    contenido_actual = []
+
+    for i, linea in enumerate(texto.split('\n')):
+        linea_limpia = linea.strip()
+        for tipo, patron in _PATRONES_REFERENCIA:
+            match = patron.match(linea_limpia)
+            if match:
+                break
+        else:
+            if seccion_actual:
+                contenido_actual.append(linea)
+            continue
+
+        if seccion_actual and not (tipo == 'clausula' and seccion_actual['tipo'] == 'clausula'):
+            seccion_actual['contenido'] = '\n'.join(contenido_actual)
+            secciones.append(seccion_actual)
+        seccion_actual = {
+            'tipo': tipo,
+            'numero': match.group(1),
+            'titulo': match.group(2).strip(),
+            'linea_inicio': i
+        }
+        contenido_actual = []
+
+    if seccion_actual:
+        seccion_actual['contenido'] = '\n'.join(contenido_actual)
+        secciones.append(seccion_actual)
+
+    return secciones
+
+
+def generar_reporte_referencia(resultados: Dict, timestamp: str) -> str:
+    """
+    Renderizador previo del reporte por concatenación, usado como referencia
+
+    Args:
+        resultados: Diccionario con resultados de auditoría
+        timestamp: Fecha de análisis a mostrar
+
+    Returns:
+        Reporte en formato Markdown
+    """
+    
+    reporte = f"""# 📋 Reporte de Auditoría de Contrato APP
+
+**CONTRACTIA AI - Sistema Automatizado de Auditoría**  
+**Fecha de análisis:** {timestamp}
+
+---
+
+## 📊 Resumen Ejecutivo
+
+| Métrica | Valor |
+|---------|-------|
+| **Total de Secciones Analizadas** | {resultados.get('total_secciones', 0)} |
+| **Referencias Totales Encontradas** | {resultados.get('total_referencias', 0)} |
+| **Referencias Rotas Detectadas** | {resultados.get('referencias_rotas', 0)} |
+| **Total de Hallazgos** | {len(resultados.get('hallazgos_consistencia', []))} |
+
+### Precisión de Referencias
+"""
+    
+    total_refs = resultados.get('total_referencias', 1)
+    referencias_rotas = resultados.get('referencias_rotas', 0)
+    if total_refs > 0:
+        precision = ((total_refs - referencias_rotas) / total_refs) * 100
+        reporte += f"- **Tasa de éxito:** {precision:.2f}%\n"
+        reporte += f"- **Tasa de error:** {(100 - precision):.2f}%\n"
+    else:
+        reporte += "- No se encontraron referencias para analizar\n"
+    
+    reporte += "\n---\n\n"
+    
+    # Reauditoría incremental
+    reauditoria = resultados.get('reauditoria')
+    if reauditoria:
+        reutilizadas = reauditoria.get('secciones_reutilizadas', [])
+        revalidadas = reauditoria.get('secciones_revalidadas', [])
+        reporte += "## 🔁 Reauditoría Incremental\n\n"
+        reporte += f"- **Secciones reutilizadas de la versión anterior:** {len(reutilizadas)}\n"
+        reporte += f"- **Secciones revalidadas (modificadas o afectadas):** {len(revalidadas)}\n\n"
+        if revalidadas:
+            reporte += "Secciones revalidadas: " + ", ".join(revalidadas) + "\n"
+        reporte += "\n---\n\n"
+    
+    # Hallazgos por severidad
+    hallazgos = resultados.get('hallazgos_consistencia', [])
+    hallazgos_alta = []
+    if hallazgos:
+        reporte += "## ⚠️ Hallazgos Detectados\n\n"
+        
+        # Clasificar por severidad
+        hallazgos_alta = [h for h in hallazgos if h.get('severidad') == 'alta']
+        hallazgos_media = [h for h in hallazgos if h.get('severidad') == 'media']
+        hallazgos_baja = [h for h in hallazgos if h.get('severidad') == 'baja']
+        
+        reporte += f"### 🔴 Severidad Alta ({len(hallazgos_alta)} hallazgos)\n\n"
+        for i, h in enumerate(hallazgos_alta, 1):
+            reporte += f"**{i}. {h.get('tipo', 'Error desconocido')}**\n"
+            reporte += f"- **Ubicación:** {h.get('ubicacion', 'N/A')}\n"
+            reporte += f"- **Descripción:** {h.get('descripcion', 'N/A')}\n\n"
+        
+        reporte += f"\n### 🟡 Severidad Media ({len(hallazgos_media)} hallazgos)\n\n"
+        for i, h in enumerate(hallazgos_media, 1):
+            reporte += f"**{i}. {h.get('tipo', 'Error desconocido')}**\n"
+            reporte += f"- **Ubicación:** {h.get('ubicacion', 'N/A')}\n"
+            reporte += f"- **Descripción:** {h.get('descripcion', 'N/A')}\n\n"
+        
+        reporte += f"\n### 🔵 Severidad Baja ({len(hallazgos_baja)} hallazgos)\n\n"
+        for i, h in enumerate(hallazgos_baja, 1):
+            reporte += f"**{i}. {h.get('tipo', 'Error desconocido')}**\n"
+            reporte += f"- **Ubicación:** {h.get('ubicacion', 'N/A')}\n"
+            reporte += f"- **Descripción:** {h.get('descripcion', 'N/A')}\n\n"
+    else:
+        reporte += "## ✅ Sin Hallazgos Críticos\n\n"
+        reporte += "El contrato cumple con los estándares de coherencia y validación.\n"
+    
+    reporte += "\n---\n\n"
+    
+    # Hallazgos por sección
+    hallazgos_por_seccion = resultados.get('hallazgos_por_seccion', {})
+    if hallazgos_por_seccion:
+        reporte += "## 📑 Hallazgos por Sección\n\n"
+        
+        for seccion_id, hallazgos_sec in hallazgos_por_seccion.items():
+            reporte += f"### {seccion_id}\n\n"
+            reporte += f"Total de hallazgos: **{len(hallazgos_sec)}**\n\n"
+            
+            for i, h in enumerate(hallazgos_sec, 1):
+                reporte += f"{i}. **{h.get('tipo', 'Error')}** - {h.get('descripcion', 'N/A')}\n"
+            
+            reporte += "\n"
+    
+    # Recomendaciones
+    reporte += "---\n\n## 💡 Recomendaciones\n\n"
+    
+    if referencias_rotas > 0:
+        reporte += f"1. **Corregir referencias rotas:** Se detectaron {referencias_rotas} referencias que no apuntan a secciones existentes. Revisar y corregir todas las referencias cruzadas.\n\n"
+    
+    if len(hallazgos_alta) > 0:
+        reporte += f"2. **Atender hallazgos críticos:** Hay {len(hallazgos_alta)} hallazgos de severidad alta que requieren atención inmediata.\n\n"
+    
+    reporte += "3. **Revisión legal:** Someter el contrato a revisión legal experta antes de la firma final.\n\n"
+    reporte += "4. **Validación cruzada:** Contrastar con lineamientos vigentes de ProInversión y el MEF.\n\n"
+    
+    # Footer
+    reporte += "---\n\n"
+    reporte += "*Reporte generado automáticamente por CONTRACTIA AI*  \n"
+    reporte += "*Team DataLaw - UTEC | Maestría en Data Science e Inteligencia Artificial*\n"
+    
+    return reporte
+
+
+def normalizar_referencia(s: str) -> str:
+    """Normalización previa de ContractProcessor._norm_text, como referencia"""
+    s = s.replace("\ufeff", "").replace("\r", "")
+    s = s.replace("\u00a0", " ")
+    s = s.replace("\u00ad", "")
+    s = re.sub(r"\f", "\n", s)
+    s = re.sub(r"[ \t]+", " ", s)
+    s = re.sub(r"\n{3,}", "\n\n", s)
+    return s.strip()
+
+
+def generar_paginas_sinteticas(n_paginas: int, semilla: int = 42, caracteres_por_pagina: int = 3000) -> List[str]:
+    """
+    Genera páginas con el ruido típico de la extracción de PDF
+
+    Args:
+        n_paginas: Cantidad de páginas
+        semilla: Semilla del generador aleatorio
+        caracteres_por_pagina: Tamaño aproximado de cada página
+
+    Returns:
+        Texto crudo de cada página
+    """
+    rng = random.Random(semilla)
+    # ~550 caracteres por sección en el contrato sintético
+    texto = generar_contrato_sintetico(max(10, n_paginas * caracteres_por_pagina // 550), semilla)
+    ruido = ["  ", "\t", " \t ", "\u00a0", "\u00ad", "\r\n", "\n\n\n\n", "\ufeff", "\f", "   \n \n"]
+    palabras = texto.split(" ")
+    for i in rng.sample(range(len(palabras)), len(palabras) // 10):
+        palabras[i] += rng.choice(ruido)
+    texto = " ".join(palabras)
+
+    paginas = []
+    for inicio in range(0, len(texto), caracteres_por_pagina):
+        pagina = texto[inicio:inicio + caracteres_por_pagina]
+        # Encabezado y espacio al inicio/fin de página, como en PyPDFLoader
+        paginas.append(f"  \n{pagina}\n \n")
+        if len(paginas) == n_paginas:
+            break
+    return paginas
+
+
+def benchmark_normalizacion(n_paginas: int = 500, repeticiones: int = 3) -> Dict:
+    """
+    Compara la normalización previa (siete pasadas) con la actual
+
+    Verifica antes la equivalencia exacta con textos aleatorios llenos de
+    caracteres especiales, y la del modo incremental por páginas.
+
+    Args:
+        n_paginas: Páginas del documento sintético
+        repeticiones: Repeticiones por medición (se toma la mejor)
+
+    Returns:
+        Tiempos y memoria pico de cada implementación
+    """
+    rng = random.Random(0)
+    alfabeto = ["a", "b", "Cláusula 1.1", " ", "  ", "\t", "\n", "\n\n\n", "\r", "\f", "\ufeff",
+                "\u00a0", "\u00ad", "\u2003", "\x0b", "\u3000"]
+    for _ in range(5000):
+        texto = "".join(rng.choice(alfabeto) for _ in range(rng.randint(0, 60)))
+        cortes = [0] + sorted(rng.randint(0, len(texto)) for _ in range(3)) + [len(texto)]
+        paginas = [texto[i:j] for i, j in zip(cortes, cortes[1:])]
+        if normalizar_texto(texto) != normalizar_referencia(texto):
+            raise AssertionError(f"La normalización difiere de la de referencia: {texto!r}")
+        if normalizar_paginas(paginas) != normalizar_referencia("\n\n".join(paginas)):
+            raise AssertionError(f"La normalización por páginas difiere de la de referencia: {paginas!r}")
+        if normalizar_texto(normalizar_texto(texto)) != normalizar_texto(texto):
+            raise AssertionError(f"La normalización no es idempotente: {texto!r}")
+
+    paginas = generar_paginas_sinteticas(n_paginas)
+    texto = "\n\n".join(paginas)
+    if normalizar_texto(texto) != normalizar_referencia(texto) or normalizar_paginas(paginas) != normalizar_referencia(texto):
+        raise AssertionError("La normalización difiere de la de referencia en el documento sintético")
+
+    previa = _medir(lambda: normalizar_referencia("\n\n".join(paginas)), repeticiones)
+    actual = _medir(lambda: normalizar_texto("\n\n".join(paginas)), repeticiones)
+    por_paginas = _medir(lambda: normalizar_paginas(paginas), repeticiones)
+
+    return {
+        'paginas': len(paginas),
+        'caracteres': len(texto),
+        'previa': previa,
+        'actual': actual,
+        'por_paginas': por_paginas,
+        'aceleracion': previa['segundos'] / actual['segundos']
+    }
+
+
+def benchmark_segmentacion(n_secciones: int = 10000, repeticiones: int = 3) -> Dict:
+    """
+    Compara el segmentador previo por líneas con el de una sola pasada por offsets
+
+    Args:
+        n_secciones: Tamaño del contrato sintético
+        repeticiones: Repeticiones por medición (se toma la mejor)
+
+    Returns:
+        Líneas por segundo de cada segmentador
+    """
+    processor = ContractProcessor(enable_llm=False)
+    texto_crudo = generar_contrato_sintetico(n_secciones)
+    texto = processor._norm_text(texto_crudo)
+    total_lineas = texto.count("\n") + 1
+
+    if segmentar_referencia(texto) != processor.segmentar_contrato(texto_crudo):
+        raise AssertionError("El segmentador por offsets difiere del segmentador de referencia")
+
+    def medir(funcion) -> float:
+        mejor = float("inf")
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            mejor = min(mejor, time.perf_counter() - inicio)
+        return mejor
+
+    t_lineas = medir(lambda: segmentar_referencia(texto))
+    t_offsets = medir(lambda: [texto[i:f] for *_, i, f in processor._segmentar_offsets(texto)])
+
+    return {
+        'lineas': total_lineas,
+        'lineas_por_segundo_por_lineas': total_lineas / t_lineas,
+        'lineas_por_segundo_offsets': total_lineas / t_offsets,
+        'aceleracion': t_lineas / t_offsets
+    }
+
+
+def _medir(funcion, repeticiones: int) -> Dict:
+    """
+    Mide una etapa: mejor tiempo de pared y memoria pico asignada
+
+    La memoria se mide en una ejecución aparte porque tracemalloc distorsiona
+    los tiempos.
+    """
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'segundos': mejor, 'memoria_pico_bytes': pico}
+
+
+def benchmark_etapas(n_secciones: int, repeticiones: int = 3, **parametros) -> Dict:
+    """
+    Mide tiempo y memoria pico de cada etapa determinística
+
+    Args:
+        n_secciones: Tamaño del contrato sintético
+        repeticiones: Repeticiones por medición (se toma la mejor)
+        **parametros: Argumentos de generar_contrato_sintetico
+
+    Returns:
+        Tamaño del contrato y mediciones por etapa
+    """
+    processor = ContractProcessor(enable_llm=False)
+    texto_crudo = generar_contrato_sintetico(n_secciones, **parametros)
+
+    # Entradas de cada etapa calculadas una vez, fuera de la medición
+    texto = processor._norm_text(texto_crudo)
+    secciones = processor.segmentar_contrato(texto_crudo)
+    indices = processor.construir_indices(secciones)
+    grafo = processor.construir_grafo_referencias(secciones, indices)
+    auditoria = processor.auditar_contrato(secciones, indices)
+
+    etapas = {
+        'normalizacion': lambda: processor._norm_text(texto_crudo),
+        'segmentacion': lambda: processor.segmentar_contrato(texto_crudo),
+        'indices': lambda: processor.construir_indices(secciones),
+        'referencias': lambda: processor.construir_grafo_referencias(secciones, indices),
+        'auditoria': lambda: processor.auditar_contrato(secciones, indices),
+        'reporte': lambda: generar_reporte_markdown(auditoria)
+    }
+
+    return {
+        'caracteres': len(texto),
+        'lineas': texto.count("\n") + 1,
+        'secciones': len(secciones),
+        'referencias': grafo.total_aristas,
+        'referencias_rotas': grafo.total_rotas,
+        'etapas': {nombre: _medir(funcion, repeticiones) for nombre, funcion in etapas.items()}
+    }
+
+
+def ejecutar_suite(tamanos: List[int], repeticiones: int = 3, **parametros) -> Dict:
+    """
+    Curva de escalamiento de las etapas determinísticas
+
+    Args:
+        tamanos: Números de secciones a medir (p. ej. 10 a 100000)
+        repeticiones: Repeticiones por medición
+        **parametros: Argumentos de generar_contrato_sintetico
+
+    Returns:
+        Resultados por tamaño junto con los parámetros y el entorno
+    """
+    resultados = {}
+    for n_secciones in tamanos:
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultados[str(n_secciones)] = benchmark_etapas(n_secciones, repeticiones, **parametros)
+    return {
+        'parametros': parametros,
+        'entorno': {'python': platform.python_version(), 'plataforma': platform.platform()},
+        'tamanos': resultados
+    }
+
+
+def comparar_con_base(
+    resultados: Dict,
+    base: Dict,
+    tolerancia: float = 0.25,
+    min_segundos: float = 0.001
+) -> List[Dict]:
+    """
+    Detecta regresiones de tiempo o memoria respecto de una línea base
+
+    Args:
+        resultados: Salida de ejecutar_suite
+        base: Línea base guardada (misma estructura)
+        tolerancia: Aumento relativo permitido (0.25 = 25%)
+        min_segundos: Tiempos base menores se ignoran por ruido
+
+    Returns:
+        Lista de regresiones (tamaño, etapa, métrica, base, actual, razón)
+    """
+    regresiones = []
+    for tamano, medicion in resultados['tamanos'].items():
+        medicion_base = base.get('tamanos', {}).get(tamano)
+        if medicion_base is None:
+            continue
+        for etapa, valores in medicion['etapas'].items():
+            valores_base = medicion_base['etapas'].get(etapa)
+            if valores_base is None:
+                continue
+            for metrica in ('segundos', 'memoria_pico_bytes'):
+                anterior, actual = valores_base[metrica], valores[metrica]
+                if metrica == 'segundos' and anterior < min_segundos:
+                    continue
+                if anterior > 0 and actual > anterior * (1 + tolerancia):
+                    regresiones.append({
+                        'tamano': int(tamano),
+                        'etapa': etapa,
+                        'metrica': metrica,
+                        'base': anterior,
+                        'actual': actual,
+                        'razon': actual / anterior
+                    })
+    return regresiones
+
+
+def generar_auditoria_sintetica(n_hallazgos: int, semilla: int = 42) -> Dict:
+    """
+    Genera resultados de auditoría con hallazgos aleatorios para el reporte
+
+    Args:
+        n_hallazgos: Cantidad de hallazgos
+        semilla: Semilla del generador aleatorio
+
+    Returns:
+        Diccionario con la forma de ContractProcessor.auditar_contrato
+    """
+    rng = random.Random(semilla)
+    secciones = [f"Cláusula {i}.1" for i in range(1, max(2, n_hallazgos // 5) + 1)]
+    hallazgos_por_seccion: Dict[str, List[Dict]] = {}
+    hallazgos = []
+    for i in range(n_hallazgos):
+        seccion = rng.choice(secciones)
+        hallazgo = {
+            # Incluye severidades fuera de alta/media/baja y hallazgos sin severidad
+            'severidad': rng.choice(['alta', 'media', 'baja', 'baja', 'Alta', None]),
+            'tipo': rng.choice(['Referencia rota', 'Inconsistencia', 'Plazo incoherente']),
+            'ubicacion': seccion,
+            'descripcion': f"Descripción del hallazgo {i} con *formato* | y tildes: ñ, ó"
+        }
+        if hallazgo['severidad'] is None:
+            del hallazgo['severidad']
+        hallazgos.append(hallazgo)
+        hallazgos_por_seccion.setdefault(seccion, []).append(hallazgo)
+
+    return {
+        'total_secciones': len(secciones),
+        'total_referencias': rng.randint(0, n_hallazgos * 3),
+        'referencias_rotas': rng.randint(0, n_hallazgos),
+        'hallazgos_consistencia': hallazgos,
+        'hallazgos_por_seccion': hallazgos_por_seccion,
+        'reauditoria': {
+            'secciones_reutilizadas': secciones[::2],
+            'secciones_revalidadas': secciones[1::2]
+        } if rng.random() < 0.5 else None
+    }
+
+
+def benchmark_reporte(n_hallazgos: int = 10000, repeticiones: int = 3) -> Dict:
+    """
+    Compara el reporte previo por concatenación con el de una sola pasada
+
+    Args:
+        n_hallazgos: Hallazgos de la auditoría sintética
+        repeticiones: Repeticiones por medición (se toma la mejor)
+
+    Returns:
+        Tiempos y memoria pico de cada implementación
+    """
+    timestamp = "2024-01-01 00:00:00"
+    for semilla in range(20):
+        resultados = generar_auditoria_sintetica(n_hallazgos if semilla else 0, semilla)
+        referencia = generar_reporte_referencia(resultados, timestamp)
+        if generar_reporte_markdown(resultados, timestamp) != referencia:
+            raise AssertionError(f"El reporte difiere del de referencia (semilla {semilla})")
+        if "".join(iterar_reporte_markdown(resultados, timestamp, tamano_fragmento=1024)) != referencia:
+            raise AssertionError(f"El reporte por fragmentos difiere del de referencia (semilla {semilla})")
+
+    resultados = generar_auditoria_sintetica(n_hallazgos)
+    previo = _medir(lambda: generar_reporte_referencia(resultados, timestamp), repeticiones)
+    actual = _medir(lambda: generar_reporte_markdown(resultados, timestamp), repeticiones)
+    # Consumir los fragmentos sin retenerlos, como al escribir a disco o a una respuesta
+    fragmentos = _medir(lambda: sum(len(f) for f in iterar_reporte_markdown(resultados, timestamp)), repeticiones)
+
+    return {
+        'hallazgos': n_hallazgos,
+        'previo': previo,
+        'una_pasada': actual,
+        'por_fragmentos': fragmentos,
+        'aceleracion': previo['segundos'] / actual['segundos']
+    }
+
+
+def _memoria_retenida(funcion) -> int:
+    """Bytes que siguen asignados por el resultado de la función"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        resultado = funcion()
+        gc.collect()
+        retenida, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del resultado
+    return retenida
+
+
+def benchmark_memoria_secciones(n_secciones: int = 10000, **parametros) -> Dict:
+    """
+    Compara la memoria retenida por secciones e índices: diccionarios con un
+    string por sección frente a vistas compactas sobre un buffer compartido
+
+    Args:
+        n_secciones: Tamaño del contrato sintético
+        **parametros: Argumentos de generar_contrato_sintetico
+
+    Returns:
+        Bytes retenidos por cada representación
+    """
+    processor = ContractProcessor(enable_llm=False)
+    texto_crudo = generar_contrato_sintetico(n_secciones, **parametros)
+
+    def diccionarios():
+        # Representación previa: un string y un diccionario por sección, y otro diccionario en el índice
+        texto = processor._norm_text(texto_crudo)
+        secciones = [
+            {'tipo': tipo, 'numero': numero, 'titulo': titulo, 'linea_inicio': linea, 'contenido': texto[inicio:fin]}
+            for tipo, numero, titulo, linea, inicio, fin in processor._segmentar_offsets(texto)
+        ]
+        # construir_indices conserva el comportamiento previo para diccionarios
+        return secciones, processor.construir_indices(secciones)
+
+    def compactas():
+        secciones = processor.segmentar_contrato(texto_crudo)
+        return secciones, processor.construir_indices(secciones)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        secciones_previas, _ = diccionarios()
+        secciones_compactas, _ = compactas()
+        if secciones_previas != secciones_compactas:
+            raise AssertionError("Las secciones compactas difieren de las secciones en diccionarios")
+        del secciones_previas, secciones_compactas
+
+        previa = _memoria_retenida(diccionarios)
+        compacta = _memoria_retenida(compactas)
+
+    return {
+        'secciones': n_secciones,
+        'caracteres': len(texto_crudo),
+        'diccionarios_bytes': previa,
+        'compactas_bytes': compacta,
+        'reduccion': previa / compacta
+    }
+
+
+def _formatear_bytes(n: float) -> str:
+    """Bytes en unidades legibles"""
+    for unidad in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f} {unidad}" if unidad == "B" else f"{n:.1f} {unidad}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de CONTRACTIA AI")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000],
+                        help="Secciones de cada contrato sintético")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--clausulas-por-capitulo", type=int, default=10)
+    parser.add_argument("--proporcion-anexos", type=float, default=0.02)
+    parser.add_argument("--profundidad", type=int, default=2, help="Niveles de numeración de cláusulas")
+    parser.add_argument("--densidad-referencias", type=float, default=4.0, help="Referencias por párrafo")
+    parser.add_argument("--tasa-rotas", type=float, default=0.05, help="Fracción de referencias rotas")
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    parser.add_argument("--base", help="Línea base JSON contra la cual detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Aumento relativo permitido")
+    parser.add_argument("--segmentacion", action="store_true",
+                        help="Comparar el segmentador por offsets con el previo por líneas")
+    parser.add_argument("--normalizacion", action="store_true",
+                        help="Comparar la normalización de una sola pasada con la previa (tamaños = páginas)")
+    parser.add_argument("--memoria-secciones", action="store_true",
+                        help="Comparar la memoria de secciones e índices compactos con la de diccionarios")
+    parser.add_argument("--reporte", action="store_true",
+                        help="Comparar el reporte de una sola pasada con el previo (tamaños = hallazgos)")
+    args = parser.parse_args()
+
+    if args.segmentacion:
+        for n_secciones in args.tamanos:
+            with contextlib.redirect_stdout(io.StringIO()):
+                resultado = benchmark_segmentacion(n_secciones, args.repeticiones)
+            print(f"📏 Segmentación ({resultado['lineas']} líneas)")
+            print(f"   - Por líneas:  {resultado['lineas_por_segundo_por_lineas']:,.0f} líneas/s")
+            print(f"   - Por offsets: {resultado['lineas_por_segundo_offsets']:,.0f} líneas/s")
+            print(f"   - Aceleración: {resultado['aceleracion']:.2f}x")
+        return
+
+    if args.normalizacion:
+        for n_paginas in args.tamanos:
+            resultado = benchmark_normalizacion(n_paginas, args.repeticiones)
+            print(f"📏 Normalización ({resultado['paginas']:,} páginas, "
+                  f"{_formatear_bytes(resultado['caracteres'])} de texto, idéntica a la previa)")
+            for nombre, clave in (("Previa", 'previa'), ("Actual", 'actual'), ("Por páginas", 'por_paginas')):
+                valores = resultado[clave]
+                print(f"   - {nombre + ':':<13}{valores['segundos'] * 1000:>10.2f} ms"
+                      f"{_formatear_bytes(valores['memoria_pico_bytes']):>14}")
+            print(f"   - Aceleración: {resultado['aceleracion']:.2f}x")
+        return
+
+    if args.memoria_secciones:
+        for n_secciones in args.tamanos:
+            resultado = benchmark_memoria_secciones(
+                n_secciones,
+                semilla=args.semilla,
+                clausulas_por_capitulo=args.clausulas_por_capitulo,
+                proporcion_anexos=args.proporcion_anexos,
+                profundidad=args.profundidad,
+                densidad_referencias=args.densidad_referencias,
+                tasa_rotas=args.tasa_rotas
+            )
+            print(f"📏 Secciones e índices ({resultado['secciones']:,} secciones, "
+                  f"{_formatear_bytes(resultado['caracteres'])} de texto)")
+            print(f"   - Diccionarios: {_formatear_bytes(resultado['diccionarios_bytes'])}")
+            print(f"   - Compactas:    {_formatear_bytes(resultado['compactas_bytes'])}")
+            print(f"   - Reducción:    {resultado['reduccion']:.2f}x")
+        return
+
+    if args.reporte:
+        for n_hallazgos in args.tamanos:
+            resultado = benchmark_reporte(n_hallazgos, args.repeticiones)
+            print(f"📝 Reporte ({resultado['hallazgos']:,} hallazgos, idéntico al previo)")
+            for nombre, clave in (("Previo", 'previo'), ("Una pasada", 'una_pasada'), ("Fragmentos", 'por_fragmentos')):
+                valores = resultado[clave]
+                print(f"   - {nombre + ':':<12}{valores['segundos'] * 1000:>10.2f} ms"
+                      f"{_formatear_bytes(valores['memoria_pico_bytes']):>14}")
+            print(f"   - Aceleración: {resultado['aceleracion']:.2f}x")
+        return
+
+    resultados = ejecutar_suite(
+        args.tamanos,
+        args.repeticiones,
+        semilla=args.semilla,
+        clausulas_por_capitulo=args.clausulas_por_capitulo,
+        proporcion_anexos=args.proporcion_anexos,
+        profundidad=args.profundidad,
+        densidad_referencias=args.densidad_referencias,
+        tasa_rotas=args.tasa_rotas
+    )
+
+    for tamano, medicion in resultados['tamanos'].items():
+        print(f"\n📏 {tamano} secciones generadas: {medicion['secciones']} segmentadas, "
+              f"{medicion['lineas']:,} líneas, {medicion['referencias']:,} referencias "
+              f"({medicion['referencias_rotas']:,} rotas)")
+        print(f"   {'Etapa':<16}{'Tiempo (ms)':>14}{'Memoria pico':>16}")
+        for etapa, valores in medicion['etapas'].items():
+            print(f"   {etapa:<16}{valores['segundos'] * 1000:>14.2f}{_formatear_bytes(valores['memoria_pico_bytes']):>16}")
+
+    if args.salida:
+        Path(args.salida).write_text(json.dumps(resultados, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"\n💾 Resultados guardados en {args.salida}")
+
+    if args.base:
+        base = json.loads(Path(args.base).read_text(encoding='utf-8'))
+        if base.get('parametros') != resultados['parametros']:
+            print(f"\n⚠️ La línea base se generó con otros parámetros: {base.get('parametros')}")
+        regresiones = comparar_con_base(resultados, base, args.tolerancia)
+        if regresiones:
+            print(f"\n❌ {len(regresiones)} regresiones respecto de {args.base}:")
+            for r in regresiones:
+                print(f"   - {r['tamano']} secciones, {r['etapa']}, {r['metrica']}: "
+                      f"{r['base']:.4g} -> {r['actual']:.4g} ({r['razon']:.2f}x)")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones respecto de {args.base} (tolerancia {args.tolerancia:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,600 @@
+"""
+Cache Module
+Caches persistentes en disco para CONTRACTIA AI
+"""
+
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+def hash_texto(texto: str) -> str:
+    """Calcula el SHA-256 de un texto"""
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def hash_archivo(ruta: str, tamano_bloque: int = 1 << 20) -> str:
+    """Calcula el SHA-256 del contenido de un archivo"""
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def directorio_cache_predeterminado() -> str:
+    """Directorio de caches privado del usuario (XDG_CACHE_HOME o ~/.cache)"""
+    base = os.getenv("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return str(Path(base) / "contractia")
+
+
+def crear_directorio_privado(ruta: str) -> Path:
+    """Crea un directorio accesible solo por el usuario actual (0700)"""
+    path = Path(ruta)
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return path
+
+
+def ruta_privada(ruta: str) -> bool:
+    """
+    Indica si una ruta pertenece al usuario actual y nadie más puede escribirla
+
+    Args:
+        ruta: Archivo o directorio a verificar
+
+    Returns:
+        False si el propietario es otro usuario o el grupo/otros tienen escritura
+    """
+    estado = os.stat(ruta)
+    if hasattr(os, 'getuid') and estado.st_uid != os.getuid():
+        return False
+    return not estado.st_mode & 0o022
+
+
+@contextlib.contextmanager
+def bloquear_archivo(lock_path: Path):
+    """Lock exclusivo entre procesos sobre un archivo de lock (sin efecto sin fcntl)"""
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def normalizar_para_hash(texto: str) -> str:
+    """Colapsa espacios para que diferencias de formato no cambien la clave"""
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+class CacheHallazgos:
+    """
+    Cache SQLite de hallazgos del LLM, direccionado por contenido
+
+    La clave combina el hash del texto normalizado de la sección, la versión
+    del prompt, el modelo, la temperatura y el hash del contexto RAG.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_entradas: int = 50000,
+        max_edad_dias: float = 30
+    ):
+        """
+        Inicializa el cache
+
+        Args:
+            cache_dir: Directorio donde se guarda la base SQLite
+            max_entradas: Número máximo de entradas antes de desalojar
+            max_edad_dias: Antigüedad máxima de una entrada
+        """
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        self.db_path = str(Path(cache_dir) / "hallazgos_llm.sqlite")
+        self.max_entradas = max_entradas
+        self.max_edad_segundos = max_edad_dias * 86400
+        self.aciertos = 0
+        self.fallos = 0
+        self._escrituras = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS hallazgos (
+                clave TEXT PRIMARY KEY,
+                hallazgos TEXT NOT NULL,
+                creado REAL NOT NULL,
+                usado REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+        self.desalojar()
+
+    @staticmethod
+    def construir_clave(
+        contenido: str,
+        seccion_id: str,
+        version_prompt: str,
+        modelo: str,
+        temperatura: float,
+        contexto: str = ""
+    ) -> str:
+        """
+        Construye la clave de cache de una validación
+
+        Args:
+            contenido: Texto enviado al LLM
+            seccion_id: Identificador de la sección (forma parte del prompt)
+            version_prompt: Versión de la plantilla del prompt
+            modelo: Nombre del modelo
+            temperatura: Temperatura del modelo
+            contexto: Contexto RAG recuperado
+
+        Returns:
+            Clave hexadecimal
+        """
+        partes = [
+            hash_texto(normalizar_para_hash(contenido)),
+            seccion_id,
+            version_prompt,
+            modelo,
+            repr(float(temperatura)),
+            hash_texto(contexto)
+        ]
+        return hash_texto("\x1f".join(partes))
+
+    def obtener(self, clave: str) -> Optional[List[Dict]]:
+        """Retorna los hallazgos guardados o None si no existen o expiraron"""
+        ahora = time.time()
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT hallazgos, creado FROM hallazgos WHERE clave = ?",
+                (clave,)
+            ).fetchone()
+
+            if fila is None or ahora - fila[1] > self.max_edad_segundos:
+                self.fallos += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE hallazgos SET usado = ? WHERE clave = ?",
+                (ahora, clave)
+            )
+            self._conn.commit()
+            self.aciertos += 1
+
+        return json.loads(fila[0])
+
+    def guardar(self, clave: str, hallazgos: List[Dict]):
+        """Guarda los hallazgos de una validación"""
+        ahora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hallazgos VALUES (?, ?, ?, ?)",
+                (clave, json.dumps(hallazgos, ensure_ascii=False), ahora, ahora)
+            )
+            self._conn.commit()
+            self._escrituras += 1
+            desalojar = self._escrituras % 500 == 0
+
+        if desalojar:
+            self.desalojar()
+
+    def desalojar(self):
+        """Elimina entradas expiradas y las menos usadas si se excede el tamaño"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM hallazgos WHERE creado < ?",
+                (time.time() - self.max_edad_segundos,)
+            )
+            self._conn.execute(
+                """DELETE FROM hallazgos WHERE clave IN (
+                    SELECT clave FROM hallazgos ORDER BY usado DESC
+                    LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entradas,)
+            )
+            self._conn.commit()
+
+    def cerrar(self):
+        """Cierra la conexión SQLite"""
+        with self._lock:
+            self._conn.close()
+
+    def estadisticas(self) -> Dict:
+        """Retorna contadores de aciertos y fallos"""
+        total = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': (self.aciertos / total) if total else 0.0
+        }
+
+
+class CacheEmbeddings:
+    """
+    Cache en disco de vectores de embeddings por (modelo, hash del chunk)
+
+    Los vectores se guardan como filas float32 contiguas en un archivo
+    binario de solo-anexado; un índice JSON mapea hash -> fila.
+
+    Varios procesos pueden compartir el cache: el anexado y la actualización
+    del índice se serializan con un lock de archivo (fcntl), la fila de cada
+    vector se calcula con el archivo bloqueado y el índice en disco se
+    recarga y se fusiona antes de reescribirlo.
+    """
+
+    def __init__(self, cache_dir: str, modelo: str):
+        """
+        Inicializa el cache
+
+        Args:
+            cache_dir: Directorio del cache
+            modelo: Nombre del modelo de embeddings
+        """
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        nombre = re.sub(r"[^A-Za-z0-9_.-]", "_", modelo)
+        self.datos_path = Path(cache_dir) / f"embeddings_{nombre}.f32"
+        self.indice_path = Path(cache_dir) / f"embeddings_{nombre}.json"
+        self.lock_path = Path(cache_dir) / f"embeddings_{nombre}.lock"
+        self._lock = threading.Lock()
+        self._nuevas: Dict[str, int] = {}
+        self._mtime_indice = None
+
+        self.dimension = None
+        self.filas = {}
+        with self._lock, self._lock_archivo():
+            self._recargar_indice()
+
+    def _lock_archivo(self):
+        """Lock exclusivo entre procesos sobre el cache de este modelo"""
+        return bloquear_archivo(self.lock_path)
+
+    def _recargar_indice(self):
+        """
+        Fusiona en self.filas el índice en disco escrito por otros procesos
+
+        Debe llamarse con el lock de archivo tomado. Las filas posteriores al
+        final del archivo de datos (escrituras incompletas) se descartan.
+        """
+        try:
+            mtime = self.indice_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime_indice:
+            return
+        try:
+            indice = json.loads(self.indice_path.read_text(encoding='utf-8'))
+            dimension = indice['dimension']
+            if self.dimension is not None and dimension != self.dimension:
+                raise ValueError(f"dimensión {dimension} distinta de {self.dimension}")
+            total_filas = self.datos_path.stat().st_size // (4 * dimension) if self.datos_path.exists() else 0
+            self.dimension = dimension
+            self.filas.update({h: f for h, f in indice['filas'].items() if f < total_filas})
+            self._mtime_indice = mtime
+        except Exception as e:
+            print(f"Índice del cache de embeddings inválido, se ignora: {e}")
+
+    def obtener(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Retorna los vectores en cache para los hashes dados"""
+        with self._lock:
+            if any(h not in self.filas for h in hashes):
+                # Otros procesos pueden haber agregado vectores desde la última lectura
+                with self._lock_archivo():
+                    self._recargar_indice()
+            filas = {h: self.filas[h] for h in hashes if h in self.filas}
+            if not filas:
+                return {}
+            # Solo el prefijo de filas completas: una escritura interrumpida
+            # puede dejar una cola parcial al final del archivo
+            total_filas = self.datos_path.stat().st_size // (4 * self.dimension)
+            if total_filas == 0:
+                return {}
+            matriz = np.memmap(self.datos_path, dtype=np.float32, mode='r', shape=(total_filas, self.dimension))
+            return {h: matriz[fila].tolist() for h, fila in filas.items() if fila < total_filas}
+
+    def agregar(self, vectores: Dict[str, List[float]]):
+        """Anexa vectores nuevos al archivo de datos"""
+        if not vectores:
+            return
+        with self._lock, self._lock_archivo():
+            self._recargar_indice()
+            nuevos = [(h, v) for h, v in vectores.items() if h not in self.filas]
+            if not nuevos:
+                return
+            matriz = np.asarray([v for _, v in nuevos], dtype=np.float32)
+            if self.dimension is None:
+                self.dimension = int(matriz.shape[1])
+            # La fila siguiente sale del tamaño real del archivo, con el lock
+            # tomado; una cola parcial de una escritura interrumpida se trunca
+            # para que las filas nuevas queden alineadas
+            with open(self.datos_path, 'ab') as f:
+                tamano_fila = 4 * self.dimension
+                siguiente = f.seek(0, os.SEEK_END) // tamano_fila
+                if siguiente * tamano_fila != f.tell():
+                    f.truncate(siguiente * tamano_fila)
+                f.write(matriz.tobytes())
+            for i, (h, _) in enumerate(nuevos):
+                self.filas[h] = siguiente + i
+                self._nuevas[h] = siguiente + i
+
+    def guardar(self):
+        """Persiste el índice hash -> fila, fusionado con el de otros procesos"""
+        with self._lock:
+            if not self._nuevas:
+                return
+            with self._lock_archivo():
+                self._mtime_indice = None
+                self._recargar_indice()
+                self.filas.update(self._nuevas)
+                tmp_path = self.indice_path.with_suffix(f'.{os.getpid()}.tmp')
+                tmp_path.write_text(
+                    json.dumps({'dimension': self.dimension, 'filas': self.filas}),
+                    encoding='utf-8'
+                )
+                os.replace(tmp_path, self.indice_path)
+                self._mtime_indice = self.indice_path.stat().st_mtime_ns
+            self._nuevas = {}
+
+
+class EmbeddingsConCache(Embeddings):
+    """
+    Envoltorio de embeddings LangChain con cache por chunk y lotes concurrentes
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache: CacheEmbeddings,
+        tamano_lote: int = 100,
+        max_concurrencia: int = 4
+    ):
+        """
+        Args:
+            embeddings: Embeddings subyacentes (p. ej. VertexAIEmbeddings)
+            cache: Cache de vectores
+            tamano_lote: Textos por llamada a embed_documents
+            max_concurrencia: Lotes enviados en paralelo
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+        self.tamano_lote = max(1, int(tamano_lote))
+        self.max_concurrencia = max(1, int(max_concurrencia))
+        self._lock = threading.Lock()
+        self._stats = {'en_cache': 0, 'embebidos': 0, 'segundos_embedding': 0.0}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [hash_texto(t) for t in texts]
+        vectores = self.cache.obtener(hashes)
+
+        # Textos únicos que no están en cache
+        faltantes = {}
+        for h, t in zip(hashes, texts):
+            if h not in vectores and h not in faltantes:
+                faltantes[h] = t
+
+        inicio = time.perf_counter()
+        if faltantes:
+            items = list(faltantes.items())
+            lotes = [items[i:i + self.tamano_lote] for i in range(0, len(items), self.tamano_lote)]
+
+            def embeber(lote):
+                return self.embeddings.embed_documents([t for _, t in lote])
+
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrencia, len(lotes))) as executor:
+                for lote, resultado in zip(lotes, executor.map(embeber, lotes)):
+                    nuevos = {h: v for (h, _), v in zip(lote, resultado)}
+                    self.cache.agregar(nuevos)
+                    vectores.update(nuevos)
+            self.cache.guardar()
+        duracion = time.perf_counter() - inicio
+
+        with self._lock:
+            self._stats['en_cache'] += len(texts) - len(faltantes)
+            self._stats['embebidos'] += len(faltantes)
+            self._stats['segundos_embedding'] += duracion
+
+        return [vectores[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def embed_consultas(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embebe consultas en lotes concurrentes sin pasar por el cache
+
+        Las consultas (p. ej. el texto de cada sección para RAG) cambian con
+        cada contrato: guardarlas haría crecer el cache sin aciertos futuros.
+        """
+        lotes = [texts[i:i + self.tamano_lote] for i in range(0, len(texts), self.tamano_lote)]
+        if not lotes:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrencia, len(lotes))) as executor:
+            return [vector for resultado in executor.map(self.embeddings.embed_documents, lotes) for vector in resultado]
+
+    def estadisticas(self) -> Dict:
+        """Retorna chunks en cache, embebidos y throughput de embedding"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['chunks_por_segundo'] = (
+            stats['embebidos'] / stats['segundos_embedding']
+            if stats['segundos_embedding'] > 0 else 0.0
+        )
+        return stats
+
+
+class CacheDocumentos:
+    """
+    Cache en disco del texto extraído de documentos, por SHA-256 del archivo
+
+    Cada entrada son dos archivos: el texto de todas las páginas concatenado
+    en UTF-8 (.txt, se lee con mmap) y un índice JSON con los offsets en bytes
+    y la metadata de cada página. El tamaño total se acota desalojando las
+    entradas usadas hace más tiempo (LRU por fecha de modificación, válida
+    también entre procesos).
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Inicializa el cache
+
+        Args:
+            cache_dir: Directorio del cache
+            max_bytes: Tamaño máximo del cache en disco
+        """
+        self.directorio = Path(cache_dir) / "documentos"
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+
+    def _rutas(self, hash_contenido: str, extractor: str):
+        nombre = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{hash_contenido}_{extractor}")
+        return self.directorio / f"{nombre}.txt", self.directorio / f"{nombre}.json"
+
+    def obtener(self, hash_contenido: str, extractor: str, fuente: Optional[str] = None) -> Optional[List[Document]]:
+        """
+        Retorna los documentos por página guardados o None si no existen
+
+        Args:
+            hash_contenido: SHA-256 del archivo (ver hash_archivo)
+            extractor: Cargador que produjo el texto (p. ej. 'pypdf')
+            fuente: Ruta actual del archivo, para metadata['source']
+
+        Returns:
+            Documentos LangChain por página, en orden
+        """
+        texto_path, indice_path = self._rutas(hash_contenido, extractor)
+        try:
+            indice = json.loads(indice_path.read_text(encoding='utf-8'))
+            with open(texto_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size != indice['bytes']:
+                    raise ValueError("texto incompleto")
+                datos = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if indice['bytes'] else b""
+                try:
+                    documentos = []
+                    for (inicio, fin), metadata in zip(indice['offsets'], indice['metadata']):
+                        if fuente is not None and 'source' in metadata:
+                            metadata['source'] = fuente
+                        documentos.append(Document(page_content=datos[inicio:fin].decode('utf-8'), metadata=metadata))
+                finally:
+                    if indice['bytes']:
+                        datos.close()
+        except FileNotFoundError:
+            with self._lock:
+                self.fallos += 1
+            return None
+        except Exception as e:
+            print(f"Entrada inválida en cache de documentos, se descarta: {e}")
+            texto_path.unlink(missing_ok=True)
+            indice_path.unlink(missing_ok=True)
+            with self._lock:
+                self.fallos += 1
+            return None
+
+        # Marcar como usada recientemente para el desalojo LRU
+        ahora = time.time()
+        for ruta in (texto_path, indice_path):
+            with contextlib.suppress(OSError):
+                os.utime(ruta, (ahora, ahora))
+        with self._lock:
+            self.aciertos += 1
+        return documentos
+
+    def guardar(self, hash_contenido: str, extractor: str, documentos: List[Document]):
+        """
+        Guarda el texto y la metadata de los documentos por página
+
+        Args:
+            hash_contenido: SHA-256 del archivo
+            extractor: Cargador que produjo el texto
+            documentos: Documentos LangChain por página
+        """
+        texto_path, indice_path = self._rutas(hash_contenido, extractor)
+        offsets = []
+        partes = []
+        posicion = 0
+        for doc in documentos:
+            codificado = doc.page_content.encode('utf-8')
+            partes.append(codificado)
+            offsets.append((posicion, posicion + len(codificado)))
+            posicion += len(codificado)
+
+        indice = {
+            'bytes': posicion,
+            'offsets': offsets,
+            'metadata': [dict(doc.metadata) for doc in documentos]
+        }
+
+        # Escritura atómica; el índice se publica último y marca la entrada como válida
+        sufijo = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_texto = texto_path.with_name(texto_path.name + sufijo)
+        tmp_indice = indice_path.with_name(indice_path.name + sufijo)
+        try:
+            with open(tmp_texto, 'wb') as f:
+                f.writelines(partes)
+            tmp_indice.write_text(json.dumps(indice, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp_texto, texto_path)
+            os.replace(tmp_indice, indice_path)
+        except OSError as e:
+            print(f"No se pudo guardar en cache de documentos: {e}")
+            tmp_texto.unlink(missing_ok=True)
+            tmp_indice.unlink(missing_ok=True)
+            return
+
+        self.desalojar()
+
+    def desalojar(self):
+        """Elimina las entradas menos usadas recientemente si se excede max_bytes"""
+        entradas = {}
+        for ruta in self.directorio.iterdir():
+            if ruta.suffix not in ('.txt', '.json'):
+                continue
+            try:
+                estado = ruta.stat()
+            except OSError:
+                continue
+            entrada = entradas.setdefault(ruta.stem, {'bytes': 0, 'usado': 0.0, 'rutas': []})
+            entrada['bytes'] += estado.st_size
+            entrada['usado'] = max(entrada['usado'], estado.st_mtime)
+            entrada['rutas'].append(ruta)
+
+        total = sum(entrada['bytes'] for entrada in entradas.values())
+        for entrada in sorted(entradas.values(), key=lambda e: e['usado']):
+            if total <= self.max_bytes:
+                break
+            for ruta in entrada['rutas']:
+                ruta.unlink(missing_ok=True)
+            total -= entrada['bytes']
+
+    def estadisticas(self) -> Dict:
+        """Retorna contadores de aciertos y fallos"""
+        total = self.aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': (self.aciertos / total) if total else 0.0
+        }
@@ -0,0 +1,122 @@
+"""
+Clientes Module
+Cache de credenciales, inicialización de Vertex AI y procesadores por proceso
+
+Evita re-parsear la cuenta de servicio, re-inicializar Vertex AI y
+reconstruir los clientes de embeddings/LLM (con sus conexiones TLS) en cada
+análisis: se crean una vez por proceso y se reutilizan de forma segura entre
+hilos.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import google.auth.transport.requests
+import vertexai
+from google.oauth2 import service_account
+
+from contract_processor import ContractProcessor
+
+SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
+LOCATION = "us-central1"
+
+# Procesadores retenidos por proceso; cada combinación de opciones tiene sus
+# propios clientes, caches y conexiones SQLite
+MAX_PROCESADORES = 4
+
+_lock = threading.RLock()
+_credenciales: Dict[Tuple[str, str], service_account.Credentials] = {}
+_vertex_inicializado: Dict[Tuple[str, str], bool] = {}
+_procesadores: "OrderedDict[Tuple[Tuple[str, str], str], ContractProcessor]" = OrderedDict()
+
+
+def _identidad(credentials_info: Dict) -> Tuple[str, str]:
+    """Identifica una cuenta de servicio sin usar la clave privada como clave"""
+    return (credentials_info.get("client_email", ""), credentials_info.get("private_key_id", ""))
+
+
+def obtener_credenciales(credentials_info: Dict) -> service_account.Credentials:
+    """
+    Retorna credenciales cacheadas de la cuenta de servicio con token vigente
+
+    Args:
+        credentials_info: Diccionario de la cuenta de servicio
+
+    Returns:
+        Credenciales de Google Cloud
+    """
+    identidad = _identidad(credentials_info)
+    with _lock:
+        credentials = _credenciales.get(identidad)
+        if credentials is None:
+            credentials = service_account.Credentials.from_service_account_info(
+                credentials_info,
+                scopes=SCOPES
+            )
+            _credenciales[identidad] = credentials
+
+        # Refrescar bajo el lock para que los hilos no lo hagan a la vez
+        if not credentials.valid:
+            credentials.refresh(google.auth.transport.requests.Request())
+
+    return credentials
+
+
+def inicializar_vertexai(credentials_info: Dict) -> service_account.Credentials:
+    """
+    Inicializa Vertex AI una sola vez por proyecto en este proceso
+
+    Args:
+        credentials_info: Diccionario de la cuenta de servicio
+
+    Returns:
+        Credenciales usadas en la inicialización
+    """
+    credentials = obtener_credenciales(credentials_info)
+    project_id = credentials_info.get("project_id", "utec-478003")
+    with _lock:
+        if not _vertex_inicializado.get((project_id, LOCATION)):
+            vertexai.init(project=project_id, location=LOCATION, credentials=credentials)
+            _vertex_inicializado[(project_id, LOCATION)] = True
+    return credentials
+
+
+def obtener_procesador(credentials_info: Dict, **opciones) -> ContractProcessor:
+    """
+    Retorna un ContractProcessor reutilizable para la configuración dada
+
+    La clave incluye la cuenta de servicio y todas las opciones (flags
+    enable_*, concurrencia, caches), de modo que configuraciones distintas
+    no comparten clientes. Se retienen los MAX_PROCESADORES usados más
+    recientemente; los desalojados se cierran.
+
+    Args:
+        credentials_info: Diccionario de la cuenta de servicio
+        **opciones: Argumentos de ContractProcessor (sin credenciales)
+
+    Returns:
+        Procesador con clientes de Vertex AI ya construidos
+    """
+    credentials = inicializar_vertexai(credentials_info)
+    clave = (_identidad(credentials_info), json.dumps(opciones, sort_keys=True))
+    desalojados = []
+    with _lock:
+        processor = _procesadores.get(clave)
+        if processor is None:
+            processor = ContractProcessor(credentials=credentials, **opciones)
+            _procesadores[clave] = processor
+            while len(_procesadores) > MAX_PROCESADORES:
+                desalojados.append(_procesadores.popitem(last=False)[1])
+        else:
+            _procesadores.move_to_end(clave)
+
+    # Cada proceso trabajador ejecuta un análisis a la vez: los procesadores
+    # desalojados no están en uso
+    for desalojado in desalojados:
+        try:
+            desalojado.cerrar()
+        except Exception as e:
+            print(f"Error cerrando procesador desalojado: {e}")
+    return processor
@@ -4,25 +4,420 @@ Contiene la lógica principal de procesamiento de contratos de CONTRACTIA AI
 Adaptado del notebook original para uso en aplicación web
 """
 
+import contextlib
+import functools
+import itertools
+import json
 import os
 import re
-from typing import List, Dict, Tuple, Optional
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from pathlib import Path
 
+import numpy as np
+
 # LangChain imports
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_community.document_loaders import UnstructuredFileLoader
-from langchain_google_vertexai import VertexAIEmbeddings, ChatVertexAI
+from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
+from pypdf import PdfReader
+
+try:
+    # Normalización de metadatos que aplica PyPDFLoader (API interna de langchain)
+    from langchain_community.document_loaders.parsers.pdf import _purge_metadata
+except ImportError:
+    def _purge_metadata(metadata: Dict) -> Dict:
+        return {
+            clave.lstrip('/').lower(): valor if type(valor) in (str, int) else str(valor)
+            for clave, valor in metadata.items()
+        }
+
+from metricas import ContadorReintentosLLM, Metricas, medir_etapa
+from planificador import EmbeddingsPlanificados, obtener_planificador
+from proveedores import crear_proveedores
+from secciones import Seccion, crear_secciones
+from cache import (
+    CacheDocumentos,
+    CacheEmbeddings,
+    CacheHallazgos,
+    EmbeddingsConCache,
+    bloquear_archivo,
+    crear_directorio_privado,
+    hash_archivo,
+    hash_texto,
+    normalizar_para_hash,
+    ruta_privada
+)
+
+# Incrementar al modificar el prompt de coherencia: invalida el cache de hallazgos
+VERSION_PROMPT = "coherencia-v1"
+VERSION_PROMPT_LOTE = "coherencia-lote-v2"
+
+# Aproximación de caracteres por token para presupuestar prompts
+CARACTERES_POR_TOKEN = 4
+
+# Ventanas de secciones largas analizadas a la vez en toda una auditoría
+# (hilos adicionales a los de las secciones)
+MAX_VENTANAS_PARALELAS = 8
+
+# Patrones originales por tipo de sección, aplicados a cada línea tras strip()
+#   Capítulo: ^[ \t]*Capítulo[ \t]+([IVXLCDM]+)[ \t]+(.+?)$
+#   Anexo:    ^[ \t]*Anexo(?:s)?[ \t]+([IVXLCDM]+|\d+|[A-Z])[ \t]+(.+?)$
+#   Cláusula: ^[ \t]*Cláusula[ \t]+(\d+(?:\.\d+)*)[\.\s]+(.+?)$
+
+# Alternancia única equivalente a aplicar los tres patrones anteriores, en
+# orden, sobre cada línea tras strip(): el espacio inicial/final se consume
+# sin cruzar saltos de línea y el título debe terminar en un carácter visible.
+_CUERPO_SECCION = (
+    r"[^\S\n]*(?:"
+    r"Capítulo[ \t]+([IVXLCDM]+)[ \t]+(.*?\S)"
+    r"|Anexo(?:s)?[ \t]+([IVXLCDM]+|\d+|[A-Z])[ \t]+(.*?\S)"
+    r"|Cláusula[ \t]+(\d+(?:\.\d+)*)(?:\.|[^\S\n])+(.*?\S)"
+    r")[^\S\n]*$"
+)
+
+# Para una línea aislada (o la primera línea del texto)
+PATRON_SECCION = re.compile(r"^" + _CUERPO_SECCION, re.IGNORECASE | re.MULTILINE)
+
+# Para recorrer el texto completo con finditer: anclar en el "\n" literal
+# permite al motor saltar directamente entre saltos de línea
+PATRON_SECCION_TEXTO = re.compile(r"\n" + _CUERPO_SECCION, re.IGNORECASE | re.MULTILINE)
+
+# Tipo de sección según el último grupo capturado (el título) de PATRON_SECCION
+TIPOS_POR_GRUPO = {2: 'capitulo', 4: 'anexo', 6: 'clausula'}
+
+# Extensiones soportadas en la base de conocimiento
+EXTENSIONES_CONOCIMIENTO = ('.pdf', '.docx')
+
+# Serializa actualizaciones del índice persistido entre sesiones del mismo
+# proceso; entre procesos se usa además un lock de archivo (ver cache.bloquear_archivo)
+_LOCK_INDICE_CONOCIMIENTO = threading.Lock()
+
+# Patrón para detectar referencias cruzadas dentro de una sección
+PATRON_REFERENCIA = re.compile(
+    r'\b(Capítulo|Cláusula|Anexo|Artículo)\s+([IVXLCDM]+|\d+(?:\.\d+)*|[A-Z])\b',
+    re.IGNORECASE
+)
+
+# Tipo de sección al que apunta cada palabra clave de referencia. "Artículo"
+# no corresponde a ninguna sección segmentada (suele citar normas externas),
+# por lo que se resuelve contra cualquier tipo.
+TIPOS_REFERENCIA = {
+    'capítulo': 'capitulo',
+    'cláusula': 'clausula',
+    'anexo': 'anexo',
+    'artículo': None
+}
+
+
+class GrafoReferencias:
+    """
+    Grafo de referencias cruzadas entre secciones
+    
+    Mantiene un índice hash (tipo, numero) -> seccion_id para resolver cada
+    referencia en O(1), las aristas origen -> destino resueltas, las aristas
+    inversas para consultas "quién referencia a X" y las referencias rotas.
+    """
+    
+    def __init__(self, indices: Dict):
+        """
+        Args:
+            indices: Índices construidos (se usa indices['global'])
+        """
+        self.indice = {}
+        self.numeros = {}
+        for tipo, refs in indices['global'].items():
+            for numero in refs:
+                seccion_id = f"{tipo}_{numero}"
+                self.indice[(tipo, numero)] = seccion_id
+                self.numeros.setdefault(numero, seccion_id)
+        
+        self.salientes: Dict[str, List[str]] = {}
+        self.entrantes: Dict[str, List[str]] = {}
+        self.rotas: Dict[str, List[str]] = {}
+        self.referencias_por_seccion: List[List[Tuple[str, Optional[str]]]] = []
+        self.total_aristas = 0
+        self.total_rotas = 0
+    
+    def resolver(self, palabra_clave: str, numero: str) -> Optional[str]:
+        """
+        Resuelve una referencia a la sección destino
+        
+        Args:
+            palabra_clave: Capítulo, Cláusula, Anexo o Artículo (como aparece)
+            numero: Número referenciado
+            
+        Returns:
+            seccion_id destino o None si la referencia está rota
+        """
+        tipo = TIPOS_REFERENCIA.get(palabra_clave.lower())
+        if tipo is None:
+            return self.numeros.get(numero)
+        return self.indice.get((tipo, numero))
+    
+    def agregar_seccion(self, seccion: Dict):
+        """Extrae y resuelve las referencias de una sección"""
+        origen = f"{seccion['tipo']}_{seccion['numero']}"
+        referencias = []
+        
+        for palabra_clave, numero in PATRON_REFERENCIA.findall(seccion.get('contenido', '')):
+            destino = self.resolver(palabra_clave, numero)
+            referencias.append((numero, destino))
+            self.total_aristas += 1
+            
+            if destino is None:
+                self.total_rotas += 1
+                self.rotas.setdefault(origen, []).append(f"{palabra_clave} {numero}")
+            else:
+                self.salientes.setdefault(origen, []).append(destino)
+                self.entrantes.setdefault(destino, []).append(origen)
+        
+        self.referencias_por_seccion.append(referencias)
+    
+    def referenciada_por(self, seccion_id: str) -> List[str]:
+        """Secciones que referencian a seccion_id"""
+        return self.entrantes.get(seccion_id, [])
+    
+    def a_dict(self) -> Dict:
+        """Representación serializable del grafo"""
+        return {
+            'aristas': self.total_aristas,
+            'aristas_rotas': self.total_rotas,
+            'salientes': self.salientes,
+            'entrantes': self.entrantes,
+            'rotas': self.rotas
+        }
+
+# Sustituciones de un carácter de _norm_text: se eliminan BOM, retornos de
+# carro y guiones suaves; el espacio duro y el tabulador pasan a espacio y el
+# salto de página a salto de línea. Ningún reemplazo produce el carácter de
+# otro, así que el orden no altera el resultado.
+SUSTITUCIONES_NORMALIZACION = (
+    ("\ufeff", ""),
+    ("\r", ""),
+    ("\u00ad", ""),
+    ("\u00a0", " "),
+    ("\t", " "),
+    ("\f", "\n")
+)
+
+# Colapsos de _norm_text tras las sustituciones (ya sin tabuladores). Solo
+# coinciden con las rachas a reducir, no con cada espacio del texto.
+PATRON_ESPACIOS = re.compile(r" {2,}")
+PATRON_SALTOS = re.compile(r"\n{3,}")
+
+
+def _sustituir_caracteres(s: str) -> str:
+    """Sustituciones de un carácter de _norm_text"""
+    # Cada pasada se omite si el texto no contiene lo que reemplaza, lo que
+    # en texto extraído de PDF es el caso habitual para la mayoría
+    for original, reemplazo in SUSTITUCIONES_NORMALIZACION:
+        if original in s:
+            s = s.replace(original, reemplazo)
+    return s
+
+
+def _colapsar_blancos(s: str) -> str:
+    """Colapsos de espacios y saltos de línea de _norm_text"""
+    if "  " in s:
+        s = PATRON_ESPACIOS.sub(" ", s)
+    if "\n\n\n" in s:
+        s = PATRON_SALTOS.sub("\n\n", s)
+    return s
+
+
+def normalizar_texto(s: str) -> str:
+    """
+    Normaliza texto eliminando caracteres especiales
+    
+    Produce exactamente el resultado de la cadena de reemplazos original de
+    _norm_text, sin reescribir el texto en las pasadas que no cambian nada.
+    
+    Args:
+        s: Texto crudo
+        
+    Returns:
+        Texto normalizado
+    """
+    return _colapsar_blancos(_sustituir_caracteres(s)).strip()
+
+
+def normalizar_paginas(paginas: Iterable[str]) -> str:
+    """
+    Normaliza las páginas de un documento antes de unirlas
+    
+    Equivale a normalizar_texto("\n\n".join(paginas)) sin construir el texto
+    crudo completo.
+    
+    Args:
+        paginas: Texto crudo de cada página
+        
+    Returns:
+        Texto normalizado del documento
+    """
+    normalizador = NormalizadorIncremental()
+    partes = []
+    for i, pagina in enumerate(paginas):
+        if i > 0:
+            partes.append(normalizador.alimentar("\n\n"))
+        partes.append(normalizador.alimentar(pagina))
+    partes.append(normalizador.finalizar())
+    return "".join(partes)
+
+
+class NormalizadorIncremental:
+    """
+    Aplica la normalización de _norm_text por fragmentos
+    
+    Retiene el espacio en blanco final de cada fragmento hasta ver el
+    siguiente, para que los colapsos de espacios y saltos de línea que
+    cruzan fronteras den el mismo resultado que sobre el texto completo.
+    """
+    
+    def __init__(self):
+        self._pendiente = ""
+        self._inicio = True
+    
+    def alimentar(self, fragmento: str) -> str:
+        """
+        Normaliza un fragmento y retorna la parte ya definitiva
+        
+        Args:
+            fragmento: Texto crudo siguiente
+            
+        Returns:
+            Texto normalizado listo para emitir
+        """
+        texto = self._pendiente + _sustituir_caracteres(fragmento)
+        
+        corte = len(texto)
+        while corte > 0 and texto[corte - 1].isspace():
+            corte -= 1
+        
+        self._pendiente = texto[corte:]
+        if corte == 0:
+            return ""
+        
+        salida = _colapsar_blancos(texto[:corte])
+        if self._inicio:
+            salida = salida.lstrip()
+            self._inicio = False
+        return salida
+    
+    def finalizar(self) -> str:
+        """Cierra el flujo descartando el espacio final (equivale a strip)"""
+        self._pendiente = ""
+        return ""
+
+
+def cargar_documento(ruta: str) -> List:
+    """
+    Carga un documento normativo PDF o DOCX
+    
+    Función de módulo para poder ejecutarse en un pool de procesos.
+    
+    Args:
+        ruta: Ruta al documento
+        
+    Returns:
+        Lista de documentos LangChain (vacía si falla o no es soportado)
+    """
+    file_path = Path(ruta)
+    print(f"Cargando: {file_path.name}")
+    
+    try:
+        if file_path.suffix.lower() == '.pdf':
+            loader = PyPDFLoader(str(file_path))
+        elif file_path.suffix.lower() == '.docx':
+            loader = UnstructuredFileLoader(str(file_path))
+        else:
+            return []
+        
+        return loader.load()
+    except Exception as e:
+        print(f"Error cargando {file_path.name}: {e}")
+        return []
+
+
+def extraer_rango_paginas(ruta: str, inicio: int, fin: int) -> List[Document]:
+    """
+    Extrae el texto de las páginas [inicio, fin) de un PDF
+    
+    Produce los mismos documentos por página que PyPDFLoader para que el
+    resultado pueda concatenarse en orden desde varios procesos.
+    
+    Args:
+        ruta: Ruta al PDF
+        inicio: Primera página (base 0)
+        fin: Página final exclusiva
+        
+    Returns:
+        Lista de documentos, uno por página
+    """
+    reader = PdfReader(ruta)
+    # Metadatos del documento combinados como en PyPDFParser
+    metadata_documento = _purge_metadata(
+        {'producer': 'PyPDF', 'creator': 'PyPDF', 'creationdate': ''}
+        | dict(reader.metadata or {})
+        | {'source': ruta, 'total_pages': len(reader.pages)}
+    )
+    return [
+        Document(
+            page_content=reader.pages[i].extract_text().strip(),
+            metadata=metadata_documento | {'page': i, 'page_label': reader.page_labels[i]}
+        )
+        for i in range(inicio, fin)
+    ]
+
+
+class VectorstorePrecalculado:
+    """
+    Vista de un vectorstore con resultados de búsqueda ya calculados
+    
+    Responde similarity_search desde los resultados precalculados y recurre
+    al vectorstore real para consultas no previstas.
+    """
+    
+    def __init__(self, vectorstore: FAISS):
+        self.vectorstore = vectorstore
+        self.resultados: Dict[str, List[Document]] = {}
+    
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        if query in self.resultados and len(self.resultados[query]) >= k:
+            return self.resultados[query][:k]
+        return self.vectorstore.similarity_search(query, k=k)
+
 
 class ContractProcessor:
     """
     Procesador principal de contratos APP
     """
     
-    def __init__(self, credentials=None, enable_llm=True, enable_rag=False, enable_chat=False):
+    def __init__(
+        self,
+        credentials=None,
+        enable_llm=True,
+        enable_rag=False,
+        enable_chat=False,
+        max_concurrencia: int = 1,
+        cache_dir: Optional[str] = None,
+        tamano_lote_embeddings: int = 100,
+        max_concurrencia_embeddings: int = 4,
+        workers_carga: Optional[int] = None,
+        presupuesto_tokens_lote: int = 0,
+        tokens_ventana: int = 0,
+        solapamiento_ventana: int = 100,
+        proveedor: str = 'vertexai',
+        opciones_proveedor: Optional[Dict] = None,
+        limites_llm: Optional[Dict] = None,
+        limites_embeddings: Optional[Dict] = None
+    ):
         """
         Inicializa el procesador con configuraciones
         
@@ -31,37 +426,117 @@ class ContractProcessor:
             enable_llm: Habilitar uso de LLM para análisis
             enable_rag: Habilitar RAG avanzado
             enable_chat: Habilitar sistema de Q&A
+            max_concurrencia: Secciones auditadas en paralelo (1 = secuencial)
+            cache_dir: Directorio para caches persistentes (None = sin cache)
+            tamano_lote_embeddings: Chunks por llamada de embeddings
+            max_concurrencia_embeddings: Lotes de embeddings enviados en paralelo
+            workers_carga: Procesos para cargar documentos (None = núcleos disponibles)
+            presupuesto_tokens_lote: Tokens máximos por prompt al agrupar secciones
+                cortas en una sola llamada al LLM (0 = sin agrupar)
+            tokens_ventana: Tamaño de ventana para analizar secciones largas por
+                partes (0 = truncar a 4000 caracteres)
+            solapamiento_ventana: Tokens compartidos entre ventanas consecutivas
+            proveedor: Proveedor de LLM y embeddings ('vertexai' o 'local', ver proveedores.py)
+            opciones_proveedor: Opciones propias del proveedor (latencias, cuotas, ...)
+            limites_llm: Cuota y concurrencia del planificador del LLM (rpm, tpm,
+                concurrencia_max, ... ver planificador.PlanificadorLlamadas)
+            limites_embeddings: Cuota y concurrencia del planificador de embeddings
         """
         self.enable_llm = enable_llm
         self.enable_rag = enable_rag
         self.enable_chat = enable_chat
+        self.max_concurrencia = max(1, int(max_concurrencia))
+        self.cache_dir = cache_dir
+        self.workers_carga = workers_carga
+        self.presupuesto_tokens_lote = presupuesto_tokens_lote
+        self.tokens_ventana = tokens_ventana
+        self.solapamiento_ventana = solapamiento_ventana
+        
+        self.modelo_embeddings = "textembedding-gecko@latest"
+        self.modelo_llm = "gemini-2.0-flash-exp"
+        self.temperatura_llm = 0.1
         
-        # Inicializar embeddings y LLM (aproximadamente línea 39)
+        # Otros proveedores no comparten caches ni índices con Vertex AI
+        if proveedor != 'vertexai':
+            self.modelo_embeddings = f"{proveedor}/{self.modelo_embeddings}"
+            self.modelo_llm = f"{proveedor}/{self.modelo_llm}"
+        
+        # Tiempos por etapa, latencias y tokens del LLM
+        self.metricas = Metricas()
+        self._callbacks_llm = [ContadorReintentosLLM(self.metricas)]
+        
+        # Los caches incluyen un índice FAISS que se deserializa con pickle
+        if cache_dir:
+            crear_directorio_privado(cache_dir)
+        
+        # Cache de hallazgos del LLM
+        self.cache_hallazgos = CacheHallazgos(cache_dir) if cache_dir else None
+        
+        # Cache del texto extraído de contratos y documentos normativos
+        self.cache_documentos = CacheDocumentos(cache_dir) if cache_dir else None
+        
+        # Inicializar embeddings y LLM del proveedor configurado
         if enable_llm:
-            # 2. Pasa las credenciales a VertexAIEmbeddings
-            self.embeddings = VertexAIEmbeddings(
-                model_name="textembedding-gecko@latest",
-                credentials=credentials # <--- MODIFICACIÓN
+            self.embeddings, self.llm = crear_proveedores(
+                proveedor,
+                credentials=credentials,
+                modelo_embeddings=self.modelo_embeddings,
+                modelo_llm=self.modelo_llm,
+                temperatura=self.temperatura_llm,
+                **(opciones_proveedor or {})
             )
             
-            # 3. Pasa las credenciales a ChatVertexAI
-            self.llm = ChatVertexAI(
-                model_name="gemini-2.0-flash-exp",
-                temperature=0.1,
-                max_tokens=8192,
-                credentials=credentials # <--- MODIFICACIÓN
+            # Toda llamada pasa por planificadores compartidos por el proceso
+            # (cuota RPM/TPM, concurrencia adaptativa y reintentos)
+            self.planificador_llm = obtener_planificador(
+                f"llm:{self.modelo_llm}", 'llm', **(limites_llm or {})
+            )
+            self.planificador_embeddings = obtener_planificador(
+                f"embeddings:{self.modelo_embeddings}", 'embeddings', **(limites_embeddings or {})
             )
+            self.embeddings = EmbeddingsPlanificados(self.embeddings, self.planificador_embeddings, self.metricas)
+            
+            # Cache de embeddings por chunk con lotes concurrentes
+            if cache_dir:
+                self.embeddings = EmbeddingsConCache(
+                    self.embeddings,
+                    CacheEmbeddings(cache_dir, self.modelo_embeddings),
+                    tamano_lote=tamano_lote_embeddings,
+                    max_concurrencia=max_concurrencia_embeddings
+                )
         
         # Configuraciones
         self.chunk_size = 2000
         self.chunk_overlap = 200
+        self.paginas_por_rango = 50
+        
+        # Límite de llamadas simultáneas al LLM compartido entre procesos
+        # (p. ej. un semáforo de multiprocessing); sin límite por defecto
+        self.limitador_llm = contextlib.nullcontext()
+    
+    def cerrar(self):
+        """Persiste y libera los caches del procesador (no debe usarse después)"""
+        if isinstance(getattr(self, 'embeddings', None), EmbeddingsConCache):
+            self.embeddings.cache.guardar()
+        if self.cache_hallazgos is not None:
+            self.cache_hallazgos.cerrar()
         
-    def cargar_conocimiento(self, knowledge_dir: str) -> Optional[FAISS]:
+    @medir_etapa('cargar_conocimiento')
+    def cargar_conocimiento(
+        self,
+        knowledge_dir: str,
+        indice_dir: Optional[str] = None
+    ) -> Optional[FAISS]:
         """
         Carga documentos de la base de conocimiento y crea vectorstore
         
+        Si hay un directorio de índice (explícito o bajo cache_dir), el
+        vectorstore se persiste junto con un manifiesto de hashes y solo se
+        re-embeben los archivos nuevos o modificados.
+        
         Args:
             knowledge_dir: Directorio con documentos normativos
+            indice_dir: Directorio donde persistir el índice FAISS
             
         Returns:
             FAISS vectorstore o None
@@ -72,38 +547,36 @@ class ContractProcessor:
                 print("No se encontraron documentos de conocimiento")
                 return None
             
-            documentos_combinados = []
+            archivos = sorted(
+                file_path for file_path in knowledge_path.iterdir()
+                if file_path.is_file() and file_path.suffix.lower() in EXTENSIONES_CONOCIMIENTO
+            )
+            
+            if indice_dir is None and self.cache_dir:
+                indice_dir = str(Path(self.cache_dir) / "indice_conocimiento")
+            
+            if indice_dir and not self._indice_confiable(Path(indice_dir)):
+                print(f"❌ Índice de conocimiento en {indice_dir} con propietario o permisos inseguros; "
+                      "se construye en memoria sin cargarlo ni persistirlo")
+                indice_dir = None
+            
+            if indice_dir:
+                return self._actualizar_indice_conocimiento(archivos, Path(indice_dir))
             
-            for file_path in knowledge_path.iterdir():
-                if file_path.is_file():
-                    print(f"Cargando: {file_path.name}")
-                    
-                    try:
-                        if file_path.suffix.lower() == '.pdf':
-                            loader = PyPDFLoader(str(file_path))
-                        elif file_path.suffix.lower() == '.docx':
-                            loader = UnstructuredFileLoader(str(file_path))
-                        else:
-                            continue
-                        
-                        docs = loader.load()
-                        documentos_combinados.extend(docs)
-                    except Exception as e:
-                        print(f"Error cargando {file_path.name}: {e}")
+            documentos_combinados = []
+            for docs in self._cargar_documentos(archivos):
+                documentos_combinados.extend(docs)
             
             if not documentos_combinados:
                 return None
             
             # Dividir en chunks
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=self.chunk_size,
-                chunk_overlap=self.chunk_overlap
-            )
-            chunks = text_splitter.split_documents(documentos_combinados)
+            chunks = self._text_splitter().split_documents(documentos_combinados)
             
             # Crear vectorstore
             vectorstore = FAISS.from_documents(chunks, self.embeddings)
             print(f"✅ Base de conocimiento creada con {len(chunks)} chunks")
+            self._reportar_embeddings()
             
             return vectorstore
             
@@ -111,24 +584,239 @@ class ContractProcessor:
             print(f"Error cargando conocimiento: {e}")
             return None
     
-    def procesar_contrato(self, contrato_path: str) -> Tuple[Optional[List], Optional[str]]:
+    def _cargar_documentos(self, archivos: List[Path], hashes: Optional[Dict[str, str]] = None) -> List[List]:
+        """
+        Carga documentos normativos en paralelo con un pool de procesos
+        
+        Los documentos cuyo texto ya está en el cache de documentos no se
+        vuelven a extraer.
+        
+        Args:
+            archivos: Rutas de los documentos
+            hashes: SHA-256 ya calculados por nombre de archivo (opcional)
+            
+        Returns:
+            Lista de documentos por archivo, en el mismo orden de entrada
+        """
+        resultados: List[Optional[List]] = [None] * len(archivos)
+        hashes_archivos = [None] * len(archivos)
+        if self.cache_documentos:
+            for i, file_path in enumerate(archivos):
+                hashes_archivos[i] = (hashes or {}).get(file_path.name) or hash_archivo(str(file_path))
+                resultados[i] = self.cache_documentos.obtener(
+                    hashes_archivos[i], self._extractor_documento(file_path), str(file_path)
+                )
+            en_cache = sum(docs is not None for docs in resultados)
+            if en_cache:
+                print(f"✅ {en_cache} documentos recuperados del cache")
+        
+        pendientes = [i for i, docs in enumerate(resultados) if docs is None]
+        rutas = [str(archivos[i]) for i in pendientes]
+        cargados = None
+        workers = self.workers_carga or os.cpu_count() or 1
+        workers = min(workers, len(rutas))
+        
+        if workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    cargados = list(executor.map(cargar_documento, rutas))
+            except BrokenProcessPool as e:
+                print(f"Pool de carga interrumpido, se continúa en serie: {e}")
+        
+        if cargados is None:
+            cargados = [cargar_documento(ruta) for ruta in rutas]
+        
+        for i, docs in zip(pendientes, cargados):
+            resultados[i] = docs
+            # Los documentos que fallaron (lista vacía) se reintentan la próxima vez
+            if self.cache_documentos and docs:
+                self.cache_documentos.guardar(hashes_archivos[i], self._extractor_documento(archivos[i]), docs)
+        
+        return resultados
+    
+    @staticmethod
+    def _extractor_documento(file_path: Path) -> str:
+        """Cargador usado por cargar_documento según la extensión"""
+        return 'pypdf' if file_path.suffix.lower() == '.pdf' else 'unstructured'
+    
+    def _text_splitter(self) -> RecursiveCharacterTextSplitter:
+        """Crea el divisor de texto con la configuración de chunks"""
+        return RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap
+        )
+    
+    def _indice_confiable(self, indice_path: Path) -> bool:
+        """
+        Verifica que nadie más que el usuario actual pueda modificar el índice
+        
+        FAISS.load_local deserializa el docstore con pickle, así que un índice
+        escrito por otro usuario podría ejecutar código al cargarse.
+        
+        Args:
+            indice_path: Directorio del índice y su manifiesto
+            
+        Returns:
+            True si el directorio (o su ausencia) y sus archivos son privados
+        """
+        rutas = [indice_path] + [
+            indice_path / nombre for nombre in ("index.faiss", "index.pkl", "manifiesto.json")
+        ]
+        return all(ruta_privada(str(ruta)) for ruta in rutas if ruta.exists())
+    
+    def _actualizar_indice_conocimiento(self, archivos: List[Path], indice_path: Path) -> Optional[FAISS]:
+        """
+        Actualiza incrementalmente el índice FAISS persistido en disco
+        
+        Args:
+            archivos: Documentos normativos actuales
+            indice_path: Directorio del índice y su manifiesto
+            
+        Returns:
+            FAISS vectorstore o None si queda vacío
+        """
+        # Trabajos y procesos del lote comparten el índice: cargar, actualizar
+        # y persistir ocurre con el lock entre procesos tomado
+        crear_directorio_privado(str(indice_path.parent))
+        lock_path = indice_path.parent / f"{indice_path.name}.lock"
+        with _LOCK_INDICE_CONOCIMIENTO, bloquear_archivo(lock_path):
+            configuracion = {
+                'modelo_embeddings': self.modelo_embeddings,
+                'chunk_size': self.chunk_size,
+                'chunk_overlap': self.chunk_overlap
+            }
+            manifiesto_path = indice_path / "manifiesto.json"
+            
+            # Cargar índice previo solo si fue construido con la misma configuración
+            vectorstore = None
+            manifiesto = {'configuracion': configuracion, 'archivos': {}}
+            if manifiesto_path.exists() and (indice_path / "index.faiss").exists():
+                try:
+                    previo = json.loads(manifiesto_path.read_text(encoding='utf-8'))
+                    if previo.get('configuracion') == configuracion:
+                        vectorstore = FAISS.load_local(
+                            str(indice_path),
+                            self.embeddings,
+                            allow_dangerous_deserialization=True
+                        )
+                        # Un guardado interrumpido puede dejar índice y manifiesto desfasados
+                        ids_manifiesto = {
+                            id_chunk for entrada in previo['archivos'].values() for id_chunk in entrada['ids']
+                        }
+                        if ids_manifiesto != set(vectorstore.index_to_docstore_id.values()):
+                            raise ValueError("el índice no coincide con el manifiesto")
+                        manifiesto = previo
+                except Exception as e:
+                    print(f"Índice de conocimiento inválido, se reconstruye: {e}")
+                    vectorstore = None
+            
+            hashes_actuales = {file_path.name: hash_archivo(str(file_path)) for file_path in archivos}
+            registrados = manifiesto['archivos']
+            
+            # Evictar archivos eliminados o modificados
+            obsoletos = [
+                nombre for nombre, entrada in registrados.items()
+                if hashes_actuales.get(nombre) != entrada['hash']
+            ]
+            ids_obsoletos = [id_chunk for nombre in obsoletos for id_chunk in registrados[nombre]['ids']]
+            if vectorstore is not None and ids_obsoletos:
+                vectorstore.delete(ids_obsoletos)
+            for nombre in obsoletos:
+                del registrados[nombre]
+            
+            # Embeber solo archivos nuevos o modificados
+            chunks_nuevos = []
+            ids_nuevos = []
+            pendientes = [file_path for file_path in archivos if file_path.name not in registrados]
+            for file_path, docs in zip(pendientes, self._cargar_documentos(pendientes, hashes_actuales)):
+                if not docs:
+                    continue
+                
+                hash_actual = hashes_actuales[file_path.name]
+                chunks = self._text_splitter().split_documents(docs)
+                ids = [f"{file_path.name}:{hash_actual[:16]}:{i}" for i in range(len(chunks))]
+                chunks_nuevos.extend(chunks)
+                ids_nuevos.extend(ids)
+                registrados[file_path.name] = {'hash': hash_actual, 'ids': ids}
+            
+            if chunks_nuevos:
+                if vectorstore is None:
+                    vectorstore = FAISS.from_documents(chunks_nuevos, self.embeddings, ids=ids_nuevos)
+                else:
+                    vectorstore.add_documents(chunks_nuevos, ids=ids_nuevos)
+            
+            if vectorstore is None or vectorstore.index.ntotal == 0:
+                return None
+            
+            if not chunks_nuevos and not ids_obsoletos:
+                print(f"✅ Base de conocimiento sin cambios: {vectorstore.index.ntotal} chunks")
+                return vectorstore
+            
+            # Persistir índice y, después, el manifiesto de forma atómica
+            crear_directorio_privado(str(indice_path))
+            vectorstore.save_local(str(indice_path))
+            tmp_path = manifiesto_path.with_suffix(f'.{os.getpid()}.tmp')
+            tmp_path.write_text(json.dumps(manifiesto, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp_path, manifiesto_path)
+            
+            print(f"✅ Base de conocimiento actualizada: {len(chunks_nuevos)} chunks nuevos, "
+                  f"{len(ids_obsoletos)} eliminados, {vectorstore.index.ntotal} en total")
+            self._reportar_embeddings()
+            
+            return vectorstore
+    
+    def _reportar_embeddings(self):
+        """Imprime estadísticas del cache de embeddings (si está activo)"""
+        if isinstance(self.embeddings, EmbeddingsConCache):
+            stats = self.embeddings.estadisticas()
+            print(f"   - Embeddings: {stats['en_cache']} en cache, {stats['embebidos']} nuevos "
+                  f"({stats['chunks_por_segundo']:.1f} chunks/s)")
+    
+    @medir_etapa('procesar_contrato')
+    def procesar_contrato(
+        self,
+        contrato_path: str,
+        paralelo: Optional[bool] = None
+    ) -> Tuple[Optional[List], Optional[str]]:
         """
         Carga y procesa el contrato PDF
         
         Args:
             contrato_path: Ruta al archivo del contrato
+            paralelo: Extraer rangos de páginas en paralelo (None = automático
+                según el número de páginas)
             
         Returns:
-            (documentos, texto_completo) o (None, None)
+            (documentos, texto_completo) o (None, None); el texto completo
+            ya está normalizado (normalizar_texto es idempotente, así que
+            segmentar_contrato puede volver a normalizarlo sin cambios)
         """
         try:
-            loader = PyPDFLoader(contrato_path)
-            docs = loader.load()
+            docs = None
+            hash_contrato = None
+            if self.cache_documentos:
+                hash_contrato = hash_archivo(contrato_path)
+                docs = self.cache_documentos.obtener(hash_contrato, 'pypdf', contrato_path)
+            
+            if docs is not None:
+                print(f"✅ Texto del contrato recuperado del cache: {len(docs)} páginas")
+            else:
+                if paralelo is not False:
+                    docs = self._extraer_paginas_paralelo(contrato_path, forzar=bool(paralelo))
+                
+                if docs is None:
+                    loader = PyPDFLoader(contrato_path)
+                    docs = loader.load()
+                
+                # La extracción paralela produce los mismos documentos que PyPDFLoader
+                if hash_contrato and docs:
+                    self.cache_documentos.guardar(hash_contrato, 'pypdf', docs)
             
             if not docs:
                 return None, None
             
-            texto_completo = "\n\n".join([doc.page_content for doc in docs])
+            # Normalizar página a página antes de unir, sin el texto crudo completo
+            texto_completo = normalizar_paginas(doc.page_content for doc in docs)
             
             print(f"✅ Contrato cargado: {len(docs)} páginas")
             return docs, texto_completo
@@ -137,6 +825,42 @@ class ContractProcessor:
             print(f"Error procesando contrato: {e}")
             return None, None
     
+    def _extraer_paginas_paralelo(self, contrato_path: str, forzar: bool = False) -> Optional[List]:
+        """
+        Extrae el PDF por rangos de páginas en un pool de procesos
+        
+        Args:
+            contrato_path: Ruta al PDF
+            forzar: Usar el modo paralelo aunque el PDF sea pequeño
+            
+        Returns:
+            Documentos por página en orden, o None si no conviene paralelizar
+        """
+        total_paginas = len(PdfReader(contrato_path).pages)
+        workers = min(self.workers_carga or os.cpu_count() or 1, total_paginas)
+        
+        if workers <= 1 or (not forzar and total_paginas <= self.paginas_por_rango):
+            return None
+        
+        # Rangos contiguos [inicio, fin) de tamaño acotado
+        tamano = max(1, min(self.paginas_por_rango, -(-total_paginas // workers)))
+        rangos = [(inicio, min(inicio + tamano, total_paginas)) for inicio in range(0, total_paginas, tamano)]
+        
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                partes = executor.map(
+                    extraer_rango_paginas,
+                    [contrato_path] * len(rangos),
+                    [inicio for inicio, _ in rangos],
+                    [fin for _, fin in rangos]
+                )
+                # executor.map conserva el orden de los rangos
+                return [doc for parte in partes for doc in parte]
+        except Exception as e:
+            print(f"Extracción paralela interrumpida, se continúa en serie: {e}")
+            return None
+    
+    @medir_etapa('segmentar_contrato')
     def segmentar_contrato(self, texto_contrato: str) -> List[Dict]:
         """
         Segmenta el contrato en secciones estructuradas
@@ -145,80 +869,145 @@ class ContractProcessor:
             texto_contrato: Texto completo del contrato
             
         Returns:
-            Lista de secciones con metadata
+            Lista de secciones con metadata (vistas de solo lectura sobre el
+            texto normalizado; ver secciones.Seccion)
         """
         # Normalizar texto
         texto = self._norm_text(texto_contrato)
         
-        secciones = []
+        # Las secciones comparten el texto normalizado y guardan solo offsets
+        secciones = crear_secciones(texto, self._segmentar_offsets(texto))
         
-        # Patrones para detectar secciones
-        patron_capitulo = re.compile(
-            r"^[ \t]*Capítulo[ \t]+([IVXLCDM]+)[ \t]+(.+?)$",
-            re.IGNORECASE | re.MULTILINE
-        )
+        print(f"✅ Contrato segmentado en {len(secciones)} secciones")
+        return secciones
+    
+    def _segmentar_offsets(self, texto: str) -> List[Tuple[str, str, str, int, int, int]]:
+        """
+        Detecta secciones en una sola pasada de PATRON_SECCION sobre el texto
         
-        patron_anexo = re.compile(
-            r"^[ \t]*Anexo(?:s)?[ \t]+([IVXLCDM]+|\d+|[A-Z])[ \t]+(.+?)$",
-            re.IGNORECASE | re.MULTILINE
-        )
+        Args:
+            texto: Texto normalizado
+            
+        Returns:
+            Tuplas (tipo, numero, titulo, linea_inicio, inicio, fin) donde
+            texto[inicio:fin] es el contenido de la sección
+        """
+        limites = []
+        actual = None
+        linea = 0
+        posicion = 0
         
-        patron_clausula = re.compile(
-            r"^[ \t]*Cláusula[ \t]+(\d+(?:\.\d+)*)[\.\s]+(.+?)$",
-            re.IGNORECASE | re.MULTILINE
-        )
+        primera = PATRON_SECCION.match(texto)
+        coincidencias = PATRON_SECCION_TEXTO.finditer(texto)
+        if primera:
+            coincidencias = itertools.chain([primera], coincidencias)
+        
+        for match in coincidencias:
+            tipo = TIPOS_POR_GRUPO[match.lastindex]
+            # Inicio de la línea del encabezado (tras el "\n" consumido)
+            inicio_linea = match.start() + (match is not primera)
+            linea += texto.count('\n', posicion, inicio_linea)
+            posicion = inicio_linea
+            
+            # Una cláusula no cierra otra cláusula abierta (se reemplaza)
+            if actual and not (tipo == 'clausula' and actual[0] == 'clausula'):
+                limites.append(actual + (inicio_linea - 1,))
+            
+            actual = (
+                tipo,
+                match.group(match.lastindex - 1),
+                match.group(match.lastindex).strip(),
+                linea,
+                match.end() + 1
+            )
+        
+        if actual:
+            limites.append(actual + (len(texto),))
+        
+        return limites
+    
+    def segmentar_contrato_stream(self, paginas: Iterable[str]) -> Iterator[Dict]:
+        """
+        Segmenta el contrato en streaming a partir de sus páginas
+        
+        Las páginas se normalizan incrementalmente y cada sección se emite
+        en cuanto se conoce su final, de modo que la memoria queda acotada
+        por la sección más grande. Produce las mismas secciones que
+        segmentar_contrato sobre el texto unido con "\n\n".
+        
+        Args:
+            paginas: Iterable con el texto de cada página
+            
+        Yields:
+            Secciones con metadata
+        """
+        normalizador = NormalizadorIncremental()
+        
+        def fragmentos():
+            for i, pagina in enumerate(paginas):
+                if i > 0:
+                    yield normalizador.alimentar("\n\n")
+                yield normalizador.alimentar(pagina)
+            yield normalizador.finalizar()
+        
+        def lineas():
+            resto = ""
+            for fragmento in fragmentos():
+                if not fragmento:
+                    continue
+                partes = (resto + fragmento).split('\n')
+                resto = partes.pop()
+                yield from partes
+            yield resto
+        
+        total = 0
+        for seccion in self._segmentar_lineas(lineas()):
+            total += 1
+            yield seccion
+        
+        print(f"✅ Contrato segmentado en {total} secciones")
+    
+    def paginas_contrato(self, contrato_path: str) -> Iterator[str]:
+        """
+        Itera perezosamente el texto de las páginas del contrato
+        
+        Args:
+            contrato_path: Ruta al PDF
+            
+        Yields:
+            Texto de cada página
+        """
+        for doc in PyPDFLoader(contrato_path).lazy_load():
+            yield doc.page_content
+    
+    def _segmentar_lineas(self, lineas: Iterable[str]) -> Iterator[Dict]:
+        """
+        Detecta capítulos, anexos y cláusulas línea a línea
         
-        # Encontrar todas las secciones
-        lineas = texto.split('\n')
+        Args:
+            lineas: Líneas del texto normalizado
+            
+        Yields:
+            Secciones en cuanto se conoce su final
+        """
         seccion_actual = None
         contenido_actual = []
         
         for i, linea in enumerate(lineas):
-            linea_limpia = linea.strip()
-            
-            # Detectar capítulo
-            match_cap = patron_capitulo.match(linea_limpia)
-            if match_cap:
-                if seccion_actual:
-                    seccion_actual['contenido'] = '\n'.join(contenido_actual)
-                    secciones.append(seccion_actual)
-                
-                seccion_actual = {
-                    'tipo': 'capitulo',
-                    'numero': match_cap.group(1),
-                    'titulo': match_cap.group(2).strip(),
-                    'linea_inicio': i
-                }
-                contenido_actual = []
-                continue
-            
-            # Detectar anexo
-            match_anexo = patron_anexo.match(linea_limpia)
-            if match_anexo:
-                if seccion_actual:
-                    seccion_actual['contenido'] = '\n'.join(contenido_actual)
-                    secciones.append(seccion_actual)
+            # Detectar capítulo, anexo o cláusula
+            match = PATRON_SECCION.match(linea)
+            if match:
+                tipo = TIPOS_POR_GRUPO[match.lastindex]
                 
-                seccion_actual = {
-                    'tipo': 'anexo',
-                    'numero': match_anexo.group(1),
-                    'titulo': match_anexo.group(2).strip(),
-                    'linea_inicio': i
-                }
-                contenido_actual = []
-                continue
-            
-            # Detectar cláusula
-            match_clausula = patron_clausula.match(linea_limpia)
-            if match_clausula:
-                if seccion_actual and seccion_actual['tipo'] != 'clausula':
+                # Una cláusula no cierra otra cláusula abierta (se reemplaza)
+                if seccion_actual and not (tipo == 'clausula' and seccion_actual['tipo'] == 'clausula'):
                     seccion_actual['contenido'] = '\n'.join(contenido_actual)
-                    secciones.append(seccion_actual)
+                    yield seccion_actual
                 
                 seccion_actual = {
-                    'tipo': 'clausula',
-                    'numero': match_clausula.group(1),
-                    'titulo': match_clausula.group(2).strip(),
+                    'tipo': tipo,
+                    'numero': match.group(match.lastindex - 1),
+                    'titulo': match.group(match.lastindex).strip(),
                     'linea_inicio': i
                 }
                 contenido_actual = []
@@ -231,11 +1020,9 @@ class ContractProcessor:
         # Agregar última sección
         if seccion_actual:
             seccion_actual['contenido'] = '\n'.join(contenido_actual)
-            secciones.append(seccion_actual)
-        
-        print(f"✅ Contrato segmentado en {len(secciones)} secciones")
-        return secciones
+            yield seccion_actual
     
+    @medir_etapa('construir_indices')
     def construir_indices(self, secciones: List[Dict]) -> Dict:
         """
         Construye índices de secciones, global y local
@@ -255,14 +1042,17 @@ class ContractProcessor:
             numero = seccion['numero']
             titulo = seccion['titulo']
             
-            # Índice de secciones
+            # Índice de secciones (las vistas compactas se reutilizan sin copiar el contenido)
             clave = f"{tipo}_{numero}"
-            indice_secciones[clave] = {
-                'tipo': tipo,
-                'numero': numero,
-                'titulo': titulo,
-                'contenido': seccion.get('contenido', '')
-            }
+            if isinstance(seccion, Seccion):
+                indice_secciones[clave] = seccion
+            else:
+                indice_secciones[clave] = {
+                    'tipo': tipo,
+                    'numero': numero,
+                    'titulo': titulo,
+                    'contenido': seccion.get('contenido', '')
+                }
             
             # Índice global (por tipo y número)
             if tipo not in indice_global:
@@ -289,19 +1079,50 @@ class ContractProcessor:
         print(f"✅ Índices construidos: {len(indice_secciones)} secciones")
         return indices
     
-    def auditar_contrato(
-        self,
-        secciones: List[Dict],
-        indices: Dict,
-        vectorstore_conocimiento: Optional[FAISS] = None
-    ) -> Dict:
+    def construir_grafo_referencias(self, secciones: List[Dict], indices: Dict) -> GrafoReferencias:
         """
-        Realiza auditoría completa del contrato
+        Construye el grafo de referencias en una sola pasada por las secciones
+        
+        Args:
+            secciones: Secciones del contrato
+            indices: Índices construidos
+            
+        Returns:
+            GrafoReferencias con las referencias resueltas
+        """
+        grafo = GrafoReferencias(indices)
+        for seccion in secciones:
+            grafo.agregar_seccion(seccion)
+        
+        print(f"✅ Grafo de referencias: {grafo.total_aristas} referencias, {grafo.total_rotas} rotas")
+        return grafo
+    
+    @medir_etapa('auditar_contrato')
+    def auditar_contrato(
+        self,
+        secciones: List[Dict],
+        indices: Dict,
+        vectorstore_conocimiento: Optional[FAISS] = None,
+        max_concurrencia: Optional[int] = None,
+        revision_previa: Optional[Dict] = None,
+        progreso: Optional[Callable[[int, int], None]] = None
+    ) -> Dict:
+        """
+        Realiza auditoría completa del contrato
+        
+        Con revision_previa (el bloque resultados['revision'] de la auditoría
+        de una versión anterior) solo se revalidan con LLM las secciones
+        modificadas y las que las referencian; el resto reutiliza sus hallazgos.
         
         Args:
             secciones: Secciones del contrato
             indices: Índices construidos
             vectorstore_conocimiento: Base de conocimiento (opcional)
+            max_concurrencia: Secciones auditadas en paralelo
+                (por defecto self.max_concurrencia)
+            revision_previa: Huellas y hallazgos LLM de la versión anterior
+            progreso: Función llamada con (tareas completadas, total) al
+                terminar cada sección o lote
             
         Returns:
             Resultados de auditoría
@@ -311,103 +1132,891 @@ class ContractProcessor:
             'referencias_rotas': 0,
             'hallazgos_consistencia': [],
             'hallazgos_por_seccion': {},
-            'total_secciones': len(secciones)
+            'total_secciones': len(secciones),
+            'secciones_con_error': []
         }
         
-        # Patrón para detectar referencias
-        patron_ref = re.compile(
-            r'\b(?:Capítulo|Cláusula|Anexo|Artículo)\s+([IVXLCDM]+|\d+(?:\.\d+)*|[A-Z])\b',
-            re.IGNORECASE
-        )
+        if max_concurrencia is None:
+            max_concurrencia = self.max_concurrencia
+        max_concurrencia = max(1, int(max_concurrencia))
         
-        for seccion in secciones:
-            contenido = seccion.get('contenido', '')
-            seccion_id = f"{seccion['tipo']}_{seccion['numero']}"
+        if self.cache_hallazgos is not None:
+            cache_inicial = self.cache_hallazgos.estadisticas()
+        
+        grafo = self.construir_grafo_referencias(secciones, indices)
+        
+        # Hallazgos LLM reutilizables de la versión anterior del contrato
+        claves_revision = self._claves_revision(secciones)
+        huellas = [self._huella_seccion(seccion) for seccion in secciones]
+        configuracion_revision = self._configuracion_revision(vectorstore_conocimiento)
+        reutilizados = {}
+        if revision_previa and self.enable_llm:
+            reutilizados = self._hallazgos_reutilizables(
+                claves_revision, huellas, grafo, revision_previa, configuracion_revision
+            )
+        
+        # Recuperación RAG por lotes antes de validar (y de agrupar, porque
+        # el contexto recuperado ocupa parte del presupuesto de cada lote)
+        if self.enable_llm and self.enable_rag and vectorstore_conocimiento is not None:
+            vectorstore_conocimiento = self._precalcular_contextos(
+                secciones, vectorstore_conocimiento, omitir=reutilizados
+            )
+        
+        # Secciones cortas agrupadas en lotes (una llamada al LLM por lote)
+        lotes = self._agrupar_en_lotes(
+            secciones, omitir=reutilizados, vectorstore=vectorstore_conocimiento
+        ) if self.enable_llm else []
+        en_lote = {posicion for lote in lotes for posicion in lote}
+        
+        with contextlib.ExitStack() as pilas:
+            # Pool único para las ventanas de todas las secciones largas: las
+            # ventanas de una sección corren en paralelo aun con secciones
+            # secuenciales, y el total de hilos queda acotado
+            pool_ventanas = None
+            if self.enable_llm and self.tokens_ventana > 0:
+                pool_ventanas = pilas.enter_context(
+                    ThreadPoolExecutor(max_workers=max(max_concurrencia, MAX_VENTANAS_PARALELAS))
+                )
             
-            # Buscar referencias en el contenido
-            referencias = patron_ref.findall(contenido)
-            resultados['total_referencias'] += len(referencias)
+            tareas = [
+                functools.partial(
+                    self._auditar_seccion,
+                    secciones[posicion],
+                    grafo.referencias_por_seccion[posicion],
+                    vectorstore_conocimiento,
+                    validar_llm=posicion not in en_lote and posicion not in reutilizados,
+                    pool_ventanas=pool_ventanas
+                )
+                for posicion in range(len(secciones))
+            ]
+            tareas += [
+                functools.partial(self._validar_lote, [secciones[posicion] for posicion in lote], vectorstore_conocimiento)
+                for lote in lotes
+            ]
             
-            hallazgos_seccion = []
+            completadas = itertools.count(1)
+            total_tareas = len(tareas)
+            lock_progreso = threading.Lock()
             
-            # Validar cada referencia
-            for ref_num in referencias:
-                # Buscar en índice global
-                encontrada = False
-                for tipo, refs in indices['global'].items():
-                    if ref_num in refs:
-                        encontrada = True
-                        break
-                
-                if not encontrada:
-                    resultados['referencias_rotas'] += 1
-                    hallazgos_seccion.append({
-                        'tipo': 'referencia_rota',
-                        'descripcion': f'Referencia no encontrada: {ref_num}',
-                        'ubicacion': seccion_id,
-                        'severidad': 'alta'
-                    })
-            
-            # Validación de coherencia con LLM (si está habilitado)
-            if self.enable_llm and len(contenido) > 100:
-                try:
-                    hallazgos_llm = self._validar_coherencia_llm(
-                        contenido=contenido,
-                        seccion_id=seccion_id,
-                        vectorstore=vectorstore_conocimiento
+            def ejecutar(tarea):
+                salida = tarea()
+                if progreso is not None:
+                    with lock_progreso:
+                        try:
+                            progreso(next(completadas), total_tareas)
+                        except Exception as e:
+                            print(f"Error reportando avance de la auditoría: {e}")
+                return salida
+            
+            def ejecutar_todas(lista):
+                # executor.map conserva el orden de entrada, así el resultado es
+                # determinístico aunque las secciones terminen en otro orden
+                if max_concurrencia > 1 and len(lista) > 1:
+                    with ThreadPoolExecutor(max_workers=max_concurrencia) as executor:
+                        return list(executor.map(ejecutar, lista))
+                return [ejecutar(tarea) for tarea in lista]
+            
+            salidas = ejecutar_todas(tareas)
+            
+            # Las secciones que la respuesta de su lote no cubrió (salida
+            # truncada, sección omitida por el modelo) se validan individualmente
+            # en lugar de darse por limpias
+            sin_respuesta = [
+                posicion
+                for lote, (hallazgos_lote, error) in zip(lotes, salidas[len(secciones):])
+                if error is None
+                for posicion in lote
+                if salidas[posicion]['seccion_id'] not in hallazgos_lote
+            ]
+            if sin_respuesta:
+                print(f"Secciones sin respuesta en su lote, se validan individualmente: {len(sin_respuesta)}")
+                total_tareas += len(sin_respuesta)
+                revalidadas = ejecutar_todas([
+                    functools.partial(
+                        self._auditar_seccion,
+                        secciones[posicion],
+                        grafo.referencias_por_seccion[posicion],
+                        vectorstore_conocimiento,
+                        pool_ventanas=pool_ventanas
                     )
-                    hallazgos_seccion.extend(hallazgos_llm)
-                except Exception as e:
-                    print(f"Error en validación LLM para {seccion_id}: {e}")
+                    for posicion in sin_respuesta
+                ])
+                for posicion, salida in zip(sin_respuesta, revalidadas):
+                    salidas[posicion] = salida
+        
+        resultados_secciones = salidas[:len(secciones)]
+        for lote, (hallazgos_lote, error) in zip(lotes, salidas[len(secciones):]):
+            for posicion in lote:
+                resultado_seccion = resultados_secciones[posicion]
+                if resultado_seccion['seccion_id'] in hallazgos_lote:
+                    resultado_seccion['hallazgos'].extend(hallazgos_lote[resultado_seccion['seccion_id']])
+                    resultado_seccion['hallazgos_llm'].extend(hallazgos_lote[resultado_seccion['seccion_id']])
+                elif error is not None:
+                    resultado_seccion['error'] = error
+        
+        for posicion, hallazgos_previos in reutilizados.items():
+            resultados_secciones[posicion]['hallazgos'].extend(hallazgos_previos)
+            resultados_secciones[posicion]['hallazgos_llm'].extend(hallazgos_previos)
+        
+        if lotes:
+            resultados['lotes_llm'] = {'lotes': len(lotes), 'secciones': len(en_lote)}
+        
+        # Estado para auditar incrementalmente la próxima versión
+        resultados['revision'] = {
+            'version_prompt': VERSION_PROMPT,
+            'modelo': self.modelo_llm,
+            'configuracion': configuracion_revision,
+            # Las secciones con error no dejan huella: se revalidan la próxima vez
+            'huellas': {
+                clave: huella
+                for clave, huella, resultado_seccion in zip(claves_revision, huellas, resultados_secciones)
+                if not resultado_seccion['error']
+            },
+            'hallazgos_llm': {
+                clave: resultado_seccion['hallazgos_llm']
+                for clave, resultado_seccion in zip(claves_revision, resultados_secciones)
+                if resultado_seccion['hallazgos_llm'] and not resultado_seccion['error']
+            }
+        }
+        if revision_previa:
+            resultados['reauditoria'] = {
+                'secciones_reutilizadas': [resultados_secciones[posicion]['seccion_id'] for posicion in sorted(reutilizados)],
+                'secciones_revalidadas': [
+                    resultado_seccion['seccion_id']
+                    for posicion, resultado_seccion in enumerate(resultados_secciones)
+                    if posicion not in reutilizados and len(secciones[posicion].get('contenido', '')) > 100
+                ]
+            }
+        
+        for resultado_seccion in resultados_secciones:
+            seccion_id = resultado_seccion['seccion_id']
+            hallazgos_seccion = resultado_seccion['hallazgos']
+            
+            resultados['total_referencias'] += resultado_seccion['total_referencias']
+            resultados['referencias_rotas'] += resultado_seccion['referencias_rotas']
+            if resultado_seccion['error']:
+                resultados['secciones_con_error'].append(seccion_id)
             
             if hallazgos_seccion:
                 resultados['hallazgos_por_seccion'][seccion_id] = hallazgos_seccion
                 resultados['hallazgos_consistencia'].extend(hallazgos_seccion)
         
+        resultados['grafo_referencias'] = grafo.a_dict()
+        
+        if self.cache_hallazgos is not None:
+            cache_final = self.cache_hallazgos.estadisticas()
+            aciertos = cache_final['aciertos'] - cache_inicial['aciertos']
+            fallos = cache_final['fallos'] - cache_inicial['fallos']
+            resultados['cache_llm'] = {
+                'aciertos': aciertos,
+                'fallos': fallos,
+                'tasa_aciertos': (aciertos / (aciertos + fallos)) if (aciertos + fallos) else 0.0
+            }
+        
         print(f"✅ Auditoría completada:")
         print(f"   - Referencias totales: {resultados['total_referencias']}")
         print(f"   - Referencias rotas: {resultados['referencias_rotas']}")
         print(f"   - Hallazgos: {len(resultados['hallazgos_consistencia'])}")
+        if resultados['secciones_con_error']:
+            print(f"   - Secciones con error LLM: {len(resultados['secciones_con_error'])}")
+        if 'cache_llm' in resultados:
+            print(f"   - Cache LLM: {resultados['cache_llm']['aciertos']} aciertos, "
+                  f"{resultados['cache_llm']['fallos']} fallos")
+        if 'reauditoria' in resultados:
+            print(f"   - Reauditoría: {len(resultados['reauditoria']['secciones_reutilizadas'])} secciones reutilizadas, "
+                  f"{len(resultados['reauditoria']['secciones_revalidadas'])} revalidadas")
+        if 'lotes_llm' in resultados:
+            print(f"   - Lotes LLM: {resultados['lotes_llm']['secciones']} secciones "
+                  f"en {resultados['lotes_llm']['lotes']} llamadas")
+        planificador_llm = self.metricas.a_dict()['planificador'].get('llm')
+        if planificador_llm and (planificador_llm['reintentos'] or planificador_llm['limitaciones']):
+            print(f"   - Planificador LLM: {planificador_llm['reintentos']} reintentos, "
+                  f"{planificador_llm['limitaciones']} limitaciones por cuota (429)")
         
         return resultados
     
+    def _claves_revision(self, secciones: List[Dict]) -> List[str]:
+        """
+        Claves estables de cada sección entre versiones del contrato
+        
+        Es el seccion_id, con sufijo "#n" para apariciones repetidas.
+        """
+        claves = []
+        apariciones = {}
+        for seccion in secciones:
+            seccion_id = f"{seccion['tipo']}_{seccion['numero']}"
+            apariciones[seccion_id] = apariciones.get(seccion_id, 0) + 1
+            n = apariciones[seccion_id]
+            claves.append(seccion_id if n == 1 else f"{seccion_id}#{n}")
+        return claves
+    
+    def _huella_seccion(self, seccion: Dict) -> str:
+        """Hash del título y contenido normalizados de una sección"""
+        return hash_texto(normalizar_para_hash(
+            f"{seccion['tipo']}\x1f{seccion['numero']}\x1f{seccion['titulo']}\x1f{seccion.get('contenido', '')}"
+        ))
+    
+    def _configuracion_revision(self, vectorstore: Optional[FAISS] = None) -> Dict:
+        """
+        Opciones de la auditoría que cambian los hallazgos LLM de una sección
+        
+        Args:
+            vectorstore: Base de conocimiento usada para RAG
+            
+        Returns:
+            Diccionario serializable a JSON, comparable entre revisiones
+        """
+        usa_rag = bool(self.enable_rag and vectorstore is not None)
+        return {
+            'enable_rag': usa_rag,
+            'conocimiento': self._huella_conocimiento(vectorstore) if usa_rag else None,
+            'tokens_ventana': self.tokens_ventana,
+            'solapamiento_ventana': self.solapamiento_ventana,
+            'presupuesto_tokens_lote': self.presupuesto_tokens_lote,
+            'version_prompt_lote': VERSION_PROMPT_LOTE
+        }
+    
+    def _huella_conocimiento(self, vectorstore: FAISS) -> str:
+        """Hash de los chunks de la base de conocimiento (independiente del orden)"""
+        docstore = getattr(vectorstore, 'docstore', None)
+        if docstore is None:
+            return ""
+        huellas_chunks = []
+        for id_chunk in vectorstore.index_to_docstore_id.values():
+            documento = docstore.search(id_chunk)
+            contenido = getattr(documento, 'page_content', '')
+            fuente = getattr(documento, 'metadata', {}).get('source', '')
+            huellas_chunks.append(hash_texto(f"{fuente}\x1f{contenido}"))
+        return hash_texto("\n".join(sorted(huellas_chunks)))
+    
+    def _hallazgos_reutilizables(
+        self,
+        claves: List[str],
+        huellas: List[str],
+        grafo: GrafoReferencias,
+        revision_previa: Dict,
+        configuracion: Optional[Dict] = None
+    ) -> Dict[int, List[Dict]]:
+        """
+        Determina qué secciones conservan los hallazgos LLM de la versión anterior
+        
+        Se revalidan las secciones nuevas o modificadas y las que referencian
+        a una sección modificada o eliminada; si cambió el prompt, el modelo
+        o la configuración de la auditoría (RAG, base de conocimiento,
+        ventanas o lotes) se revalida todo.
+        
+        Args:
+            claves: Claves de revisión por posición
+            huellas: Huellas actuales por posición
+            grafo: Grafo de referencias de la versión actual
+            revision_previa: Bloque 'revision' de la auditoría anterior
+            configuracion: Configuración actual (ver _configuracion_revision)
+            
+        Returns:
+            Hallazgos LLM previos por posición de las secciones reutilizables
+        """
+        if configuracion is None:
+            configuracion = self._configuracion_revision()
+        if (revision_previa.get('version_prompt') != VERSION_PROMPT
+                or revision_previa.get('modelo') != self.modelo_llm
+                or revision_previa.get('configuracion') != configuracion):
+            return {}
+        
+        huellas_previas = revision_previa.get('huellas', {})
+        hallazgos_previos = revision_previa.get('hallazgos_llm', {})
+        
+        modificadas = {
+            clave.split('#')[0]
+            for clave, huella in zip(claves, huellas)
+            if huellas_previas.get(clave) != huella
+        }
+        eliminadas = {clave.split('#')[0] for clave in set(huellas_previas) - set(claves)}
+        afectadas = modificadas | eliminadas
+        
+        reutilizables = {}
+        for posicion, (clave, huella) in enumerate(zip(claves, huellas)):
+            seccion_id = clave.split('#')[0]
+            if seccion_id in afectadas:
+                continue
+            if any(destino in afectadas for destino in grafo.salientes.get(seccion_id, [])):
+                continue
+            # Una referencia rota puede apuntar a una sección recién eliminada
+            if eliminadas and seccion_id in grafo.rotas:
+                continue
+            reutilizables[posicion] = hallazgos_previos.get(clave, [])
+        
+        return reutilizables
+    
+    def _auditar_seccion(
+        self,
+        seccion: Dict,
+        referencias: List[Tuple[str, Optional[str]]],
+        vectorstore: Optional[FAISS] = None,
+        validar_llm: bool = True,
+        pool_ventanas: Optional[ThreadPoolExecutor] = None
+    ) -> Dict:
+        """
+        Audita una sección: referencias cruzadas y coherencia con LLM
+        
+        Args:
+            seccion: Sección del contrato
+            referencias: Referencias (numero, destino) ya resueltas por el grafo
+            vectorstore: Base de conocimiento para RAG
+            validar_llm: Validar coherencia aquí (False si la sección va en un lote)
+            pool_ventanas: Pool compartido para las ventanas de secciones largas
+            
+        Returns:
+            Diccionario con seccion_id, hallazgos, contadores y error
+        """
+        contenido = seccion.get('contenido', '')
+        seccion_id = f"{seccion['tipo']}_{seccion['numero']}"
+        referencias_rotas = 0
+        
+        hallazgos_seccion = []
+        
+        # Reportar referencias sin destino
+        for ref_num, destino in referencias:
+            if destino is None:
+                referencias_rotas += 1
+                hallazgos_seccion.append({
+                    'tipo': 'referencia_rota',
+                    'descripcion': f'Referencia no encontrada: {ref_num}',
+                    'ubicacion': seccion_id,
+                    'severidad': 'alta'
+                })
+        
+        # Validación de coherencia con LLM (si está habilitado)
+        error = None
+        hallazgos_llm = []
+        if validar_llm and self.enable_llm and len(contenido) > 100:
+            try:
+                hallazgos_llm = self._validar_coherencia_llm(
+                    contenido=contenido,
+                    seccion_id=seccion_id,
+                    vectorstore=vectorstore,
+                    pool_ventanas=pool_ventanas
+                )
+                hallazgos_seccion.extend(hallazgos_llm)
+            except Exception as e:
+                print(f"Error en validación LLM para {seccion_id}: {e}")
+                error = str(e)
+        
+        return {
+            'seccion_id': seccion_id,
+            'hallazgos': hallazgos_seccion,
+            'hallazgos_llm': list(hallazgos_llm),
+            'total_referencias': len(referencias),
+            'referencias_rotas': referencias_rotas,
+            'error': error
+        }
+    
+    @medir_etapa('validacion_llm')
     def _validar_coherencia_llm(
         self,
         contenido: str,
         seccion_id: str,
-        vectorstore: Optional[FAISS] = None
+        vectorstore: Optional[FAISS] = None,
+        pool_ventanas: Optional[ThreadPoolExecutor] = None
     ) -> List[Dict]:
         """
         Valida coherencia de una sección usando LLM
         
+        Con tokens_ventana > 0 las secciones largas se dividen en ventanas
+        solapadas que se analizan en paralelo (map) y cuyos hallazgos se
+        combinan sin duplicados (reduce); si no, se trunca a 4000 caracteres.
+        
         Args:
             contenido: Contenido de la sección
             seccion_id: Identificador de la sección
             vectorstore: Base de conocimiento para RAG
+            pool_ventanas: Pool compartido de la auditoría (si falta, se usa
+                uno propio de hasta MAX_VENTANAS_PARALELAS hilos)
             
         Returns:
             Lista de hallazgos
         """
-        hallazgos = []
+        ventanas = self._fragmentos_analisis(contenido)
+        if len(ventanas) == 1:
+            return self._validar_fragmento(ventanas[0], seccion_id, vectorstore)
         
+        def validar(ventana):
+            return self._validar_fragmento(ventana, seccion_id, vectorstore)
+        
+        if pool_ventanas is not None:
+            hallazgos_ventanas = list(pool_ventanas.map(validar, ventanas))
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(ventanas), MAX_VENTANAS_PARALELAS)) as executor:
+                hallazgos_ventanas = list(executor.map(validar, ventanas))
+        
+        return self._combinar_hallazgos(hallazgos_ventanas)
+    
+    def _validar_fragmento(
+        self,
+        contenido_analisis: str,
+        seccion_id: str,
+        vectorstore: Optional[FAISS] = None
+    ) -> List[Dict]:
+        """
+        Valida coherencia de un fragmento de sección con una llamada al LLM
+        
+        Args:
+            contenido_analisis: Texto a analizar
+            seccion_id: Identificador de la sección
+            vectorstore: Base de conocimiento para RAG
+            
+        Returns:
+            Lista de hallazgos
+        """
+        # Los errores se propagan: la sección queda en secciones_con_error
+        # en lugar de aparecer sin hallazgos
+        
+        # Contexto adicional de RAG (si está habilitado)
+        contexto_adicional = self._contexto_rag(contenido_analisis, vectorstore)
+        
+        # Consultar cache antes de llamar al LLM
+        clave_cache = None
+        if self.cache_hallazgos is not None:
+            clave_cache = CacheHallazgos.construir_clave(
+                contenido=contenido_analisis,
+                seccion_id=seccion_id,
+                version_prompt=VERSION_PROMPT,
+                modelo=self.modelo_llm,
+                temperatura=self.temperatura_llm,
+                contexto=contexto_adicional
+            )
+            en_cache = self._leer_cache_hallazgos(clave_cache)
+            if en_cache is not None:
+                return en_cache
+        
+        prompt = self._construir_prompt(seccion_id, contenido_analisis, contexto_adicional)
+        
+        # Llamar al LLM
+        response = self._invocar_llm(prompt)
+        hallazgos = self._parsear_hallazgos(response.content, seccion_id)
+        
+        # Solo se guardan respuestas exitosas, nunca errores
+        if clave_cache is not None:
+            self._escribir_cache_hallazgos(clave_cache, hallazgos)
+        
+        return hallazgos
+    
+    def _leer_cache_hallazgos(self, clave: str) -> Optional[List[Dict]]:
+        """Consulta el cache de hallazgos; un fallo del cache cuenta como ausencia"""
         try:
+            return self.cache_hallazgos.obtener(clave)
+        except Exception as e:
+            print(f"❌ Error leyendo cache de hallazgos: {e}")
+            return None
+    
+    def _escribir_cache_hallazgos(self, clave: str, hallazgos: List[Dict]):
+        """Guarda hallazgos en el cache; un fallo del cache no afecta la auditoría"""
+        try:
+            self.cache_hallazgos.guardar(clave, hallazgos)
+        except Exception as e:
+            print(f"❌ Error guardando cache de hallazgos: {e}")
+    
+    def _invocar_llm(self, prompt: str):
+        """
+        Llama al LLM a través del planificador de cuota y registra métricas
+        
+        El planificador reintenta los 429 y errores transitorios; cada intento
+        respeta además el límite de concurrencia global entre procesos.
+        """
+        tokens_prompt = self._estimar_tokens(prompt)
+        
+        def intento():
+            inicio = time.perf_counter()
+            with self.limitador_llm:
+                espera = time.perf_counter() - inicio
+                inicio = time.perf_counter()
+                try:
+                    response = self.llm.invoke(prompt, config={'callbacks': self._callbacks_llm})
+                except Exception:
+                    self.metricas.registrar_llm(
+                        time.perf_counter() - inicio,
+                        tokens_prompt=tokens_prompt,
+                        error=True,
+                        espera=espera
+                    )
+                    raise
+            
+            # Tokens reportados por Vertex AI; estimados si no vienen en la respuesta
+            uso = getattr(response, 'usage_metadata', None) or {}
+            tokens_respuesta = uso.get('output_tokens') or self._estimar_tokens(str(response.content))
+            self.metricas.registrar_llm(
+                time.perf_counter() - inicio,
+                tokens_prompt=uso.get('input_tokens') or tokens_prompt,
+                tokens_respuesta=tokens_respuesta,
+                espera=espera
+            )
+            self.planificador_llm.consumir_tokens(tokens_respuesta)
+            return response
+        
+        return self.planificador_llm.ejecutar(intento, tokens=tokens_prompt, metricas=self.metricas)
+    
+    def _fragmentos_analisis(self, contenido: str) -> List[str]:
+        """
+        Fragmentos de una sección que se envían al LLM
+        
+        Args:
+            contenido: Contenido de la sección
+            
+        Returns:
+            Contenido completo si cabe en una ventana, ventanas solapadas si
+            no, o el contenido truncado a 4000 caracteres sin ventanas
+        """
+        if self.tokens_ventana <= 0:
             # Limitar contenido para análisis
-            contenido_analisis = contenido[:4000] if len(contenido) > 4000 else contenido
+            return [contenido[:4000] if len(contenido) > 4000 else contenido]
+        if len(contenido) <= self.tokens_ventana * CARACTERES_POR_TOKEN:
+            # Cabe en una sola ventana: se analiza completo
+            return [contenido]
+        return self._dividir_ventanas(contenido)
+    
+    def _dividir_ventanas(self, contenido: str) -> List[str]:
+        """
+        Divide un texto largo en ventanas solapadas de tokens_ventana tokens
+        
+        Los cortes se desplazan al salto de línea más cercano dentro del
+        último quinto de la ventana para no partir párrafos.
+        
+        Args:
+            contenido: Texto de la sección
+            
+        Returns:
+            Lista de ventanas en orden
+        """
+        tamano = self.tokens_ventana * CARACTERES_POR_TOKEN
+        solapamiento = min(self.solapamiento_ventana * CARACTERES_POR_TOKEN, tamano // 2)
+        
+        ventanas = []
+        inicio = 0
+        while inicio < len(contenido):
+            fin = min(inicio + tamano, len(contenido))
+            if fin < len(contenido):
+                corte = contenido.rfind('\n', fin - tamano // 5, fin)
+                if corte > inicio:
+                    fin = corte
+            ventanas.append(contenido[inicio:fin])
+            if fin >= len(contenido):
+                break
+            inicio = max(fin - solapamiento, inicio + 1)
+        
+        return ventanas
+    
+    def _combinar_hallazgos(self, hallazgos_ventanas: List[List[Dict]]) -> List[Dict]:
+        """
+        Combina los hallazgos de varias ventanas eliminando duplicados
+        
+        Dos hallazgos se consideran iguales si coinciden tipo y descripción
+        sin distinguir mayúsculas ni espacios (típico del solapamiento).
+        
+        Args:
+            hallazgos_ventanas: Hallazgos de cada ventana, en orden
+            
+        Returns:
+            Lista única de hallazgos
+        """
+        combinados = []
+        vistos = set()
+        for hallazgos in hallazgos_ventanas:
+            for hallazgo in hallazgos:
+                clave = tuple(
+                    " ".join(str(hallazgo.get(campo, '')).lower().split())
+                    for campo in ('tipo', 'descripcion')
+                )
+                if clave in vistos:
+                    continue
+                vistos.add(clave)
+                combinados.append(hallazgo)
+        return combinados
+    
+    @medir_etapa('recuperacion_rag')
+    def _precalcular_contextos(
+        self,
+        secciones: List[Dict],
+        vectorstore: FAISS,
+        omitir: Iterable[int] = ()
+    ) -> "VectorstorePrecalculado":
+        """
+        Recupera de una vez el contexto RAG de todas las consultas de la auditoría
+        
+        Embebe las consultas en lotes con embed_documents y ejecuta una sola
+        búsqueda matricial sobre el índice FAISS.
+        
+        Se recuperan el contenido completo de las secciones que pueden ir en
+        un lote y los fragmentos de análisis de todas, porque los lotes se
+        arman después con el contexto ya recuperado.
+        
+        Args:
+            secciones: Secciones del contrato
+            vectorstore: Base de conocimiento
+            omitir: Posiciones que no requieren validación LLM
+            
+        Returns:
+            Vectorstore con los resultados precalculados
+        """
+        consultas = []
+        for posicion, seccion in enumerate(secciones):
+            contenido = seccion.get('contenido', '')
+            if len(contenido) <= 100 or posicion in omitir:
+                continue
+            if self._candidata_lote(contenido):
+                consultas.append(contenido)
+            consultas.extend(self._fragmentos_analisis(contenido))
+        consultas = list(dict.fromkeys(consultas))
+        
+        precalculado = VectorstorePrecalculado(vectorstore)
+        embeddings = getattr(vectorstore, 'embeddings', None)
+        if not consultas or embeddings is None:
+            return precalculado
+        
+        # Las consultas no se guardan en el cache de embeddings de chunks
+        embeber = getattr(embeddings, 'embed_consultas', embeddings.embed_documents)
+        vectores = np.asarray(embeber(consultas), dtype=np.float32)
+        if getattr(vectorstore, '_normalize_L2', False):
+            import faiss
+            faiss.normalize_L2(vectores)
+        
+        _, posiciones = vectorstore.index.search(vectores, 2)
+        for consulta, fila in zip(consultas, posiciones):
+            precalculado.resultados[consulta] = [
+                vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+                for i in fila if i != -1
+            ]
+        
+        print(f"✅ Contexto RAG precalculado para {len(consultas)} consultas")
+        return precalculado
+    
+    def _contexto_rag(self, contenido: str, vectorstore: Optional[FAISS] = None) -> str:
+        """Recupera el contexto normativo de una sección (vacío sin RAG)"""
+        if not (self.enable_rag and vectorstore):
+            return ""
+        docs_relevantes = vectorstore.similarity_search(contenido, k=2)
+        return "\n\n".join([doc.page_content for doc in docs_relevantes])
+    
+    def _estimar_tokens(self, texto: str) -> int:
+        """Estimación rápida de tokens a partir de la longitud"""
+        return len(texto) // CARACTERES_POR_TOKEN + 1
+    
+    def _candidata_lote(self, contenido: str) -> bool:
+        """Una sección es "corta" si su contenido no supera un cuarto del presupuesto de lote"""
+        return (
+            self.presupuesto_tokens_lote > 0
+            and self._estimar_tokens(contenido) <= self.presupuesto_tokens_lote // 4
+        )
+    
+    def _agrupar_en_lotes(
+        self,
+        secciones: List[Dict],
+        omitir: Iterable[int] = (),
+        vectorstore: Optional[FAISS] = None
+    ) -> List[List[int]]:
+        """
+        Agrupa secciones cortas consecutivas en lotes según el presupuesto de tokens
+        
+        Las secciones que no son cortas se validan individualmente. Cada sección
+        cuenta con su bloque completo en el prompt: delimitadores, contenido y
+        contexto RAG recuperado.
+        
+        Args:
+            secciones: Secciones del contrato
+            omitir: Posiciones que no requieren validación LLM
+            vectorstore: Base de conocimiento para RAG (idealmente con contextos precalculados)
+            
+        Returns:
+            Lotes de posiciones de sección (solo lotes con 2 o más secciones)
+        """
+        if self.presupuesto_tokens_lote <= 0:
+            return []
+        
+        disponible = self.presupuesto_tokens_lote - self._estimar_tokens(self._construir_prompt_lote([]))
+        
+        lotes = []
+        lote_actual = []
+        ids_actual = set()
+        tokens_actual = 0
+        for posicion, seccion in enumerate(secciones):
+            contenido = seccion.get('contenido', '')
+            if len(contenido) <= 100 or posicion in omitir:
+                continue
+            if not self._candidata_lote(contenido):
+                continue
+            seccion_id = f"{seccion['tipo']}_{seccion['numero']}"
+            bloque = self._bloque_lote(seccion_id, contenido, self._contexto_rag(contenido, vectorstore))
+            # +1 por el salto de línea que separa los bloques
+            tokens = self._estimar_tokens(bloque) + 1
+            
+            # Un seccion_id repetido en el mismo lote mezclaría los hallazgos de ambas copias
+            if lote_actual and (tokens_actual + tokens > disponible or seccion_id in ids_actual):
+                lotes.append(lote_actual)
+                lote_actual = []
+                ids_actual = set()
+                tokens_actual = 0
+            lote_actual.append(posicion)
+            ids_actual.add(seccion_id)
+            tokens_actual += tokens
+        
+        if lote_actual:
+            lotes.append(lote_actual)
+        
+        # Un lote de una sola sección no ahorra nada
+        return [lote for lote in lotes if len(lote) > 1]
+    
+    @medir_etapa('validacion_llm_lote')
+    def _validar_lote(
+        self,
+        secciones: List[Dict],
+        vectorstore: Optional[FAISS] = None
+    ) -> Tuple[Dict[str, List[Dict]], Optional[str]]:
+        """
+        Valida coherencia de varias secciones cortas en una sola llamada al LLM
+        
+        Args:
+            secciones: Secciones del lote
+            vectorstore: Base de conocimiento para RAG
             
-            # Contexto adicional de RAG (si está habilitado)
-            contexto_adicional = ""
-            if self.enable_rag and vectorstore:
-                docs_relevantes = vectorstore.similarity_search(contenido_analisis, k=2)
-                contexto_adicional = "\n\n".join([doc.page_content for doc in docs_relevantes])
+        Returns:
+            (hallazgos por seccion_id, error o None)
+        """
+        hallazgos = {}
+        pendientes = []
+        claves = {}
+        
+        try:
+            for seccion in secciones:
+                seccion_id = f"{seccion['tipo']}_{seccion['numero']}"
+                contenido = seccion.get('contenido', '')
+                contexto_adicional = self._contexto_rag(contenido, vectorstore)
+                
+                if self.cache_hallazgos is not None:
+                    claves[seccion_id] = CacheHallazgos.construir_clave(
+                        contenido=contenido,
+                        seccion_id=seccion_id,
+                        version_prompt=VERSION_PROMPT_LOTE,
+                        modelo=self.modelo_llm,
+                        temperatura=self.temperatura_llm,
+                        contexto=contexto_adicional
+                    )
+                    en_cache = self._leer_cache_hallazgos(claves[seccion_id])
+                    if en_cache is not None:
+                        hallazgos[seccion_id] = en_cache
+                        continue
+                
+                pendientes.append((seccion_id, contenido, contexto_adicional))
             
-            # Prompt para análisis
-            prompt = f"""
+            if pendientes:
+                response = self._invocar_llm(self._construir_prompt_lote(pendientes))
+                por_seccion = self._parsear_hallazgos_lote(
+                    response.content,
+                    [seccion_id for seccion_id, _, _ in pendientes]
+                )
+                
+                for seccion_id, hallazgos_seccion in por_seccion.items():
+                    hallazgos[seccion_id] = hallazgos_seccion
+                    if seccion_id in claves:
+                        self._escribir_cache_hallazgos(claves[seccion_id], hallazgos_seccion)
+        
+        except Exception as e:
+            ids = ", ".join(seccion_id for seccion_id, _, _ in pendientes)
+            print(f"Error en validación LLM del lote [{ids}]: {e}")
+            return hallazgos, str(e)
+        
+        return hallazgos, None
+    
+    def _bloque_lote(self, seccion_id: str, contenido: str, contexto_adicional: str) -> str:
+        """Bloque delimitado de una sección dentro del prompt de lote"""
+        bloque = f"=== SECCIÓN: {seccion_id} ===\n{contenido}\n"
+        if contexto_adicional:
+            bloque += f"CONTEXTO NORMATIVO:{contexto_adicional}\n"
+        return bloque + "=== FIN SECCIÓN ==="
+    
+    def _construir_prompt_lote(self, secciones: List[Tuple[str, str, str]]) -> str:
+        """
+        Construye el prompt de coherencia para varias secciones (ver VERSION_PROMPT_LOTE)
+        
+        Args:
+            secciones: Tuplas (seccion_id, contenido, contexto_adicional)
+        """
+        bloques = [
+            self._bloque_lote(seccion_id, contenido, contexto_adicional)
+            for seccion_id, contenido, contexto_adicional in secciones
+        ]
+        
+        return f"""
+Analiza de forma independiente cada una de las siguientes secciones de un contrato de concesión APP y detecta posibles problemas:
+
+{chr(10).join(bloques)}
+
+Identifica ÚNICAMENTE problemas claros y verificables:
+1. Inconsistencias lógicas evidentes
+2. Contradicciones internas
+3. Términos indefinidos que se referencian
+4. Fechas o plazos contradictorios
+5. Montos o valores inconsistentes
+
+Responde SOLO con hallazgos concretos, indicando la sección de cada uno, en formato:
+SECCIÓN: [identificador_de_la_sección]
+TIPO: [tipo_de_problema]
+DESCRIPCIÓN: [descripción_breve]
+SEVERIDAD: [alta/media/baja]
+
+Incluye TODAS las secciones. Para cada sección sin problemas claros responde:
+SECCIÓN: [identificador_de_la_sección]
+SIN_HALLAZGOS
+"""
+    
+    def _parsear_hallazgos_lote(self, respuesta: str, ids: List[str]) -> Dict[str, List[Dict]]:
+        """
+        Reparte los hallazgos de una respuesta de lote por seccion_id
+        
+        Args:
+            respuesta: Texto devuelto por el LLM
+            ids: Identificadores de las secciones del lote
+            
+        Returns:
+            Hallazgos por seccion_id, solo de las secciones que la respuesta
+            cubre explícitamente (con hallazgos o con SIN_HALLAZGOS); las
+            ausentes (p. ej. por una salida truncada) no aparecen
+        """
+        # Respuesta global sin hallazgos: cubre todas las secciones
+        if respuesta.strip().strip('"') == "SIN_HALLAZGOS":
+            return {seccion_id: [] for seccion_id in ids}
+        
+        esperados = set(ids)
+        por_seccion = {}
+        seccion_actual = None
+        bloque = []
+        
+        def cerrar_bloque():
+            if seccion_actual in esperados:
+                texto_bloque = '\n'.join(bloque)
+                hallazgos = self._parsear_hallazgos(texto_bloque, seccion_actual)
+                if hallazgos or "SIN_HALLAZGOS" in texto_bloque:
+                    por_seccion.setdefault(seccion_actual, []).extend(hallazgos)
+            elif seccion_actual is not None:
+                print(f"Hallazgos para sección desconocida en lote: {seccion_actual}")
+        
+        for linea in respuesta.strip().split('\n'):
+            if linea.startswith('SECCIÓN:'):
+                cerrar_bloque()
+                seccion_actual = linea.replace('SECCIÓN:', '').strip().strip('[]')
+                bloque = []
+            else:
+                bloque.append(linea)
+        cerrar_bloque()
+        
+        return por_seccion
+    
+    def _construir_prompt(self, seccion_id: str, contenido: str, contexto_adicional: str = "") -> str:
+        """Construye el prompt de análisis de coherencia (ver VERSION_PROMPT)"""
+        return f"""
 Analiza la siguiente sección de un contrato de concesión APP y detecta posibles problemas:
 
 SECCIÓN: {seccion_id}
 
 CONTENIDO:
-{contenido_analisis}
+{contenido}
 
 {f"CONTEXTO NORMATIVO:{contexto_adicional}" if contexto_adicional else ""}
 
@@ -425,44 +2034,35 @@ SEVERIDAD: [alta/media/baja]
 
 Si NO hay problemas claros, responde: "SIN_HALLAZGOS"
 """
-            
-            # Llamar al LLM
-            response = self.llm.invoke(prompt)
-            respuesta = response.content
-            
-            # Parsear respuesta
-            if "SIN_HALLAZGOS" not in respuesta:
-                # Extraer hallazgos del texto
-                lineas = respuesta.strip().split('\n')
-                hallazgo_actual = {}
-                
-                for linea in lineas:
-                    if linea.startswith('TIPO:'):
-                        if hallazgo_actual:
-                            hallazgos.append(hallazgo_actual)
-                        hallazgo_actual = {
-                            'tipo': linea.replace('TIPO:', '').strip(),
-                            'ubicacion': seccion_id
-                        }
-                    elif linea.startswith('DESCRIPCIÓN:'):
-                        hallazgo_actual['descripcion'] = linea.replace('DESCRIPCIÓN:', '').strip()
-                    elif linea.startswith('SEVERIDAD:'):
-                        hallazgo_actual['severidad'] = linea.replace('SEVERIDAD:', '').strip()
-                
+    
+    def _parsear_hallazgos(self, respuesta: str, seccion_id: str) -> List[Dict]:
+        """Extrae los hallazgos TIPO/DESCRIPCIÓN/SEVERIDAD de la respuesta del LLM"""
+        hallazgos = []
+        
+        if "SIN_HALLAZGOS" in respuesta:
+            return hallazgos
+        
+        lineas = respuesta.strip().split('\n')
+        hallazgo_actual = {}
+        
+        for linea in lineas:
+            if linea.startswith('TIPO:'):
                 if hallazgo_actual:
                     hallazgos.append(hallazgo_actual)
+                hallazgo_actual = {
+                    'tipo': linea.replace('TIPO:', '').strip(),
+                    'ubicacion': seccion_id
+                }
+            elif linea.startswith('DESCRIPCIÓN:'):
+                hallazgo_actual['descripcion'] = linea.replace('DESCRIPCIÓN:', '').strip()
+            elif linea.startswith('SEVERIDAD:'):
+                hallazgo_actual['severidad'] = linea.replace('SEVERIDAD:', '').strip()
         
-        except Exception as e:
-            print(f"Error en validación LLM: {e}")
+        if hallazgo_actual:
+            hallazgos.append(hallazgo_actual)
         
         return hallazgos
     
     def _norm_text(self, s: str) -> str:
-        """Normaliza texto eliminando caracteres especiales"""
-        s = s.replace("\ufeff", "").replace("\r", "")
-        s = s.replace("\u00a0", " ")
-        s = s.replace("\u00ad", "")
-        s = re.sub(r"\f", "\n", s)
-        s = re.sub(r"[ \t]+", " ", s)
-        s = re.sub(r"\n{3,}", "\n\n", s)
-        return s.strip()
+        """Normaliza texto eliminando caracteres especiales (ver normalizar_texto)"""
+        return normalizar_texto(s)
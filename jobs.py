@@ -0,0 +1,429 @@
+"""
+Jobs Module
+Ejecución en segundo plano de análisis de contratos para CONTRACTIA AI
+
+Los análisis corren en un pool de procesos fuera del hilo de Streamlit y
+registran su avance en una tabla SQLite; la interfaz consulta el estado y
+recupera los resultados por ID de trabajo.
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from clientes import obtener_procesador
+from contract_processor import ContractProcessor
+from utils import cargar_revision, generar_reporte_markdown, guardar_revision
+
+# Avance (%) y mensaje de cada etapa del análisis
+ETAPAS = {
+    'en_cola': (0, "⏳ En cola..."),
+    'configuracion': (5, "🔧 Configurando Vertex AI..."),
+    'conocimiento': (10, "📚 Cargando base de conocimiento..."),
+    'contrato': (25, "📄 Procesando contrato..."),
+    'segmentacion': (40, "🔍 Extrayendo estructura del contrato..."),
+    'indices': (55, "📑 Construyendo índices..."),
+    'auditoria': (70, "🔎 Auditando referencias y coherencia..."),
+    'reporte': (85, "📊 Generando reportes..."),
+    'guardando': (95, "💾 Guardando resultados..."),
+    'completado': (100, "✅ ¡Análisis completado!")
+}
+
+# Segundos sin actualizar 'actualizado' tras los que un trabajo en curso se
+# considera perdido (p. ej. el proceso trabajador quedó colgado); la auditoría
+# lo actualiza al terminar cada sección o lote
+TIMEOUT_INACTIVIDAD = 60 * 60
+
+
+def ejecutar_analisis(
+    processor: ContractProcessor,
+    contrato_path: str,
+    knowledge_dir: str,
+    reportar: Optional[Callable[[str], None]] = None,
+    revision_previa: Optional[Dict] = None,
+    progreso_auditoria: Optional[Callable[[int, int], None]] = None
+) -> Dict:
+    """
+    Ejecuta el pipeline completo de análisis de un contrato
+
+    Args:
+        processor: Procesador configurado
+        contrato_path: Ruta al PDF del contrato
+        knowledge_dir: Directorio con documentos normativos
+        reportar: Función llamada con el nombre de cada etapa (ver ETAPAS)
+        revision_previa: Revisión de la versión anterior para reauditar
+        progreso_auditoria: Función llamada con (completadas, total) durante la auditoría
+
+    Returns:
+        Diccionario con 'reporte', 'auditoria' (incluye 'metricas') y 'total_secciones'
+    """
+    reportar = reportar or (lambda etapa: None)
+
+    # Las métricas del procesador (reutilizado entre análisis) son por contrato
+    processor.metricas.reiniciar()
+
+    reportar('conocimiento')
+    vectorstore_conocimiento = processor.cargar_conocimiento(knowledge_dir)
+
+    reportar('contrato')
+    docs_contrato, texto_contrato = processor.procesar_contrato(contrato_path)
+    if not docs_contrato:
+        raise ValueError("No se pudo procesar el contrato.")
+
+    reportar('segmentacion')
+    secciones = processor.segmentar_contrato(texto_contrato)
+
+    reportar('indices')
+    indices = processor.construir_indices(secciones)
+
+    reportar('auditoria')
+    auditoria = processor.auditar_contrato(
+        secciones=secciones,
+        indices=indices,
+        vectorstore_conocimiento=vectorstore_conocimiento,
+        revision_previa=revision_previa,
+        progreso=progreso_auditoria
+    )
+
+    reportar('reporte')
+    with processor.metricas.etapa('generar_reporte'):
+        reporte = generar_reporte_markdown(auditoria)
+    auditoria['metricas'] = processor.metricas.a_dict()
+
+    return {
+        'reporte': reporte,
+        'auditoria': auditoria,
+        'total_secciones': len(secciones)
+    }
+
+
+def _conectar(db_path: str) -> sqlite3.Connection:
+    """Abre una conexión a la base de trabajos"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _actualizar(db_path: str, trabajo_id: str, estados: Tuple[str, ...] = ('en_cola', 'en_curso'), **campos):
+    """
+    Actualiza columnas de un trabajo que aún está en alguno de los estados dados
+
+    Un trabajo ya terminado (p. ej. marcado como error por inactividad) no se
+    sobrescribe con el avance tardío de su proceso trabajador.
+    """
+    campos['actualizado'] = time.time()
+    columnas = ", ".join(f"{columna} = ?" for columna in campos)
+    marcadores = ", ".join("?" for _ in estados)
+    with _conectar(db_path) as conn:
+        conn.execute(
+            f"UPDATE trabajos SET {columnas} WHERE id = ? AND estado IN ({marcadores})",
+            (*campos.values(), trabajo_id, *estados)
+        )
+
+
+def _marcar_error(db_path: str, trabajo_id: str, error: str):
+    """Marca un trabajo como fallido si aún no terminó"""
+    _actualizar(db_path, trabajo_id, estado='error', error=error, mensaje=f"❌ {error}")
+
+
+def ejecutar_trabajo(db_path: str, trabajo_id: str, parametros: Dict, credentials_info: Dict):
+    """
+    Punto de entrada de un trabajo en el proceso trabajador
+
+    Args:
+        db_path: Ruta de la base SQLite de trabajos
+        trabajo_id: ID del trabajo
+        parametros: Parámetros del trabajo (rutas y opciones del procesador)
+        credentials_info: Información de la cuenta de servicio (no se persiste)
+    """
+    def reportar(etapa: str):
+        progreso, mensaje = ETAPAS[etapa]
+        _actualizar(db_path, trabajo_id, estado='en_curso', etapa=etapa, progreso=progreso, mensaje=mensaje)
+
+    def progreso_auditoria(completadas: int, total: int):
+        # Latido durante la etapa más larga: avanza entre 'auditoria' y 'reporte'
+        inicio, mensaje = ETAPAS['auditoria']
+        fin, _ = ETAPAS['reporte']
+        _actualizar(
+            db_path, trabajo_id, estados=('en_curso',),
+            progreso=inicio + (fin - inicio) * completadas // max(1, total),
+            mensaje=f"{mensaje} ({completadas}/{total})"
+        )
+
+    try:
+        # Credenciales, Vertex AI y clientes se reutilizan entre trabajos del proceso
+        reportar('configuracion')
+        processor = obtener_procesador(credentials_info, **parametros['opciones'])
+
+        revision_previa = None
+        if parametros.get('reauditoria'):
+            revision_previa = cargar_revision(parametros['nombre_contrato'], parametros['cache_dir'])
+
+        resultado = ejecutar_analisis(
+            processor,
+            parametros['contrato_path'],
+            parametros['knowledge_dir'],
+            reportar=reportar,
+            revision_previa=revision_previa,
+            progreso_auditoria=progreso_auditoria
+        )
+
+        reportar('guardando')
+        guardar_revision(resultado['auditoria']['revision'], parametros['nombre_contrato'], parametros['cache_dir'])
+        resultado['timestamp'] = datetime.now().strftime("%Y%m%d_%H%M%S")
+        resultado['nombre_contrato'] = parametros['nombre_contrato']
+
+        progreso, mensaje = ETAPAS['completado']
+        _actualizar(
+            db_path, trabajo_id, estados=('en_curso',),
+            estado='completado', etapa='completado', progreso=progreso, mensaje=mensaje,
+            resultado=json.dumps(resultado, ensure_ascii=False)
+        )
+
+    except Exception as e:
+        print(f"❌ Error en trabajo {trabajo_id}: {e}")
+        _marcar_error(db_path, trabajo_id, str(e))
+
+    finally:
+        shutil.rmtree(parametros['directorio'], ignore_errors=True)
+
+
+def _proceso_vivo(pid: Optional[int]) -> bool:
+    """Indica si existe un proceso con ese PID en esta máquina"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class GestorTrabajos:
+    """
+    Ejecutor local de análisis con tabla de trabajos en SQLite
+    """
+
+    def __init__(self, directorio: str, max_workers: int = 2, timeout_inactividad: float = TIMEOUT_INACTIVIDAD):
+        """
+        Inicializa el gestor
+
+        Args:
+            directorio: Directorio para la base de trabajos y archivos subidos
+            max_workers: Análisis simultáneos (procesos trabajadores)
+            timeout_inactividad: Segundos sin avance tras los que un trabajo en curso se marca como error
+        """
+        self.directorio = Path(directorio)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(self.directorio / "trabajos.sqlite")
+
+        with _conectar(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS trabajos (
+                    id TEXT PRIMARY KEY,
+                    nombre_contrato TEXT,
+                    estado TEXT NOT NULL,
+                    etapa TEXT,
+                    progreso INTEGER DEFAULT 0,
+                    mensaje TEXT,
+                    parametros TEXT,
+                    resultado TEXT,
+                    error TEXT,
+                    creado REAL NOT NULL,
+                    actualizado REAL NOT NULL,
+                    gestor_pid INTEGER
+                )"""
+            )
+            columnas = {fila['name'] for fila in conn.execute("PRAGMA table_info(trabajos)")}
+            if 'gestor_pid' not in columnas:
+                conn.execute("ALTER TABLE trabajos ADD COLUMN gestor_pid INTEGER")
+
+            # Trabajos que quedaron a medias por un reinicio del servidor: los
+            # de un gestor cuyo proceso ya no existe o sin avance reciente. Otros
+            # gestores vivos (otro servidor, un recurso de Streamlit recreado)
+            # pueden compartir la base, así que sus trabajos no se tocan
+            limite = time.time() - timeout_inactividad
+            pendientes = conn.execute(
+                "SELECT id, estado, actualizado, gestor_pid FROM trabajos "
+                "WHERE estado IN ('en_cola', 'en_curso')"
+            ).fetchall()
+            interrumpidos = [
+                (fila['id'],) for fila in pendientes
+                if not _proceso_vivo(fila['gestor_pid'])
+                or (fila['estado'] == 'en_curso' and fila['actualizado'] < limite)
+            ]
+            conn.executemany(
+                "UPDATE trabajos SET estado = 'error', error = ?, mensaje = ? "
+                "WHERE id = ? AND estado IN ('en_cola', 'en_curso')",
+                [
+                    ("Interrumpido por reinicio del servidor", "❌ Interrumpido por reinicio del servidor", trabajo_id)
+                    for trabajo_id, in interrumpidos
+                ]
+            )
+
+        self.max_workers = max_workers
+        self.timeout_inactividad = timeout_inactividad
+        self._lock = threading.Lock()
+        self.executor = self._crear_executor()
+
+    def _crear_executor(self) -> ProcessPoolExecutor:
+        """Pool de procesos trabajadores"""
+        # 'spawn' evita heredar canales gRPC y el estado de Streamlit del proceso padre
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def _enviar_executor(self, *args) -> Future:
+        """Envía una tarea al pool, recreándolo si un trabajador murió"""
+        with self._lock:
+            try:
+                return self.executor.submit(*args)
+            except BrokenProcessPool:
+                print("❌ Pool de trabajadores roto, recreándolo")
+                self.executor.shutdown(wait=False)
+                self.executor = self._crear_executor()
+                return self.executor.submit(*args)
+
+    def _trabajo_terminado(self, trabajo_id: str, futuro: Future):
+        """
+        Marca como error un trabajo cuyo proceso falló fuera de ejecutar_trabajo
+
+        Args:
+            trabajo_id: ID del trabajo
+            futuro: Futuro devuelto por el pool
+        """
+        if futuro.cancelled():
+            _marcar_error(self.db_path, trabajo_id, "Trabajo cancelado")
+            return
+        error = futuro.exception()
+        if error is None:
+            return
+        if isinstance(error, BrokenProcessPool):
+            mensaje = "El proceso trabajador terminó inesperadamente"
+        else:
+            mensaje = str(error) or type(error).__name__
+        print(f"❌ Error en trabajo {trabajo_id}: {mensaje}")
+        _marcar_error(self.db_path, trabajo_id, mensaje)
+        # El trabajador no llegó a limpiar los archivos subidos
+        shutil.rmtree(self.directorio / "archivos" / trabajo_id, ignore_errors=True)
+
+    def _marcar_inactivos(self):
+        """Marca como error los trabajos en curso que dejaron de reportar avance"""
+        limite = time.time() - self.timeout_inactividad
+        with _conectar(self.db_path) as conn:
+            conn.execute(
+                "UPDATE trabajos SET estado = 'error', error = ?, mensaje = ? "
+                "WHERE estado = 'en_curso' AND actualizado < ?",
+                ("Sin avance del proceso trabajador", "❌ Sin avance del proceso trabajador", limite)
+            )
+
+    def enviar(
+        self,
+        nombre_contrato: str,
+        contrato_bytes: bytes,
+        archivos_conocimiento: List[Tuple[str, bytes]],
+        opciones: Dict,
+        credentials_info: Dict,
+        cache_dir: str,
+        reauditoria: bool = False
+    ) -> str:
+        """
+        Encola un análisis
+
+        Args:
+            nombre_contrato: Nombre del archivo del contrato
+            contrato_bytes: Contenido del PDF
+            archivos_conocimiento: Pares (nombre, contenido) de documentos normativos
+            opciones: Argumentos para ContractProcessor (sin credenciales)
+            credentials_info: Cuenta de servicio, solo se pasa al proceso trabajador
+            cache_dir: Directorio de caches persistentes
+            reauditoria: Reutilizar hallazgos de la versión anterior
+
+        Returns:
+            ID del trabajo
+        """
+        trabajo_id = uuid.uuid4().hex
+        directorio = self.directorio / "archivos" / trabajo_id
+        knowledge_dir = directorio / "knowledge_base"
+        knowledge_dir.mkdir(parents=True, exist_ok=True)
+
+        contrato_path = directorio / Path(nombre_contrato).name
+        contrato_path.write_bytes(contrato_bytes)
+        for nombre, contenido in archivos_conocimiento:
+            (knowledge_dir / Path(nombre).name).write_bytes(contenido)
+
+        parametros = {
+            'nombre_contrato': nombre_contrato,
+            'contrato_path': str(contrato_path),
+            'knowledge_dir': str(knowledge_dir),
+            'directorio': str(directorio),
+            'cache_dir': cache_dir,
+            'reauditoria': reauditoria,
+            'opciones': opciones
+        }
+
+        ahora = time.time()
+        progreso, mensaje = ETAPAS['en_cola']
+        with _conectar(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO trabajos (id, nombre_contrato, estado, etapa, progreso, mensaje, parametros, creado, actualizado, gestor_pid) "
+                "VALUES (?, ?, 'en_cola', 'en_cola', ?, ?, ?, ?, ?, ?)",
+                (trabajo_id, nombre_contrato, progreso, mensaje, json.dumps(parametros), ahora, ahora, os.getpid())
+            )
+
+        futuro = self._enviar_executor(ejecutar_trabajo, self.db_path, trabajo_id, parametros, credentials_info)
+        futuro.add_done_callback(partial(self._trabajo_terminado, trabajo_id))
+        return trabajo_id
+
+    def estado(self, trabajo_id: str) -> Optional[Dict]:
+        """
+        Estado actual de un trabajo
+
+        Returns:
+            Diccionario con estado, etapa, progreso, mensaje y error, o None
+        """
+        self._marcar_inactivos()
+        with _conectar(self.db_path) as conn:
+            fila = conn.execute(
+                "SELECT id, nombre_contrato, estado, etapa, progreso, mensaje, error, creado, actualizado "
+                "FROM trabajos WHERE id = ?",
+                (trabajo_id,)
+            ).fetchone()
+        return dict(fila) if fila else None
+
+    def resultado(self, trabajo_id: str) -> Optional[Dict]:
+        """Resultados de un trabajo completado (None si no terminó)"""
+        with _conectar(self.db_path) as conn:
+            fila = conn.execute(
+                "SELECT resultado FROM trabajos WHERE id = ? AND estado = 'completado'",
+                (trabajo_id,)
+            ).fetchone()
+        return json.loads(fila['resultado']) if fila and fila['resultado'] else None
+
+    def listar(self, limite: int = 20) -> List[Dict]:
+        """Trabajos más recientes"""
+        self._marcar_inactivos()
+        with _conectar(self.db_path) as conn:
+            filas = conn.execute(
+                "SELECT id, nombre_contrato, estado, etapa, progreso, mensaje, error, creado, actualizado "
+                "FROM trabajos ORDER BY creado DESC LIMIT ?",
+                (limite,)
+            ).fetchall()
+        return [dict(fila) for fila in filas]
@@ -0,0 +1,284 @@
+"""
+Metricas Module
+Instrumentación del pipeline de CONTRACTIA AI
+
+Registra el tiempo de pared por etapa, la distribución de latencias del LLM,
+los tokens de prompt/respuesta y los reintentos. Las métricas se adjuntan a
+los resultados de la auditoría y se exportan como JSON o en el formato de
+texto de Prometheus.
+"""
+
+import contextlib
+import functools
+import json
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Límites (segundos) del histograma de latencias del LLM
+LIMITES_LATENCIA = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def medir_etapa(etapa: str):
+    """
+    Decorador que registra el tiempo de pared de un método en self.metricas
+
+    Args:
+        etapa: Nombre de la etapa
+    """
+    def decorador(metodo):
+        @functools.wraps(metodo)
+        def envoltura(self, *args, **kwargs):
+            with self.metricas.etapa(etapa):
+                return metodo(self, *args, **kwargs)
+        return envoltura
+    return decorador
+
+
+class Metricas:
+    """
+    Acumulador de métricas seguro entre hilos
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Descarta todas las métricas acumuladas"""
+        with self._lock:
+            self._etapas: Dict[str, Dict] = {}
+            self._latencias: List[float] = []
+            self._llm = {
+                'llamadas': 0,
+                'errores': 0,
+                'reintentos': 0,
+                'tokens_prompt': 0,
+                'tokens_respuesta': 0,
+                'segundos_espera_limite': 0.0
+            }
+            self._planificador: Dict[str, Dict] = {}
+
+    @contextlib.contextmanager
+    def etapa(self, nombre: str):
+        """Mide el tiempo de pared del bloque como una ejecución de la etapa"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar_etapa(nombre, time.perf_counter() - inicio)
+
+    def registrar_etapa(self, nombre: str, segundos: float):
+        """Suma una ejecución de la etapa"""
+        with self._lock:
+            etapa = self._etapas.setdefault(nombre, {'ejecuciones': 0, 'segundos': 0.0, 'max_segundos': 0.0})
+            etapa['ejecuciones'] += 1
+            etapa['segundos'] += segundos
+            etapa['max_segundos'] = max(etapa['max_segundos'], segundos)
+
+    def registrar_llm(
+        self,
+        latencia: float,
+        tokens_prompt: int = 0,
+        tokens_respuesta: int = 0,
+        error: bool = False,
+        espera: float = 0.0
+    ):
+        """
+        Registra una llamada al LLM
+
+        Args:
+            latencia: Segundos de la llamada
+            tokens_prompt: Tokens de entrada
+            tokens_respuesta: Tokens de salida
+            error: Si la llamada falló
+            espera: Segundos esperando el límite de concurrencia
+        """
+        with self._lock:
+            self._latencias.append(latencia)
+            self._llm['llamadas'] += 1
+            self._llm['errores'] += int(error)
+            self._llm['tokens_prompt'] += tokens_prompt
+            self._llm['tokens_respuesta'] += tokens_respuesta
+            self._llm['segundos_espera_limite'] += espera
+
+    def registrar_reintento(self, cantidad: int = 1):
+        """Registra reintentos de llamadas al LLM"""
+        with self._lock:
+            self._llm['reintentos'] += cantidad
+
+    def registrar_planificador(
+        self,
+        servicio: str,
+        reintentos: int = 0,
+        limitaciones: int = 0,
+        espera_cuota: float = 0.0,
+        espera_reintentos: float = 0.0
+    ):
+        """
+        Registra el resultado de una llamada planificada
+
+        Args:
+            servicio: 'llm' o 'embeddings'
+            reintentos: Reintentos realizados
+            limitaciones: Rechazos por cuota (429) recibidos
+            espera_cuota: Segundos esperando los límites RPM/TPM
+            espera_reintentos: Segundos de backoff entre reintentos
+        """
+        with self._lock:
+            planificador = self._planificador.setdefault(servicio, {
+                'llamadas': 0,
+                'reintentos': 0,
+                'limitaciones': 0,
+                'segundos_espera_cuota': 0.0,
+                'segundos_espera_reintentos': 0.0
+            })
+            planificador['llamadas'] += 1
+            planificador['reintentos'] += reintentos
+            planificador['limitaciones'] += limitaciones
+            planificador['segundos_espera_cuota'] += espera_cuota
+            planificador['segundos_espera_reintentos'] += espera_reintentos
+            if servicio == 'llm':
+                self._llm['reintentos'] += reintentos
+
+    def a_dict(self) -> Dict:
+        """
+        Instantánea de las métricas
+
+        Returns:
+            Diccionario con 'etapas' y 'llm' (incluye percentiles e histograma)
+        """
+        with self._lock:
+            etapas = {nombre: dict(etapa) for nombre, etapa in self._etapas.items()}
+            latencias = np.asarray(self._latencias, dtype=np.float64)
+            llm = dict(self._llm)
+            planificador = {servicio: dict(valores) for servicio, valores in self._planificador.items()}
+
+        for etapa in etapas.values():
+            etapa['segundos'] = round(etapa['segundos'], 6)
+            etapa['max_segundos'] = round(etapa['max_segundos'], 6)
+
+        llm['segundos_espera_limite'] = round(llm['segundos_espera_limite'], 6)
+        llm['latencia'] = {
+            'media': round(float(latencias.mean()), 6) if latencias.size else 0.0,
+            'p50': round(float(np.percentile(latencias, 50)), 6) if latencias.size else 0.0,
+            'p90': round(float(np.percentile(latencias, 90)), 6) if latencias.size else 0.0,
+            'p99': round(float(np.percentile(latencias, 99)), 6) if latencias.size else 0.0,
+            'max': round(float(latencias.max()), 6) if latencias.size else 0.0,
+            'suma': round(float(latencias.sum()), 6),
+            'histograma': {
+                'limites': list(LIMITES_LATENCIA),
+                # Conteos acumulados (le=limite), como en Prometheus
+                'conteos': [int((latencias <= limite).sum()) for limite in LIMITES_LATENCIA]
+            }
+        }
+
+        for valores in planificador.values():
+            valores['segundos_espera_cuota'] = round(valores['segundos_espera_cuota'], 6)
+            valores['segundos_espera_reintentos'] = round(valores['segundos_espera_reintentos'], 6)
+
+        return {'etapas': etapas, 'llm': llm, 'planificador': planificador}
+
+    def a_json(self) -> str:
+        """Métricas serializadas como JSON"""
+        return json.dumps(self.a_dict(), indent=2, ensure_ascii=False)
+
+    def a_prometheus(self, etiquetas: Optional[Dict[str, str]] = None) -> str:
+        """Métricas en formato de texto de Prometheus"""
+        return metricas_a_prometheus(self.a_dict(), etiquetas)
+
+
+class ContadorReintentosLLM(BaseCallbackHandler):
+    """
+    Callback de LangChain que cuenta los reintentos internos del cliente LLM
+    """
+
+    def __init__(self, metricas: Metricas):
+        self.metricas = metricas
+
+    def on_retry(self, retry_state, **kwargs):
+        self.metricas.registrar_reintento()
+
+
+def _etiquetas_texto(etiquetas: Dict[str, str]) -> str:
+    """Formatea etiquetas Prometheus: {a="1",b="2"}"""
+    if not etiquetas:
+        return ""
+    pares = []
+    for clave, valor in etiquetas.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pares.append(f'{clave}="{valor}"')
+    return "{" + ",".join(pares) + "}"
+
+
+def metricas_a_prometheus(metricas: Dict, etiquetas: Optional[Dict[str, str]] = None, prefijo: str = "contractia") -> str:
+    """
+    Convierte métricas (Metricas.a_dict) al formato de texto de Prometheus
+
+    Args:
+        metricas: Diccionario de métricas
+        etiquetas: Etiquetas comunes (p. ej. {'contrato': 'x.pdf'})
+        prefijo: Prefijo de los nombres de métricas
+
+    Returns:
+        Texto de exposición de Prometheus
+    """
+    etiquetas = dict(etiquetas or {})
+    lineas = []
+
+    def metrica(nombre, tipo, ayuda, muestras):
+        lineas.append(f"# HELP {prefijo}_{nombre} {ayuda}")
+        lineas.append(f"# TYPE {prefijo}_{nombre} {tipo}")
+        for sufijo, extra, valor in muestras:
+            lineas.append(f"{prefijo}_{nombre}{sufijo}{_etiquetas_texto({**etiquetas, **extra})} {valor}")
+
+    etapas = metricas.get('etapas', {})
+    metrica(
+        "etapa_segundos_total", "counter", "Tiempo de pared acumulado por etapa",
+        [("", {'etapa': nombre}, etapa['segundos']) for nombre, etapa in etapas.items()]
+    )
+    metrica(
+        "etapa_ejecuciones_total", "counter", "Ejecuciones por etapa",
+        [("", {'etapa': nombre}, etapa['ejecuciones']) for nombre, etapa in etapas.items()]
+    )
+
+    llm = metricas.get('llm', {})
+    latencia = llm.get('latencia', {})
+    histograma = latencia.get('histograma', {'limites': [], 'conteos': []})
+    muestras = [
+        ("_bucket", {'le': str(limite)}, conteo)
+        for limite, conteo in zip(histograma['limites'], histograma['conteos'])
+    ]
+    muestras.append(("_bucket", {'le': "+Inf"}, llm.get('llamadas', 0)))
+    muestras.append(("_sum", {}, latencia.get('suma', 0.0)))
+    muestras.append(("_count", {}, llm.get('llamadas', 0)))
+    metrica("llm_latencia_segundos", "histogram", "Latencia de las llamadas al LLM", muestras)
+
+    metrica("llm_llamadas_total", "counter", "Llamadas al LLM", [("", {}, llm.get('llamadas', 0))])
+    metrica("llm_errores_total", "counter", "Llamadas al LLM fallidas", [("", {}, llm.get('errores', 0))])
+    metrica("llm_reintentos_total", "counter", "Reintentos de llamadas al LLM", [("", {}, llm.get('reintentos', 0))])
+    metrica(
+        "llm_tokens_total", "counter", "Tokens enviados y recibidos del LLM",
+        [
+            ("", {'tipo': 'prompt'}, llm.get('tokens_prompt', 0)),
+            ("", {'tipo': 'respuesta'}, llm.get('tokens_respuesta', 0))
+        ]
+    )
+    metrica(
+        "llm_espera_limite_segundos_total", "counter", "Tiempo esperando el límite de concurrencia del LLM",
+        [("", {}, llm.get('segundos_espera_limite', 0.0))]
+    )
+
+    planificador = metricas.get('planificador', {})
+    for nombre, clave, ayuda in (
+        ("planificador_reintentos_total", 'reintentos', "Reintentos del planificador de cuota"),
+        ("planificador_limitaciones_total", 'limitaciones', "Rechazos por cuota (429) recibidos"),
+        ("planificador_espera_cuota_segundos_total", 'segundos_espera_cuota', "Tiempo esperando los límites RPM/TPM"),
+        ("planificador_espera_reintentos_segundos_total", 'segundos_espera_reintentos', "Tiempo de backoff entre reintentos")
+    ):
+        metrica(nombre, "counter", ayuda, [("", {'servicio': servicio}, valores[clave]) for servicio, valores in planificador.items()])
+
+    return "\n".join(lineas) + "\n"
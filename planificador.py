@@ -0,0 +1,368 @@
+"""
+Planificador Module
+Limitador de cuota adaptativo y reintentos para llamadas a Vertex AI
+
+Cada servicio (LLM, embeddings) tiene un planificador compartido por todo el
+proceso que, antes de cada llamada:
+- espera en cubos de tokens de solicitudes/minuto y tokens/minuto,
+- ocupa un cupo de concurrencia cuyo límite se adapta con AIMD (sube de a
+  poco con cada éxito, se reduce a la mitad ante un 429 o latencia excesiva),
+y reintenta con espera exponencial con jitter los 429 y errores transitorios.
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Dict, List
+
+from google.api_core import exceptions as google_exceptions
+from langchain_core.embeddings import Embeddings
+
+# Errores de Vertex AI que se reintentan además de los 429
+ERRORES_TRANSITORIOS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.Aborted,
+    ConnectionError,
+    TimeoutError
+)
+
+
+def es_limitacion_cuota(error: Exception) -> bool:
+    """Si el error es un rechazo por cuota (HTTP 429 / RESOURCE_EXHAUSTED)"""
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return True
+    # Otros clientes HTTP exponen el código de estado en el error o su respuesta
+    respuesta = getattr(error, 'response', None)
+    codigos = (
+        getattr(error, 'code', None),
+        getattr(error, 'status_code', None),
+        getattr(respuesta, 'status_code', None)
+    )
+    if 429 in codigos:
+        return True
+    # Último recurso: el estado gRPC en el texto (no el número suelto, que
+    # puede aparecer en IDs, conteos de tokens o tamaños)
+    mensaje = str(error)
+    return 'RESOURCE_EXHAUSTED' in mensaje or 'Quota exceeded' in mensaje
+
+
+class CuboTokens:
+    """
+    Cubo de tokens con recarga continua
+
+    Admite saldo negativo (consumir) para cobrar después costos que solo se
+    conocen al terminar la llamada, como los tokens de respuesta.
+    """
+
+    def __init__(self, por_minuto: float, rafaga_segundos: float = 10.0):
+        """
+        Args:
+            por_minuto: Tokens recargados por minuto
+            rafaga_segundos: Segundos de recarga acumulables (tamaño del cubo)
+        """
+        self.tasa = por_minuto / 60.0
+        self.capacidad = max(1.0, self.tasa * rafaga_segundos)
+        self.saldo = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.saldo = min(self.capacidad, self.saldo + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def adquirir(self, cantidad: float) -> float:
+        """
+        Bloquea hasta poder retirar la cantidad
+
+        Returns:
+            Segundos esperados
+        """
+        # Una solicitud mayor que el cubo solo exige tenerlo lleno
+        requerido = min(cantidad, self.capacidad)
+        esperado = 0.0
+        while True:
+            with self._lock:
+                self._recargar()
+                if self.saldo >= requerido:
+                    self.saldo -= cantidad
+                    return esperado
+                espera = (requerido - self.saldo) / self.tasa
+            time.sleep(espera)
+            esperado += espera
+
+    def consumir(self, cantidad: float):
+        """Retira la cantidad sin esperar (el saldo puede quedar negativo)"""
+        with self._lock:
+            self._recargar()
+            self.saldo -= cantidad
+
+
+class PlanificadorLlamadas:
+    """
+    Planificador de llamadas a un servicio con cuota
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        rpm: float = 0,
+        tpm: float = 0,
+        concurrencia_inicial: int = 8,
+        concurrencia_min: int = 1,
+        concurrencia_max: int = 64,
+        latencia_objetivo: float = 0,
+        max_reintentos: int = 8,
+        espera_base: float = 1.0,
+        espera_max: float = 60.0,
+        intervalo_reduccion: float = 2.0
+    ):
+        """
+        Args:
+            nombre: Servicio ('llm', 'embeddings'); se usa en las métricas
+            rpm: Solicitudes por minuto (0 = sin límite)
+            tpm: Tokens por minuto (0 = sin límite)
+            concurrencia_inicial: Llamadas simultáneas al comenzar
+            concurrencia_min: Piso de la concurrencia adaptativa
+            concurrencia_max: Techo de la concurrencia adaptativa
+            latencia_objetivo: Segundos por encima de los cuales se reduce la
+                concurrencia (0 = solo reaccionar a 429)
+            max_reintentos: Reintentos por llamada antes de propagar el error
+            espera_base: Espera base del backoff exponencial
+            espera_max: Espera máxima entre reintentos
+            intervalo_reduccion: Segundos mínimos entre reducciones, para que
+                una ráfaga de 429 de la misma ventana cuente una sola vez
+        """
+        self.nombre = nombre
+        self.configuracion = {}
+        self.limite = float(concurrencia_inicial)
+        self._en_curso = 0
+        self._ultima_reduccion = 0.0
+        self._condicion = threading.Condition()
+        self._rng = random.Random()
+        self._stats = {
+            'llamadas': 0,
+            'fallidas': 0,
+            'reintentos': 0,
+            'limitaciones': 0,
+            'reducciones': 0,
+            'segundos_espera_cuota': 0.0,
+            'segundos_espera_reintentos': 0.0
+        }
+        self.reconfigurar(
+            rpm=rpm,
+            tpm=tpm,
+            concurrencia_min=concurrencia_min,
+            concurrencia_max=concurrencia_max,
+            latencia_objetivo=latencia_objetivo,
+            max_reintentos=max_reintentos,
+            espera_base=espera_base,
+            espera_max=espera_max,
+            intervalo_reduccion=intervalo_reduccion
+        )
+
+    def reconfigurar(
+        self,
+        rpm: float = 0,
+        tpm: float = 0,
+        concurrencia_min: int = 1,
+        concurrencia_max: int = 64,
+        latencia_objetivo: float = 0,
+        max_reintentos: int = 8,
+        espera_base: float = 1.0,
+        espera_max: float = 60.0,
+        intervalo_reduccion: float = 2.0
+    ):
+        """
+        Aplica límites nuevos conservando el estado adaptativo y las estadísticas
+
+        Los argumentos son los de __init__; el límite de concurrencia actual
+        se acota al nuevo rango.
+        """
+        configuracion = {
+            'rpm': rpm,
+            'tpm': tpm,
+            'concurrencia_min': concurrencia_min,
+            'concurrencia_max': concurrencia_max,
+            'latencia_objetivo': latencia_objetivo,
+            'max_reintentos': max_reintentos,
+            'espera_base': espera_base,
+            'espera_max': espera_max,
+            'intervalo_reduccion': intervalo_reduccion
+        }
+        with self._condicion:
+            if rpm != self.configuracion.get('rpm'):
+                self.cubo_solicitudes = CuboTokens(rpm) if rpm else None
+            if tpm != self.configuracion.get('tpm'):
+                self.cubo_tokens = CuboTokens(tpm) if tpm else None
+            self.concurrencia_min = max(1, concurrencia_min)
+            self.concurrencia_max = max(self.concurrencia_min, concurrencia_max)
+            self.limite = float(min(max(self.limite, self.concurrencia_min), self.concurrencia_max))
+            self.latencia_objetivo = latencia_objetivo
+            self.max_reintentos = max_reintentos
+            self.espera_base = espera_base
+            self.espera_max = espera_max
+            self.intervalo_reduccion = intervalo_reduccion
+            self.configuracion = configuracion
+            self._condicion.notify_all()
+
+    def _ocupar(self):
+        """Espera un cupo de concurrencia"""
+        with self._condicion:
+            while self._en_curso >= int(self.limite):
+                self._condicion.wait()
+            self._en_curso += 1
+
+    def _liberar(self, exito: bool, limitado: bool, latencia: float):
+        """Libera el cupo y ajusta el límite (AIMD)"""
+        with self._condicion:
+            self._en_curso -= 1
+            ahora = time.monotonic()
+            lenta = self.latencia_objetivo and latencia > self.latencia_objetivo
+
+            if limitado or (exito and lenta):
+                if ahora - self._ultima_reduccion >= self.intervalo_reduccion:
+                    self.limite = max(self.concurrencia_min, self.limite / 2)
+                    self._ultima_reduccion = ahora
+                    self._stats['reducciones'] += 1
+            elif exito:
+                # Aumento aditivo: ~+1 por cada "ventana" completa de llamadas
+                self.limite = min(self.concurrencia_max, self.limite + 1 / self.limite)
+
+            self._condicion.notify_all()
+
+    def _espera_reintento(self, intento: int) -> float:
+        """Backoff exponencial con jitter completo"""
+        return self._rng.uniform(0, min(self.espera_max, self.espera_base * (2 ** intento)))
+
+    def ejecutar(self, funcion: Callable, tokens: int = 0, metricas=None):
+        """
+        Ejecuta una llamada respetando cuota y concurrencia, con reintentos
+
+        Args:
+            funcion: Llamada sin argumentos
+            tokens: Tokens estimados de la solicitud (para el límite TPM)
+            metricas: Metricas donde registrar reintentos y esperas
+
+        Returns:
+            Resultado de la llamada
+        """
+        reintentos = limitaciones = 0
+        espera_cuota = espera_reintentos = 0.0
+
+        try:
+            for intento in range(self.max_reintentos + 1):
+                if self.cubo_solicitudes is not None:
+                    espera_cuota += self.cubo_solicitudes.adquirir(1)
+                if self.cubo_tokens is not None and tokens:
+                    espera_cuota += self.cubo_tokens.adquirir(tokens)
+
+                self._ocupar()
+                inicio = time.perf_counter()
+                try:
+                    resultado = funcion()
+                except Exception as e:
+                    limitado = es_limitacion_cuota(e)
+                    self._liberar(False, limitado, time.perf_counter() - inicio)
+                    limitaciones += int(limitado)
+                    if not (limitado or isinstance(e, ERRORES_TRANSITORIOS)) or intento == self.max_reintentos:
+                        with self._condicion:
+                            self._stats['fallidas'] += 1
+                        raise
+                    espera = self._espera_reintento(intento)
+                    reintentos += 1
+                    espera_reintentos += espera
+                    time.sleep(espera)
+                    continue
+
+                self._liberar(True, False, time.perf_counter() - inicio)
+                return resultado
+
+        finally:
+            with self._condicion:
+                self._stats['llamadas'] += 1
+                self._stats['reintentos'] += reintentos
+                self._stats['limitaciones'] += limitaciones
+                self._stats['segundos_espera_cuota'] += espera_cuota
+                self._stats['segundos_espera_reintentos'] += espera_reintentos
+            if metricas is not None:
+                metricas.registrar_planificador(
+                    self.nombre,
+                    reintentos=reintentos,
+                    limitaciones=limitaciones,
+                    espera_cuota=espera_cuota,
+                    espera_reintentos=espera_reintentos
+                )
+
+    def consumir_tokens(self, tokens: int):
+        """Cobra tokens conocidos después de la llamada (p. ej. de respuesta)"""
+        if self.cubo_tokens is not None and tokens:
+            self.cubo_tokens.consumir(tokens)
+
+    def estadisticas(self) -> Dict:
+        """Contadores acumulados y concurrencia actual"""
+        with self._condicion:
+            stats = dict(self._stats)
+            stats['concurrencia_limite'] = int(self.limite)
+            stats['en_curso'] = self._en_curso
+        return stats
+
+
+class EmbeddingsPlanificados(Embeddings):
+    """
+    Envoltorio de embeddings que pasa cada lote por un planificador
+    """
+
+    def __init__(self, embeddings: Embeddings, planificador: PlanificadorLlamadas, metricas=None):
+        self.embeddings = embeddings
+        self.planificador = planificador
+        self.metricas = metricas
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.planificador.ejecutar(
+            lambda: self.embeddings.embed_documents(texts),
+            tokens=sum(len(t) for t in texts) // 4,
+            metricas=self.metricas
+        )
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.planificador.ejecutar(
+            lambda: self.embeddings.embed_query(text),
+            tokens=len(text) // 4,
+            metricas=self.metricas
+        )
+
+
+# Planificadores del proceso por servicio y modelo
+_planificadores: Dict[str, PlanificadorLlamadas] = {}
+_lock_planificadores = threading.Lock()
+
+
+def obtener_planificador(clave: str, nombre: str, **configuracion) -> PlanificadorLlamadas:
+    """
+    Planificador compartido por todo el proceso para una cuota
+
+    Args:
+        clave: Identifica la cuota (p. ej. 'llm:gemini-2.0-flash-exp')
+        nombre: Servicio para las métricas
+        **configuracion: Argumentos de PlanificadorLlamadas; si el
+            planificador de esa clave ya existe con otros límites, se le
+            aplican los nuevos (la cuota del servicio es una sola)
+
+    Returns:
+        Planificador
+    """
+    with _lock_planificadores:
+        if clave not in _planificadores:
+            _planificadores[clave] = PlanificadorLlamadas(nombre, **configuracion)
+            return _planificadores[clave]
+
+        planificador = _planificadores[clave]
+        anterior = planificador.configuracion
+        configuracion.pop('concurrencia_inicial', None)
+        planificador.reconfigurar(**configuracion)
+        if planificador.configuracion != anterior:
+            print(f"⚠️ Planificador {clave} reconfigurado: {anterior} -> {planificador.configuracion}")
+        return planificador
@@ -0,0 +1,381 @@
+"""
+Proveedores Module
+Proveedores de LLM y embeddings intercambiables para CONTRACTIA AI
+
+'vertexai' construye los clientes reales de Vertex AI. 'local' es un
+sustituto sin red para pruebas de carga: latencias con distribución
+configurable, inyección de errores de cuota (429) y respuestas y embeddings
+determinísticos.
+"""
+
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from google.api_core.exceptions import ResourceExhausted
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# Fábricas registradas: nombre -> función que retorna (embeddings, llm)
+PROVEEDORES: Dict[str, Callable[..., Tuple[Embeddings, Any]]] = {}
+
+
+def registrar_proveedor(nombre: str):
+    """
+    Decorador que registra una fábrica de proveedor
+
+    La fábrica recibe credentials, modelo_embeddings, modelo_llm, temperatura
+    y las opciones propias del proveedor, y retorna (embeddings, llm).
+    """
+    def decorador(fabrica):
+        PROVEEDORES[nombre] = fabrica
+        return fabrica
+    return decorador
+
+
+def crear_proveedores(
+    proveedor: str,
+    credentials=None,
+    modelo_embeddings: str = "textembedding-gecko@latest",
+    modelo_llm: str = "gemini-2.0-flash-exp",
+    temperatura: float = 0.1,
+    **opciones
+) -> Tuple[Embeddings, Any]:
+    """
+    Construye los clientes de embeddings y LLM del proveedor indicado
+
+    Args:
+        proveedor: Nombre registrado ('vertexai', 'local', ...)
+        credentials: Credenciales de Google Cloud (solo 'vertexai')
+        modelo_embeddings: Modelo de embeddings
+        modelo_llm: Modelo de lenguaje
+        temperatura: Temperatura del LLM
+        **opciones: Opciones propias del proveedor
+
+    Returns:
+        (embeddings, llm)
+    """
+    if proveedor not in PROVEEDORES:
+        raise ValueError(f"Proveedor desconocido: {proveedor} (disponibles: {', '.join(sorted(PROVEEDORES))})")
+    return PROVEEDORES[proveedor](
+        credentials=credentials,
+        modelo_embeddings=modelo_embeddings,
+        modelo_llm=modelo_llm,
+        temperatura=temperatura,
+        **opciones
+    )
+
+
+@registrar_proveedor('vertexai')
+def _crear_vertexai(credentials, modelo_embeddings, modelo_llm, temperatura, **opciones):
+    """Clientes de Vertex AI (embeddings y Gemini)"""
+    from langchain_google_vertexai import ChatVertexAI, VertexAIEmbeddings
+
+    # Los reintentos los hace el planificador (planificador.py); un solo
+    # intento por llamada evita multiplicar reintentos anidados
+    opciones.setdefault('max_retries', 1)
+
+    # Pasa las credenciales a VertexAIEmbeddings
+    embeddings = VertexAIEmbeddings(
+        model_name=modelo_embeddings,
+        credentials=credentials,
+        max_retries=opciones['max_retries']
+    )
+
+    # Pasa las credenciales a ChatVertexAI
+    llm = ChatVertexAI(
+        model_name=modelo_llm,
+        temperature=temperatura,
+        max_tokens=8192,
+        credentials=credentials,
+        **opciones
+    )
+    return embeddings, llm
+
+
+class DistribucionLatencia:
+    """
+    Distribución de latencias (segundos) para el proveedor local
+
+    Tipos: 'constante' (media), 'normal' y 'lognormal' (media, desviacion),
+    'empirica' (muestrea una lista de valores) e 'histograma' (uniforme dentro
+    de los buckets de un histograma acumulado, como el de Metricas).
+    """
+
+    def __init__(
+        self,
+        tipo: str = 'constante',
+        media: float = 0.0,
+        desviacion: float = 0.0,
+        valores: Optional[List[float]] = None,
+        limites: Optional[List[float]] = None,
+        conteos: Optional[List[int]] = None,
+        total: Optional[int] = None,
+        semilla: Optional[int] = None
+    ):
+        self.tipo = tipo
+        self.media = media
+        self.desviacion = desviacion
+        self.valores = list(valores or [])
+        self.limites = list(limites or [])
+        self.conteos = list(conteos or [])
+        self.total = total if total is not None else (self.conteos[-1] if self.conteos else 0)
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+
+        if tipo not in ('constante', 'normal', 'lognormal', 'empirica', 'histograma'):
+            raise ValueError(f"Tipo de distribución desconocido: {tipo}")
+        if tipo == 'empirica' and not self.valores:
+            raise ValueError("La distribución empírica requiere valores")
+        if tipo == 'histograma' and not self.total:
+            raise ValueError("El histograma no tiene muestras")
+
+    @classmethod
+    def desde_config(cls, config: Optional[Dict], semilla: Optional[int] = None) -> "DistribucionLatencia":
+        """
+        Crea la distribución desde un diccionario de configuración
+
+        Acepta {'tipo': ..., 'media': ..., ...}, un número (latencia constante)
+        o el bloque auditoria['metricas']['llm']['latencia'] de una ejecución
+        real, para reproducir su perfil de latencias.
+        """
+        if config is None:
+            return cls(semilla=semilla)
+        if isinstance(config, (int, float)):
+            return cls('constante', media=float(config), semilla=semilla)
+        if 'histograma' in config:
+            histograma = config['histograma']
+            return cls(
+                'histograma',
+                limites=histograma['limites'],
+                conteos=histograma['conteos'],
+                # Las muestras por encima del último límite caen en el bucket +Inf
+                total=max(histograma['conteos'][-1] if histograma['conteos'] else 0, int(config.get('llamadas', 0))),
+                media=config.get('max', 0.0),
+                semilla=semilla
+            )
+        return cls(semilla=semilla, **config)
+
+    def muestrear(self) -> float:
+        """Retorna una latencia en segundos"""
+        with self._lock:
+            if self.tipo == 'constante':
+                return max(0.0, self.media)
+            if self.tipo == 'normal':
+                return max(0.0, self._rng.gauss(self.media, self.desviacion))
+            if self.tipo == 'lognormal':
+                if self.media <= 0:
+                    return 0.0
+                # Parámetros de la normal subyacente a partir de media y desviación
+                varianza = np.log(1 + (self.desviacion / self.media) ** 2)
+                return self._rng.lognormvariate(np.log(self.media) - varianza / 2, np.sqrt(varianza))
+            if self.tipo == 'empirica':
+                return self._rng.choice(self.valores)
+
+            # Histograma: elegir bucket según su frecuencia y un valor uniforme dentro
+            objetivo = self._rng.randint(1, self.total)
+            inferior = 0.0
+            for limite, conteo in zip(self.limites, self.conteos):
+                if objetivo <= conteo:
+                    return self._rng.uniform(inferior, limite)
+                inferior = limite
+            # Bucket +Inf: entre el último límite y el máximo observado
+            return self._rng.uniform(inferior, max(inferior, self.media))
+
+
+class SimuladorCuota:
+    """
+    Inyecta errores 429 por probabilidad y/o por límite de solicitudes por minuto
+    """
+
+    def __init__(self, tasa_429: float = 0.0, limite_rpm: int = 0, semilla: Optional[int] = None):
+        """
+        Args:
+            tasa_429: Probabilidad de rechazar cada solicitud
+            limite_rpm: Solicitudes aceptadas por ventana de 60 s (0 = sin límite)
+            semilla: Semilla para las fallas aleatorias
+        """
+        self.tasa_429 = tasa_429
+        self.limite_rpm = limite_rpm
+        self.rechazadas = 0
+        self._rng = random.Random(semilla)
+        self._solicitudes = deque()
+        self._lock = threading.Lock()
+
+    def verificar(self):
+        """Registra una solicitud o lanza ResourceExhausted (429)"""
+        ahora = time.monotonic()
+        with self._lock:
+            while self._solicitudes and ahora - self._solicitudes[0] >= 60:
+                self._solicitudes.popleft()
+
+            rechazar = (
+                (self.tasa_429 and self._rng.random() < self.tasa_429)
+                or (self.limite_rpm and len(self._solicitudes) >= self.limite_rpm)
+            )
+            if rechazar:
+                self.rechazadas += 1
+            else:
+                self._solicitudes.append(ahora)
+
+        if rechazar:
+            raise ResourceExhausted("429 Quota exceeded (proveedor local)")
+
+
+def _semilla_texto(texto: str) -> int:
+    """Semilla estable de 64 bits derivada de un texto"""
+    return int.from_bytes(hashlib.sha256(texto.encode('utf-8')).digest()[:8], 'little')
+
+
+class EmbeddingsLocal(Embeddings):
+    """
+    Embeddings determinísticos sin red: el vector depende solo del texto
+    """
+
+    def __init__(
+        self,
+        dimension: int = 768,
+        latencia: Optional[DistribucionLatencia] = None,
+        cuota: Optional[SimuladorCuota] = None
+    ):
+        self.dimension = dimension
+        self.latencia = latencia or DistribucionLatencia()
+        self.cuota = cuota or SimuladorCuota()
+
+    def _vector(self, texto: str) -> List[float]:
+        vector = np.random.default_rng(_semilla_texto(texto)).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.cuota.verificar()
+        time.sleep(self.latencia.muestrear())
+        return [self._vector(texto) for texto in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# Bloques de sección en los prompts de coherencia (individual y por lotes)
+_PATRON_BLOQUE_LOTE = re.compile(r"=== SECCIÓN: (\S+) ===\n(.*?)=== FIN SECCIÓN ===", re.DOTALL)
+_PATRON_SECCION_PROMPT = re.compile(r"^SECCIÓN: (\S+)$", re.MULTILINE)
+_SEVERIDADES = ('alta', 'media', 'baja')
+
+
+class LLMLocal(BaseChatModel):
+    """
+    Modelo de chat sin red con respuestas determinísticas
+
+    Para cada sección del prompt decide según el hash de su contenido si
+    reporta un hallazgo (con probabilidad tasa_hallazgos), en el formato
+    TIPO/DESCRIPCIÓN/SEVERIDAD que esperan los parsers. 'respuestas' permite
+    fijar la respuesta de secciones concretas.
+    """
+
+    latencia: Any = None
+    cuota: Any = None
+    tasa_hallazgos: float = 0.2
+    respuestas: Dict[str, str] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "local"
+
+    def _hallazgo(self, seccion_id: str, contenido: str) -> str:
+        if seccion_id in self.respuestas:
+            return self.respuestas[seccion_id]
+        semilla = _semilla_texto(f"{seccion_id}\x1f{contenido}")
+        if (semilla % 10000) / 10000 >= self.tasa_hallazgos:
+            return ""
+        return (
+            f"TIPO: Inconsistencia simulada\n"
+            f"DESCRIPCIÓN: Hallazgo determinístico {semilla % 100000:05d} en {seccion_id}\n"
+            f"SEVERIDAD: {_SEVERIDADES[semilla % len(_SEVERIDADES)]}"
+        )
+
+    def _responder(self, prompt: str) -> str:
+        bloques = _PATRON_BLOQUE_LOTE.findall(prompt)
+        if bloques:
+            # Cada sección del lote se responde explícitamente (ver VERSION_PROMPT_LOTE)
+            return "\n\n".join(
+                f"SECCIÓN: {seccion_id}\n{self._hallazgo(seccion_id, contenido) or 'SIN_HALLAZGOS'}"
+                for seccion_id, contenido in bloques
+            )
+
+        match = _PATRON_SECCION_PROMPT.search(prompt)
+        seccion_id = match.group(1) if match else "desconocida"
+        return self._hallazgo(seccion_id, prompt) or "SIN_HALLAZGOS"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any
+    ) -> ChatResult:
+        if self.cuota is not None:
+            self.cuota.verificar()
+        if self.latencia is not None:
+            time.sleep(self.latencia.muestrear())
+
+        prompt = "\n".join(str(message.content) for message in messages)
+        contenido = self._responder(prompt)
+        tokens_prompt = max(1, len(prompt) // 4)
+        tokens_respuesta = max(1, len(contenido) // 4)
+        mensaje = AIMessage(
+            content=contenido,
+            usage_metadata={
+                'input_tokens': tokens_prompt,
+                'output_tokens': tokens_respuesta,
+                'total_tokens': tokens_prompt + tokens_respuesta
+            }
+        )
+        return ChatResult(generations=[ChatGeneration(message=mensaje)])
+
+
+@registrar_proveedor('local')
+def _crear_local(
+    credentials,
+    modelo_embeddings,
+    modelo_llm,
+    temperatura,
+    latencia_llm: Optional[Dict] = None,
+    latencia_embeddings: Optional[Dict] = None,
+    tasa_429: float = 0.0,
+    limite_rpm: int = 0,
+    tasa_hallazgos: float = 0.2,
+    respuestas: Optional[Dict[str, str]] = None,
+    dimension: int = 768,
+    semilla: int = 42
+):
+    """
+    Sustituto local de Vertex AI para pruebas de carga
+
+    Args:
+        latencia_llm: Configuración de DistribucionLatencia de cada llamada al LLM
+        latencia_embeddings: Configuración de DistribucionLatencia por lote de embeddings
+        tasa_429: Probabilidad de error de cuota por solicitud
+        limite_rpm: Solicitudes por minuto aceptadas antes de responder 429
+        tasa_hallazgos: Fracción de secciones con un hallazgo simulado
+        respuestas: Respuestas fijas por seccion_id
+        dimension: Dimensión de los embeddings
+        semilla: Semilla de latencias y fallas
+    """
+    embeddings = EmbeddingsLocal(
+        dimension=dimension,
+        latencia=DistribucionLatencia.desde_config(latencia_embeddings, semilla),
+        cuota=SimuladorCuota(tasa_429, limite_rpm, semilla)
+    )
+    llm = LLMLocal(
+        latencia=DistribucionLatencia.desde_config(latencia_llm, semilla),
+        cuota=SimuladorCuota(tasa_429, limite_rpm, semilla + 1),
+        tasa_hallazgos=tasa_hallazgos,
+        respuestas=respuestas or {}
+    )
+    return embeddings, llm
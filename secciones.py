@@ -0,0 +1,95 @@
+"""
+Secciones Module
+Representación compacta de las secciones segmentadas de un contrato
+
+Todas las secciones de un contrato comparten un único buffer con sus contenidos
+consecutivos y guardan solo sus offsets [inicio, fin) en él; el contenido se
+extrae del buffer cuando se pide. Cada sección se comporta como el diccionario de solo lectura que
+producía la segmentación ('tipo', 'numero', 'titulo', 'linea_inicio',
+'contenido'), por lo que el resto del pipeline no necesita cambios.
+"""
+
+from collections.abc import Mapping
+from typing import Iterable, Iterator, List, Tuple
+
+# Claves del diccionario equivalente, en el orden original
+CLAVES_SECCION = ('tipo', 'numero', 'titulo', 'linea_inicio', 'contenido')
+
+
+class Seccion(Mapping):
+    """
+    Sección del contrato como vista sobre el buffer compartido
+    """
+
+    __slots__ = ('texto', 'tipo', 'numero', 'titulo', 'linea_inicio', 'inicio', 'fin')
+
+    def __init__(self, texto: str, tipo: str, numero: str, titulo: str, linea_inicio: int, inicio: int, fin: int):
+        """
+        Args:
+            texto: Buffer compartido por las secciones del contrato
+            tipo: 'capitulo', 'anexo' o 'clausula'
+            numero: Número de la sección
+            titulo: Título de la sección
+            linea_inicio: Línea del encabezado en el texto
+            inicio: Offset del primer carácter del contenido en el buffer
+            fin: Offset siguiente al último carácter del contenido en el buffer
+        """
+        self.texto = texto
+        self.tipo = tipo
+        self.numero = numero
+        self.titulo = titulo
+        self.linea_inicio = linea_inicio
+        self.inicio = inicio
+        self.fin = fin
+
+    @property
+    def contenido(self) -> str:
+        """Contenido de la sección, extraído del buffer en cada acceso"""
+        return self.texto[self.inicio:self.fin]
+
+    def __len__(self) -> int:
+        return len(CLAVES_SECCION)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(CLAVES_SECCION)
+
+    def __getitem__(self, clave: str):
+        if clave not in CLAVES_SECCION:
+            raise KeyError(clave)
+        return getattr(self, clave)
+
+    def __reduce__(self):
+        # Al serializar (p. ej. hacia otro proceso) se envía solo el
+        # contenido propio, no el buffer de todo el contrato
+        return (dict, (dict(self),))
+
+    def __repr__(self) -> str:
+        return (f"Seccion(tipo={self.tipo!r}, numero={self.numero!r}, titulo={self.titulo!r}, "
+                f"linea_inicio={self.linea_inicio}, inicio={self.inicio}, fin={self.fin})")
+
+
+def crear_secciones(texto: str, limites: Iterable[Tuple[str, str, str, int, int, int]]) -> List[Seccion]:
+    """
+    Crea las secciones de un contrato a partir de sus offsets en el texto
+
+    Los contenidos se copian una sola vez, consecutivos, a un buffer propio:
+    el texto que no pertenece a ninguna sección (p. ej. cláusulas reemplazadas
+    por la siguiente) no se retiene y el texto normalizado puede liberarse.
+
+    Args:
+        texto: Texto normalizado completo
+        limites: Tuplas (tipo, numero, titulo, linea_inicio, inicio, fin)
+
+    Returns:
+        Lista de secciones que comparten el buffer
+    """
+    limites = list(limites)
+    buffer = "".join([texto[inicio:fin] for *_, inicio, fin in limites])
+
+    secciones = []
+    posicion = 0
+    for tipo, numero, titulo, linea_inicio, inicio, fin in limites:
+        largo = max(0, fin - inicio)
+        secciones.append(Seccion(buffer, tipo, numero, titulo, linea_inicio, posicion, posicion + largo))
+        posicion += largo
+    return secciones
@@ -3,15 +3,16 @@ Utils Module
 Funciones auxiliares para CONTRACTIA AI
 """
 
+import io
 import os
+import tempfile
 import vertexai
 from datetime import datetime
-from typing import Dict
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, TextIO
 import zipfile
 from pathlib import Path
 import streamlit as st
-from google.oauth2 import service_account
-from google.cloud import aiplatform
+from clientes import inicializar_vertexai
 import json
 
 # Esta función ahora retorna el objeto credentials
@@ -21,18 +22,8 @@ def obtener_credenciales_vertexai():
             # Carga el JSON literal
             credentials_info = json.loads(st.secrets["GCP_SA_JSON"])
 
-            # Crea el objeto de credenciales directamente desde el diccionario
-            credentials = service_account.Credentials.from_service_account_info(
-                credentials_info,
-                scopes=['https://www.googleapis.com/auth/cloud-platform']
-            )
-
-            # Opcional: inicializar aiplatform para otras librerías
-            aiplatform.init(
-                project=credentials_info.get("project_id"),
-                location="us-central1", 
-                credentials=credentials # Pasamos el objeto
-            )
+            # Credenciales e inicialización cacheadas por proceso (ver clientes.py)
+            credentials = inicializar_vertexai(credentials_info)
 
             st.success("✅ Credenciales de Google Cloud cargadas correctamente.")
             return credentials, credentials_info.get("project_id")
@@ -78,19 +69,81 @@ def configurar_entorno_vertexai() -> bool:
         return False
 
 
-def generar_reporte_markdown(resultados: Dict) -> str:
+# Títulos de las secciones de hallazgos por severidad, en orden del reporte
+SEVERIDADES_REPORTE = [
+    ('alta', "### 🔴 Severidad Alta"),
+    ('media', "\n### 🟡 Severidad Media"),
+    ('baja', "\n### 🔵 Severidad Baja")
+]
+
+
+def iterar_reporte_markdown(
+    resultados: Dict,
+    timestamp: Optional[str] = None,
+    tamano_fragmento: int = 64 * 1024
+) -> Iterator[str]:
+    """
+    Genera el reporte Markdown como una secuencia de fragmentos
+    
+    Los hallazgos se clasifican por severidad en una sola pasada y el texto se
+    emite a medida que se produce, sin construir el reporte completo.
+    
+    Args:
+        resultados: Diccionario con resultados de auditoría
+        timestamp: Fecha de análisis (por defecto, ahora)
+        tamano_fragmento: Caracteres aproximados por fragmento
+        
+    Yields:
+        Fragmentos consecutivos del reporte
+    """
+    piezas = []
+    acumulado = 0
+    for pieza in _piezas_reporte(resultados, timestamp):
+        piezas.append(pieza)
+        acumulado += len(pieza)
+        if acumulado >= tamano_fragmento:
+            yield "".join(piezas)
+            piezas.clear()
+            acumulado = 0
+    if piezas:
+        yield "".join(piezas)
+
+
+def generar_reporte_markdown(resultados: Dict, timestamp: Optional[str] = None) -> str:
     """
     Genera un reporte en formato Markdown a partir de los resultados de auditoría
     
     Args:
         resultados: Diccionario con resultados de auditoría
+        timestamp: Fecha de análisis (por defecto, ahora)
         
     Returns:
         Reporte en formato Markdown
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return "".join(_piezas_reporte(resultados, timestamp))
+
+
+def escribir_reporte_markdown(resultados: Dict, destino: TextIO, timestamp: Optional[str] = None):
+    """
+    Escribe el reporte Markdown por fragmentos en un archivo de texto abierto
+    
+    Args:
+        resultados: Diccionario con resultados de auditoría
+        destino: Archivo o stream de texto
+        timestamp: Fecha de análisis (por defecto, ahora)
+    """
+    for fragmento in iterar_reporte_markdown(resultados, timestamp):
+        destino.write(fragmento)
+
+
+def _piezas_reporte(resultados: Dict, timestamp: Optional[str] = None) -> Iterator[str]:
+    """Piezas de texto del reporte, en orden"""
+    if timestamp is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    hallazgos = resultados.get('hallazgos_consistencia', [])
     
-    reporte = f"""# 📋 Reporte de Auditoría de Contrato APP
+    yield f"""# 📋 Reporte de Auditoría de Contrato APP
 
 **CONTRACTIA AI - Sistema Automatizado de Auditoría**  
 **Fecha de análisis:** {timestamp}
@@ -104,7 +157,7 @@ def generar_reporte_markdown(resultados: Dict) -> str:
 | **Total de Secciones Analizadas** | {resultados.get('total_secciones', 0)} |
 | **Referencias Totales Encontradas** | {resultados.get('total_referencias', 0)} |
 | **Referencias Rotas Detectadas** | {resultados.get('referencias_rotas', 0)} |
-| **Total de Hallazgos** | {len(resultados.get('hallazgos_consistencia', []))} |
+| **Total de Hallazgos** | {len(hallazgos)} |
 
 ### Precisión de Referencias
 """
@@ -113,85 +166,214 @@ def generar_reporte_markdown(resultados: Dict) -> str:
     referencias_rotas = resultados.get('referencias_rotas', 0)
     if total_refs > 0:
         precision = ((total_refs - referencias_rotas) / total_refs) * 100
-        reporte += f"- **Tasa de éxito:** {precision:.2f}%\n"
-        reporte += f"- **Tasa de error:** {(100 - precision):.2f}%\n"
+        yield f"- **Tasa de éxito:** {precision:.2f}%\n"
+        yield f"- **Tasa de error:** {(100 - precision):.2f}%\n"
     else:
-        reporte += "- No se encontraron referencias para analizar\n"
+        yield "- No se encontraron referencias para analizar\n"
     
-    reporte += "\n---\n\n"
+    yield "\n---\n\n"
+    
+    # Reauditoría incremental
+    reauditoria = resultados.get('reauditoria')
+    if reauditoria:
+        reutilizadas = reauditoria.get('secciones_reutilizadas', [])
+        revalidadas = reauditoria.get('secciones_revalidadas', [])
+        yield "## 🔁 Reauditoría Incremental\n\n"
+        yield f"- **Secciones reutilizadas de la versión anterior:** {len(reutilizadas)}\n"
+        yield f"- **Secciones revalidadas (modificadas o afectadas):** {len(revalidadas)}\n\n"
+        if revalidadas:
+            yield "Secciones revalidadas: " + ", ".join(revalidadas) + "\n"
+        yield "\n---\n\n"
+    
+    # Hallazgos por severidad, clasificados en una sola pasada
+    por_severidad = {severidad: [] for severidad, _ in SEVERIDADES_REPORTE}
+    for h in hallazgos:
+        grupo = por_severidad.get(h.get('severidad'))
+        if grupo is not None:
+            grupo.append(h)
     
-    # Hallazgos por severidad
-    hallazgos = resultados.get('hallazgos_consistencia', [])
     if hallazgos:
-        reporte += "## ⚠️ Hallazgos Detectados\n\n"
+        yield "## ⚠️ Hallazgos Detectados\n\n"
         
-        # Clasificar por severidad
-        hallazgos_alta = [h for h in hallazgos if h.get('severidad') == 'alta']
-        hallazgos_media = [h for h in hallazgos if h.get('severidad') == 'media']
-        hallazgos_baja = [h for h in hallazgos if h.get('severidad') == 'baja']
-        
-        reporte += f"### 🔴 Severidad Alta ({len(hallazgos_alta)} hallazgos)\n\n"
-        for i, h in enumerate(hallazgos_alta, 1):
-            reporte += f"**{i}. {h.get('tipo', 'Error desconocido')}**\n"
-            reporte += f"- **Ubicación:** {h.get('ubicacion', 'N/A')}\n"
-            reporte += f"- **Descripción:** {h.get('descripcion', 'N/A')}\n\n"
-        
-        reporte += f"\n### 🟡 Severidad Media ({len(hallazgos_media)} hallazgos)\n\n"
-        for i, h in enumerate(hallazgos_media, 1):
-            reporte += f"**{i}. {h.get('tipo', 'Error desconocido')}**\n"
-            reporte += f"- **Ubicación:** {h.get('ubicacion', 'N/A')}\n"
-            reporte += f"- **Descripción:** {h.get('descripcion', 'N/A')}\n\n"
-        
-        reporte += f"\n### 🔵 Severidad Baja ({len(hallazgos_baja)} hallazgos)\n\n"
-        for i, h in enumerate(hallazgos_baja, 1):
-            reporte += f"**{i}. {h.get('tipo', 'Error desconocido')}**\n"
-            reporte += f"- **Ubicación:** {h.get('ubicacion', 'N/A')}\n"
-            reporte += f"- **Descripción:** {h.get('descripcion', 'N/A')}\n\n"
+        for severidad, titulo in SEVERIDADES_REPORTE:
+            grupo = por_severidad[severidad]
+            yield f"{titulo} ({len(grupo)} hallazgos)\n\n"
+            for i, h in enumerate(grupo, 1):
+                yield (
+                    f"**{i}. {h.get('tipo', 'Error desconocido')}**\n"
+                    f"- **Ubicación:** {h.get('ubicacion', 'N/A')}\n"
+                    f"- **Descripción:** {h.get('descripcion', 'N/A')}\n\n"
+                )
     else:
-        reporte += "## ✅ Sin Hallazgos Críticos\n\n"
-        reporte += "El contrato cumple con los estándares de coherencia y validación.\n"
+        yield "## ✅ Sin Hallazgos Críticos\n\n"
+        yield "El contrato cumple con los estándares de coherencia y validación.\n"
     
-    reporte += "\n---\n\n"
+    yield "\n---\n\n"
     
     # Hallazgos por sección
     hallazgos_por_seccion = resultados.get('hallazgos_por_seccion', {})
     if hallazgos_por_seccion:
-        reporte += "## 📑 Hallazgos por Sección\n\n"
+        yield "## 📑 Hallazgos por Sección\n\n"
         
         for seccion_id, hallazgos_sec in hallazgos_por_seccion.items():
-            reporte += f"### {seccion_id}\n\n"
-            reporte += f"Total de hallazgos: **{len(hallazgos_sec)}**\n\n"
+            yield f"### {seccion_id}\n\n"
+            yield f"Total de hallazgos: **{len(hallazgos_sec)}**\n\n"
             
             for i, h in enumerate(hallazgos_sec, 1):
-                reporte += f"{i}. **{h.get('tipo', 'Error')}** - {h.get('descripcion', 'N/A')}\n"
+                yield f"{i}. **{h.get('tipo', 'Error')}** - {h.get('descripcion', 'N/A')}\n"
             
-            reporte += "\n"
+            yield "\n"
     
     # Recomendaciones
-    reporte += "---\n\n## 💡 Recomendaciones\n\n"
+    yield "---\n\n## 💡 Recomendaciones\n\n"
     
     if referencias_rotas > 0:
-        reporte += f"1. **Corregir referencias rotas:** Se detectaron {referencias_rotas} referencias que no apuntan a secciones existentes. Revisar y corregir todas las referencias cruzadas.\n\n"
+        yield f"1. **Corregir referencias rotas:** Se detectaron {referencias_rotas} referencias que no apuntan a secciones existentes. Revisar y corregir todas las referencias cruzadas.\n\n"
     
+    hallazgos_alta = por_severidad['alta']
     if len(hallazgos_alta) > 0:
-        reporte += f"2. **Atender hallazgos críticos:** Hay {len(hallazgos_alta)} hallazgos de severidad alta que requieren atención inmediata.\n\n"
+        yield f"2. **Atender hallazgos críticos:** Hay {len(hallazgos_alta)} hallazgos de severidad alta que requieren atención inmediata.\n\n"
     
-    reporte += "3. **Revisión legal:** Someter el contrato a revisión legal experta antes de la firma final.\n\n"
-    reporte += "4. **Validación cruzada:** Contrastar con lineamientos vigentes de ProInversión y el MEF.\n\n"
+    yield "3. **Revisión legal:** Someter el contrato a revisión legal experta antes de la firma final.\n\n"
+    yield "4. **Validación cruzada:** Contrastar con lineamientos vigentes de ProInversión y el MEF.\n\n"
     
     # Footer
-    reporte += "---\n\n"
-    reporte += "*Reporte generado automáticamente por CONTRACTIA AI*  \n"
-    reporte += "*Team DataLaw - UTEC | Maestría en Data Science e Inteligencia Artificial*\n"
+    yield "---\n\n"
+    yield "*Reporte generado automáticamente por CONTRACTIA AI*  \n"
+    yield "*Team DataLaw - UTEC | Maestría en Data Science e Inteligencia Artificial*\n"
+
+
+# Bytes que un ZIP en construcción mantiene en memoria antes de pasar a disco
+ZIP_MAX_MEMORIA = 32 * 1024 * 1024
+
+
+def iterar_json(datos, indent: Optional[int] = 2) -> Iterator[str]:
+    """
+    Codifica datos como JSON por fragmentos, sin construir la cadena completa
+    
+    Args:
+        datos: Objeto serializable
+        indent: Sangría (igual que json.dumps)
+        
+    Yields:
+        Fragmentos consecutivos del JSON
+    """
+    return json.JSONEncoder(indent=indent, ensure_ascii=False).iterencode(datos)
+
+
+def _escribir_texto_zip(zipf: zipfile.ZipFile, nombre: str, fragmentos: Iterable[str]):
+    """Escribe un archivo de texto en el ZIP a medida que llegan los fragmentos"""
+    with zipf.open(nombre, 'w') as destino:
+        with io.TextIOWrapper(destino, encoding='utf-8', newline='') as texto:
+            for fragmento in fragmentos:
+                texto.write(fragmento)
+
+
+def _nombre_archivo_seccion(seccion_id: str) -> str:
+    """Nombre de archivo seguro para una sección"""
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in seccion_id)
+
+
+def _readme_zip(timestamp: str, por_seccion: bool = False) -> str:
+    """README incluido en el ZIP de resultados"""
+    contenido_secciones = ""
+    if por_seccion:
+        contenido_secciones = "3. **secciones/** - Hallazgos de cada sección en JSON\n"
+    return f"""# Resultados de Auditoría CONTRACTIA AI
+
+Fecha: {timestamp}
+
+## Contenido del archivo
+
+1. **reporte_auditoria.md** - Reporte completo en formato Markdown
+2. **resultados_detallados.json** - Datos estructurados en JSON
+{contenido_secciones}
+## Uso
+
+### Reporte Markdown
+Puedes abrir el archivo `.md` con cualquier editor de texto o visualizador de Markdown.
+
+### Datos JSON
+Los datos estructurados pueden ser procesados programáticamente o importados a otras herramientas.
+
+## Soporte
+
+Para consultas sobre los resultados, contactar al equipo DataLaw.
+
+---
+*CONTRACTIA AI - Sistema de Auditoría Automatizada de Contratos APP*
+"""
+
+
+def escribir_zip_resultados(
+    destino: BinaryIO,
+    resultados: Dict,
+    timestamp: str,
+    reporte_md: Optional[str] = None,
+    por_seccion: bool = False
+):
+    """
+    Escribe el ZIP de resultados en un archivo binario abierto
+    
+    El reporte y el JSON se codifican por fragmentos directamente dentro del
+    ZIP, sin serializarlos antes a una cadena.
+    
+    Args:
+        destino: Archivo o buffer binario (BytesIO, SpooledTemporaryFile, ...)
+        resultados: Diccionario con resultados de auditoría
+        timestamp: Timestamp del análisis
+        reporte_md: Reporte ya generado (si falta, se genera por fragmentos)
+        por_seccion: Incluir un JSON de hallazgos por cada sección
+    """
+    with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        _escribir_texto_zip(
+            zipf, "reporte_auditoria.md",
+            [reporte_md] if reporte_md is not None else iterar_reporte_markdown(resultados)
+        )
+        _escribir_texto_zip(zipf, "resultados_detallados.json", iterar_json(resultados))
+        
+        if por_seccion:
+            for seccion_id, hallazgos_sec in resultados.get('hallazgos_por_seccion', {}).items():
+                _escribir_texto_zip(
+                    zipf, f"secciones/{_nombre_archivo_seccion(seccion_id)}.json",
+                    iterar_json({'seccion': seccion_id, 'hallazgos': hallazgos_sec})
+                )
+        
+        zipf.writestr("README.txt", _readme_zip(timestamp, por_seccion))
+
+
+def generar_zip_resultados(
+    resultados: Dict,
+    timestamp: str,
+    reporte_md: Optional[str] = None,
+    por_seccion: bool = False
+) -> bytes:
+    """
+    Genera el ZIP de resultados en memoria
     
-    return reporte
+    El ZIP se construye en un SpooledTemporaryFile, que pasa a disco solo si
+    supera ZIP_MAX_MEMORIA.
+    
+    Args:
+        resultados: Diccionario con resultados de auditoría
+        timestamp: Timestamp del análisis
+        reporte_md: Reporte ya generado (si falta, se genera por fragmentos)
+        por_seccion: Incluir un JSON de hallazgos por cada sección
+        
+    Returns:
+        Contenido del ZIP
+    """
+    with tempfile.SpooledTemporaryFile(max_size=ZIP_MAX_MEMORIA) as buffer:
+        escribir_zip_resultados(buffer, resultados, timestamp, reporte_md, por_seccion)
+        buffer.seek(0)
+        return buffer.read()
 
 
 def crear_zip_resultados(
     reporte_md: str,
     resultados_json: str,
     timestamp: str,
-    output_path: str = "/tmp"
+    output_path: Optional[str] = None
 ) -> str:
     """
     Crea un archivo ZIP con todos los resultados
@@ -200,14 +382,14 @@ def crear_zip_resultados(
         reporte_md: Contenido del reporte en Markdown
         resultados_json: Resultados en formato JSON
         timestamp: Timestamp del análisis
-        output_path: Directorio donde guardar el ZIP
+        output_path: Directorio donde guardar el ZIP (por defecto, el temporal del sistema)
         
     Returns:
         Ruta al archivo ZIP creado
     """
     try:
         zip_filename = f"resultados_auditoria_{timestamp}.zip"
-        zip_path = os.path.join(output_path, zip_filename)
+        zip_path = os.path.join(output_path or tempfile.gettempdir(), zip_filename)
         
         with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
             # Agregar reporte Markdown
@@ -217,38 +399,57 @@ def crear_zip_resultados(
             zipf.writestr("resultados_detallados.json", resultados_json)
             
             # Agregar README
-            readme = f"""# Resultados de Auditoría CONTRACTIA AI
-
-Fecha: {timestamp}
-
-## Contenido del archivo
-
-1. **reporte_auditoria.md** - Reporte completo en formato Markdown
-2. **resultados_detallados.json** - Datos estructurados en JSON
+            zipf.writestr("README.txt", _readme_zip(timestamp))
+        
+        print(f"✅ ZIP creado: {zip_path}")
+        return zip_path
+        
+    except Exception as e:
+        print(f"❌ Error creando ZIP: {e}")
+        return None
 
-## Uso
 
-### Reporte Markdown
-Puedes abrir el archivo `.md` con cualquier editor de texto o visualizador de Markdown.
+def _ruta_revision(nombre_contrato: str, directorio: str) -> Path:
+    """Ruta del archivo de revisión de un contrato"""
+    nombre = "".join(c if c.isalnum() or c in "-_." else "_" for c in nombre_contrato)
+    return Path(directorio) / "revisiones" / f"{nombre}.json"
 
-### Datos JSON
-Los datos estructurados pueden ser procesados programáticamente o importados a otras herramientas.
 
-## Soporte
+def guardar_revision(revision: Dict, nombre_contrato: str, directorio: str):
+    """
+    Guarda huellas y hallazgos LLM de una auditoría para reauditar la próxima versión
+    
+    Args:
+        revision: Bloque resultados['revision'] de la auditoría
+        nombre_contrato: Nombre del archivo del contrato
+        directorio: Directorio de caches
+    """
+    try:
+        ruta = _ruta_revision(nombre_contrato, directorio)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_text(json.dumps(revision, ensure_ascii=False), encoding='utf-8')
+    except Exception as e:
+        print(f"⚠️ Error guardando revisión: {e}")
 
-Para consultas sobre los resultados, contactar al equipo DataLaw.
 
----
-*CONTRACTIA AI - Sistema de Auditoría Automatizada de Contratos APP*
-"""
-            zipf.writestr("README.txt", readme)
-        
-        print(f"✅ ZIP creado: {zip_path}")
-        return zip_path
+def cargar_revision(nombre_contrato: str, directorio: str) -> Optional[Dict]:
+    """
+    Carga la revisión guardada de la versión anterior de un contrato
+    
+    Args:
+        nombre_contrato: Nombre del archivo del contrato
+        directorio: Directorio de caches
         
+    Returns:
+        Bloque de revisión o None si no existe
+    """
+    try:
+        ruta = _ruta_revision(nombre_contrato, directorio)
+        if ruta.exists():
+            return json.loads(ruta.read_text(encoding='utf-8'))
     except Exception as e:
-        print(f"❌ Error creando ZIP: {e}")
-        return None
+        print(f"⚠️ Error cargando revisión: {e}")
+    return None
 
 
 def validar_pdf(file_path: str) -> bool: